@@ -2,79 +2,547 @@ from __future__ import print_function
 from __future__ import division
 
 import subprocess
+import os
 import os.path
+import re
 import time
+import select
+import uuid
 import argparse
+from datetime import datetime
+from StringIO import StringIO
+
+from resource_stats_capture import CaptureWriter
+from resource_stats_reduction import ProcStatData
+from resource_stats_reduction import ProcMeminfoData
+from resource_stats_reduction import SchedstatData
+from resource_stats_reduction import UptimeData
+from resource_stats_reduction import UptimeClock
+from resource_stats_reduction import toTimestamp
+from resource_stats_reduction import COMPRESSION_SUFFIXES
+from resource_stats_reduction import openCompressedFile
+
+
+# Python 2 has no time.monotonic; the elapsed real time of os.times() does not follow wall clock
+# changes either, at the resolution of the kernel clock tick (10 ms on most systems).
+MONOTONIC_CLOCK = getattr(time, 'monotonic', lambda: os.times()[4])
 
 
 class AndroidDeviceFactory(object):
 
-    def createDevice(self):
-        os_version = self.__identifyOSVersion()
+    def __init__(self, adb_path='adb'):
+        self.adb_path = adb_path
+
+    def listSerials(self):
+        """Serials of the devices 'adb devices' lists as ready, skipping offline and unauthorized ones."""
+        serials = []
+        for line in subprocess.check_output([self.adb_path, 'devices']).splitlines()[1:]:
+            fields = line.split()
+            if len(fields) == 2 and fields[1] == 'device':
+                serials.append(fields[0])
+        return serials
+
+    def createDevice(self, serial=None):
+        os_version = self.__identifyOSVersion(serial)
         if os_version.startswith('7'):
-            return Android7Deivce()
+            return Android7Deivce(self.adb_path, serial)
         elif os_version.startswith('8'):
-            return Andoroid8Device()
+            return Andoroid8Device(self.adb_path, serial)
         elif os_version.startswith('6'):
-            return Android6Deivce()
+            return Android6Deivce(self.adb_path, serial)
+
+    def createDevices(self):
+        return [self.createDevice(serial) for serial in self.listSerials()]
 
-    def __identifyOSVersion(self):
-        os_version = subprocess.check_output(['adb', 'shell', 'getprop', 'ro.build.version.release'])
+    def __identifyOSVersion(self, serial):
+        adb_args = [self.adb_path] if serial is None else [self.adb_path, '-s', serial]
+        os_version = subprocess.check_output(adb_args + ['shell', 'getprop', 'ro.build.version.release'])
         return os_version
 
 
+class AdbShellSession(object):
+    """A long-lived 'adb shell' that commands are written to through its stdin.
+
+       A batch of commands runs as one compound command whose outputs are framed by echoed
+       marker lines, so one round trip returns every output and the end marker tells when the
+       batch is done. send() and receive() let an event loop drive several sessions at once.
+    """
+
+    READ_SIZE = 65536
+
+
+    def __init__(self, adb_args):
+        self.marker = '@@resource_stats_' + uuid.uuid4().hex
+        self.process = subprocess.Popen(adb_args + ['shell'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._buffer = ''
+        self._count = 0
+
+    def fileno(self):
+        return self.process.stdout.fileno()
+
+    def send(self, cmds):
+        """Starts running cmds without waiting for their output."""
+        self._buffer = ''
+        self._count = len(cmds)
+        self.process.stdin.write(frameCommands(cmds, self.marker) + '\n')
+        self.process.stdin.flush()
+
+    def receive(self):
+        """Reads the output available so far, blocking if there is none.
+
+           Returns the outputs of the batch once it is complete, or None while it is not.
+        """
+        data = os.read(self.fileno(), self.READ_SIZE)
+        if not data:
+            raise Exception('adb shell session ended: exit code {0}'.format(self.process.poll()))
+        end = self.marker + ' end'
+        position = max(0, len(self._buffer) - len(end))
+        self._buffer += data
+        found = self._buffer.find(end, position)
+        if found < 0 or self._buffer.find('\n', found) < 0:
+            return None
+        return splitFramedOutput(self._buffer, self.marker, self._count)
+
+    def runCommands(self, cmds):
+        self.send(cmds)
+        outputs = None
+        while outputs is None:
+            outputs = self.receive()
+        return outputs
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait()
+
+
+def frameCommands(cmds, marker):
+    """Compound shell command running cmds in order, each output preceded by a marker line.
+
+       The marker is quoted apart in the command so that a shell echoing its input, as one on a
+       PTY does, never prints it whole: only the echo commands do.
+    """
+    quoted = '{0}""{1}'.format(marker[:1], marker[1:])
+    parts = []
+    for i, cmd in enumerate(cmds):
+        parts.append('echo {0} {1}'.format(quoted, i))
+        parts.append(cmd)
+    parts.append('echo {0} end'.format(quoted))
+    return '; '.join(parts)
+
+
+def splitFramedOutput(output, marker, count):
+    """Splits the output of frameCommands back into the output of each command.
+
+       The \\r\\n line ends of a PTY become \\n, and a marker only counts when the rest of its line
+       is a command index or 'end'.
+    """
+    res = [''] * count
+    section = None
+    for line in output.replace('\r\n', '\n').splitlines(True):
+        position = line.find(marker)
+        name = line[position + len(marker):].strip() if position >= 0 else ''
+        if name != 'end' and not name.isdigit():
+            if section is not None: res[section] += line
+            continue
+        if section is not None and position > 0:
+            res[section] += line[:position]
+        if name == 'end': break
+        section = int(name)
+    return res
+
+
 class AndroidDeivce(object):
+
+    TOP_COMMAND = 'top -n 1'
+
+    def __init__(self, adb_path='adb', serial=None):
+        self.adb_path = adb_path
+        self.serial = serial
+        self.session = None
+
+    def getAdbArgs(self):
+        if self.serial is None:
+            return [self.adb_path]
+        return [self.adb_path, '-s', self.serial]
     
     def sendCommand(self, cmd):
-        return subprocess.check_output(['adb', 'shell', cmd])
+        return subprocess.check_output(self.getAdbArgs() + ['shell', cmd])
+
+    def sendCommands(self, cmds):
+        """Runs cmds in a single round trip: through the open session, or else through one
+           'adb shell' running them as a compound command. Returns their outputs in order.
+        """
+        if self.session is not None:
+            return self.session.runCommands(cmds)
+        marker = '@@resource_stats_' + uuid.uuid4().hex
+        return splitFramedOutput(self.sendCommand(frameCommands(cmds, marker)), marker, len(cmds))
+
+    def openSession(self):
+        if self.session is None:
+            self.session = AdbShellSession(self.getAdbArgs())
+
+    def closeSession(self):
+        if self.session is not None:
+            self.session.close()
+            self.session = None
     
     def getDate(self):
         return self.sendCommand('date -u')
 
+    def getTopOutput(self):
+        return self.sendCommand(self.TOP_COMMAND)
+
 
 class Android6Deivce(AndroidDeivce):
-    
-    def getTopOutput(self):
-        return self.sendCommand('top -n 1')
+
+    TOP_COMMAND = 'top -n 1'
 
 
 class Android7Deivce(AndroidDeivce):
-    
-    def getTopOutput(self):
-        return self.sendCommand('top -n 1')
+
+    TOP_COMMAND = 'top -n 1'
     
     
 class Andoroid8Device(AndroidDeivce):
-    
-    def getTopOutput(self):
-        return self.sendCommand('top -n 1 -b')
+
+    TOP_COMMAND = 'top -n 1 -b'
     
     
+class FixedRateScheduler(object):
+    """Ticks every interval seconds, tick k being due at first tick + k * interval.
+
+       Time spent collecting does not push later ticks back, so there is no drift. A tick that is
+       already due when wait() is called fires at once, and every tick whose slot passed entirely
+       meanwhile is skipped and counted as missed.
+    """
+
+
+    def __init__(self, interval, clock=MONOTONIC_CLOCK, sleep=time.sleep):
+        self.interval = interval
+        self.clock = clock
+        self.sleep = sleep
+        self.next_tick = None
+        self.missed_ticks = 0
+
+    def getDelay(self):
+        """Seconds until the next tick is due, zero or less when it already is."""
+        if self.next_tick is None:
+            return 0
+        return self.next_tick - self.clock()
+
+    def tick(self):
+        """Consumes the current tick and returns the number of ticks missed before it."""
+        now = self.clock()
+        missed = 0
+        if self.next_tick is None:
+            self.next_tick = now
+        elif now >= self.next_tick:
+            missed = int((now - self.next_tick) // self.interval)
+            self.next_tick += missed * self.interval
+        self.next_tick += self.interval
+        self.missed_ticks += missed
+        return missed
+
+    def wait(self):
+        """Blocks until the next tick and returns the number of ticks missed before it."""
+        delay = self.getDelay()
+        if delay > 0:
+            self.sleep(delay)
+        return self.tick()
+
+
+class BufferedSampleWriter(object):
+    """Appends samples to the data file through one buffered file object kept open.
+
+       The buffer is flushed every flush_samples samples and, if flush_interval is set, whenever
+       that many seconds passed since the last flush.
+    """
+
+    BUFFER_SIZE = 1 << 20
+    FILE_MODE = 'a'
+
+
+    def __init__(self, file_path, flush_samples=1, flush_interval=None, clock=MONOTONIC_CLOCK):
+        self.file = self.openFile(file_path)
+        self.flush_samples = flush_samples
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._pending = 0
+        self._last_flush = clock()
+
+    def openFile(self, file_path):
+        return open(file_path, self.FILE_MODE, self.BUFFER_SIZE)
+
+    def write(self, sample):
+        self.file.write(sample)
+        self._sampleWritten()
+
+    def _sampleWritten(self):
+        self._pending += 1
+        if self._pending >= self.flush_samples or \
+           (self.flush_interval is not None and self.clock() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        self._pending = 0
+        self._last_flush = self.clock()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class CompressedSampleWriter(BufferedSampleWriter):
+    """BufferedSampleWriter compressing the text log with gzip, bz2 or xz as it is written.
+
+       A gzip flush ends a deflate block, so every flushed sample can be read while collection goes
+       on; bz2 and xz blocks only become readable once they are full or the writer is closed.
+    """
+
+    FILE_MODE = 'wb'
+
+
+    def __init__(self, file_path, compression, flush_samples=1, flush_interval=None, clock=MONOTONIC_CLOCK):
+        self.compression = compression
+        BufferedSampleWriter.__init__(self, file_path, flush_samples, flush_interval, clock)
+
+    def openFile(self, file_path):
+        return openCompressedFile(file_path, self.compression, self.FILE_MODE)
+
+    def flush(self):
+        """Python 2's BZ2File cannot be flushed; its samples are written as its blocks fill up."""
+        if hasattr(self.file, 'flush'):
+            self.file.flush()
+        self._pending = 0
+        self._last_flush = self.clock()
+
+
+class CaptureSampleWriter(BufferedSampleWriter):
+    """BufferedSampleWriter storing the samples in the binary capture format of resource_stats_capture.
+
+       write() takes the outputs of StatsCollector.getSampleCommands; the top output is only
+       kept with keep_top. Timestamps are refined by an UptimeClock anchored at the first sample
+       written.
+    """
+
+    FILE_MODE = 'ab'
+
+
+    def __init__(self, file_path, compress=False, keep_top=False, flush_samples=1, flush_interval=None,
+                 clock=MONOTONIC_CLOCK):
+        BufferedSampleWriter.__init__(self, file_path, flush_samples, flush_interval, clock)
+        self.capture = CaptureWriter(self.file, compress)
+        self.keep_top = keep_top
+        self.uptime_clock = UptimeClock()
+        self._previous_date = None
+
+    def write(self, sample):
+        date, uptime, schedstat, meminfo, stat, top = sample
+        date = datetime.strptime(' '.join(date.split()), '%a %b %d %H:%M:%S %Z %Y')
+        uptime_data = UptimeData(date)
+        uptime_data.parseText(StringIO(uptime))
+        if self.uptime_clock.anchor is None and uptime_data.uptime is not None:
+            self.uptime_clock.anchor = (date, uptime_data.uptime)
+        self._previous_date = self.uptime_clock.getDate(date, uptime_data.uptime, self._previous_date)
+        timestamp = toTimestamp(self._previous_date)
+        schedstat_data = SchedstatData(None)
+        schedstat_data.parseText(StringIO(schedstat))
+        proc_meminfo_data = ProcMeminfoData(None)
+        proc_meminfo_data.parseText(StringIO(meminfo))
+        proc_stat_data = ProcStatData(None)
+        proc_stat_data.parseText(StringIO(stat))
+        self.capture.writeSample(timestamp, proc_stat_data.data, proc_meminfo_data.data,
+                                 top if self.keep_top else None, schedstat_data.data)
+        self._sampleWritten()
+
+    def flush(self):
+        self.capture.flush()
+        BufferedSampleWriter.flush(self)
+
+    def close(self):
+        self.flush()
+        self.capture.close()
+
+
 class StatsCollector(object):
+
+    ECHO_MODES = ('full', 'condensed', 'none')
     
-    def __init__(self, device, data_file_path):
+    def __init__(self, device, data_file_path, interval=3, echo='full', flush_samples=1, flush_interval=None,
+                 capture=False, compress=False, keep_top=False, compression=None):
         self.device = device
         if os.path.exists(data_file_path):
             raise Exception(data_file_path + ' already exists')
+        if echo not in self.ECHO_MODES:
+            raise Exception('unknown echo mode ' + echo)
+        if compression is not None and compression not in COMPRESSION_SUFFIXES:
+            raise Exception('unknown compression ' + compression)
+        if compression is not None and capture:
+            raise Exception('captures are compressed with compress, not compression')
         self.data_file_path = data_file_path
+        self.interval = interval
+        self.echo = echo
+        self.flush_samples = flush_samples
+        self.flush_interval = flush_interval
+        self.capture = capture
+        self.compress = compress
+        self.keep_top = keep_top
+        self.compression = compression
+        self.collected = 0
+        self.missed_ticks = 0
     
     def collectStat(self):
-        res = '-------- {0} --------\n'.format(self.device.getDate().rstrip())
+        return self.formatSample(self.device.sendCommands(self.getSampleCommands()))
+
+    def getSampleCommands(self):
+        return ['date -u', 'cat /proc/uptime', 'cat /proc/schedstat', 'cat /proc/meminfo', 'cat /proc/stat',
+                self.device.TOP_COMMAND]
+
+    def formatSample(self, outputs):
+        date, uptime, schedstat, meminfo, stat, top = outputs
+        res = '-------- {0} --------\n'.format(date.rstrip())
+        res += '---- /proc/uptime\n'
+        res += uptime
+        res += '---- /proc/schedstat\n'
+        res += schedstat
         res += '---- /proc/meminfo\n'
-        res += self.device.sendCommand('cat /proc/meminfo')
+        res += meminfo
         res += '---- /proc/stat\n'
-        res += self.device.sendCommand('cat /proc/stat')
+        res += stat
         res += '---- top\n'
-        res += self.device.getTopOutput()
+        res += top
         return res
     
-    def runCollection(self):
-        while True:
-            output = self.collectStat()
-            with open(self.data_file_path, 'a+') as f:
-                f.write(output)
+    def runCollection(self, count=None):
+        """Collects a sample every interval seconds, forever or count times."""
+        scheduler = FixedRateScheduler(self.interval)
+        writer = self.openWriter()
+        self.device.openSession()
+        try:
+            while count is None or self.collected < count:
+                missed = scheduler.wait()
+                self.storeSample(writer, self.device.sendCommands(self.getSampleCommands()), missed)
+        finally:
+            writer.close()
+            self.device.closeSession()
+            self.printTotals()
+
+    def openWriter(self):
+        if self.capture:
+            return CaptureSampleWriter(self.data_file_path, self.compress, self.keep_top, self.flush_samples,
+                                       self.flush_interval)
+        if self.compression:
+            return CompressedSampleWriter(self.data_file_path, self.compression, self.flush_samples,
+                                          self.flush_interval)
+        return BufferedSampleWriter(self.data_file_path, self.flush_samples, self.flush_interval)
+
+    def storeSample(self, writer, outputs, missed, prefix=''):
+        """Writes the sample made of the command outputs and echoes it."""
+        output = self.formatSample(outputs)
+        writer.write(outputs if self.capture else output)
+        self.collected += 1
+        self.missed_ticks += missed
+        if self.echo == 'full':
+            if missed: print ('{0}Missed {1} ticks'.format(prefix, missed))
             print (output)
-            time.sleep(3)
+        elif self.echo == 'condensed':
+            date = output[len('-------- '):output.index(' --------')]
+            res = '{0}{1}: {2} bytes'.format(prefix, date, len(output))
+            if missed: res += ', missed {0} ticks'.format(missed)
+            print (res)
+
+    def printTotals(self, prefix=''):
+        if self.echo != 'none':
+            print ('{0}Collected {1} samples, missed {2} ticks'.format(prefix, self.collected, self.missed_ticks))
+
+
+class MultiDeviceCollector(object):
+    """Collects from several devices in one process, each into its own data file.
+
+       Every device has its own persistent adb shell session and FixedRateScheduler. A select()
+       loop sends a device its batch when its tick is due and stores the sample when the whole
+       output arrived, so a slow device only misses its own ticks. A device whose session dies
+       is reported and dropped while the others go on.
+    """
+
+
+    def __init__(self, devices, output_dir, interval=3, echo='condensed', flush_samples=1, flush_interval=None,
+                 capture=False, compress=False, keep_top=False, compression=None):
+        self.collectors = []
+        for device in devices:
+            file_name = 'resource_stats_' + re.sub('[^A-Za-z0-9.-]', '_', device.serial)
+            if compression is not None:
+                file_name += COMPRESSION_SUFFIXES.get(compression, '')
+            self.collectors.append(StatsCollector(device, os.path.join(output_dir, file_name), interval, echo,
+                                                  flush_samples, flush_interval, capture, compress, keep_top,
+                                                  compression))
+        self.interval = interval
+
+    def runCollection(self, count=None):
+        """Collects every interval seconds from every device, forever or until each has count samples."""
+        states = {}
+        try:
+            for collector in self.collectors:
+                collector.device.openSession()
+                states[collector.device.session.fileno()] = _DeviceState(collector, FixedRateScheduler(self.interval))
+            while states:
+                timeout = None
+                for fd, state in states.items():
+                    if state.missed is None and count is not None and state.collector.collected >= count:
+                        state.close()
+                        del states[fd]
+                    elif state.missed is None:
+                        delay = state.scheduler.getDelay()
+                        if delay <= 0:
+                            state.missed = state.scheduler.tick()
+                            try:
+                                state.session.send(state.collector.getSampleCommands())
+                            except (IOError, OSError) as e:
+                                self._dropDevice(states, fd, e)
+                        elif timeout is None or delay < timeout:
+                            timeout = delay
+                busy = [fd for fd, state in states.items() if state.missed is not None]
+                if not busy and timeout is None: continue
+                readable, _, _ = select.select(busy, [], [], timeout)
+                for fd in readable:
+                    state = states[fd]
+                    try:
+                        outputs = state.session.receive()
+                    except Exception as e:
+                        self._dropDevice(states, fd, e)
+                        continue
+                    if outputs is not None:
+                        state.collector.storeSample(state.writer, outputs, state.missed, state.prefix)
+                        state.missed = None
+        finally:
+            for state in states.values():
+                state.close()
+            for collector in self.collectors:
+                collector.device.closeSession()
+
+    def _dropDevice(self, states, fd, error):
+        """Reports the error that ended the session of a device and stops collecting from it."""
+        state = states.pop(fd)
+        print ('{0}: {1}'.format(state.collector.device.serial, error))
+        state.close()
+
+
+class _DeviceState(object):
+    """Per-device bookkeeping of MultiDeviceCollector; missed is None unless a batch is in flight."""
+
+    def __init__(self, collector, scheduler):
+        self.collector = collector
+        self.scheduler = scheduler
+        self.session = collector.device.session
+        self.writer = collector.openWriter()
+        self.prefix = collector.device.serial + ': '
+        self.missed = None
+
+    def close(self):
+        self.writer.close()
+        self.collector.printTotals(self.prefix)
 
 
 if __name__ == '__main__':
@@ -83,11 +551,44 @@ if __name__ == '__main__':
                            resource usage data
                          """
     args_parser = argparse.ArgumentParser(description=script_description)
-    args_parser.add_argument('data_file_path', type=str, help='output data file path')
+    args_parser.add_argument('data_file_path', type=str,
+                             help='output data file path, or output directory with --all_devices')
+    args_parser.add_argument('--adb', type=str, default='adb', help='adb executable')
+    args_parser.add_argument('--serial', type=str, default=None, help='serial of the device to collect from')
+    args_parser.add_argument('--all_devices', action='store_true',
+                             help='collect from every connected device, each into its own file')
+    args_parser.add_argument('--interval', type=float, default=3, help='seconds between two samples')
+    args_parser.add_argument('--echo', choices=StatsCollector.ECHO_MODES, default='full',
+                             help='print every sample, one line per sample or nothing')
+    args_parser.add_argument('--flush_samples', type=int, default=1, help='flush the data file every N samples')
+    args_parser.add_argument('--flush_interval', type=float, default=None,
+                             help='also flush the data file when this many seconds passed since the last flush')
+    args_parser.add_argument('--capture', action='store_true',
+                             help='write the compact binary capture format instead of text')
+    args_parser.add_argument('--compress', action='store_true', help='zlib compress the --capture file')
+    args_parser.add_argument('--keep_top', action='store_true', help='keep the raw top output in the --capture file')
+    args_parser.add_argument('--compression', choices=sorted(COMPRESSION_SUFFIXES), default=None,
+                             help='compress the text log as it is written')
     args = args_parser.parse_args()    
     
-    deviceFactory = AndroidDeviceFactory() 
-    device = deviceFactory.createDevice()
-    collector = StatsCollector(device, args.data_file_path)
+    if args.all_devices and args.serial is not None:
+        args_parser.error('--serial cannot be used with --all_devices')
+    if (args.compress or args.keep_top) and not args.capture:
+        args_parser.error('--compress and --keep_top apply to --capture files')
+    if args.compression and args.capture:
+        args_parser.error('--compression applies to text logs, --capture files use --compress')
+    
+    deviceFactory = AndroidDeviceFactory(args.adb) 
+    if args.all_devices:
+        if not os.path.isdir(args.data_file_path):
+            os.makedirs(args.data_file_path)
+        collector = MultiDeviceCollector(deviceFactory.createDevices(), args.data_file_path, args.interval,
+                                         args.echo, args.flush_samples, args.flush_interval, args.capture,
+                                         args.compress, args.keep_top, args.compression)
+    else:
+        device = deviceFactory.createDevice(args.serial)
+        collector = StatsCollector(device, args.data_file_path, args.interval, args.echo,
+                                   args.flush_samples, args.flush_interval, args.capture, args.compress,
+                                   args.keep_top, args.compression)
     collector.runCollection()
     
\ No newline at end of file
@@ -0,0 +1,364 @@
+import os
+import stat
+import shutil
+import tempfile
+import time
+import unittest
+from resource_data_collection import AndroidDeviceFactory
+from resource_data_collection import Andoroid8Device
+from resource_data_collection import StatsCollector
+from resource_data_collection import FixedRateScheduler
+from resource_data_collection import MONOTONIC_CLOCK
+from resource_data_collection import BufferedSampleWriter
+from resource_data_collection import MultiDeviceCollector
+from resource_data_collection import frameCommands
+from resource_data_collection import splitFramedOutput
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import getLogCompression
+from resource_stats_capture import CaptureReader
+
+FAKE_ADB = """#!/bin/sh
+echo "$@" >> {log_path}
+if [ "$1" = "devices" ]; then printf 'List of devices attached\n{devices}\n'; exit 0; fi
+if [ "$1" = "-s" ]; then ANDROID_SERIAL=$2; export ANDROID_SERIAL; shift 2; fi
+shift
+if [ "$1" = "getprop" ]; then echo 8.1.0; exit 0; fi
+PATH={bin_dir}:$PATH
+export PATH
+if [ $# -eq 0 ] && [ "$ANDROID_SERIAL" = "pty" ]; then exec pty_sh; fi
+if [ $# -eq 0 ]; then exec sh; fi
+exec sh -c "$*"
+"""
+
+FAKE_TOP = """#!/bin/sh
+if [ "$ANDROID_SERIAL" = "slow" ]; then sleep 0.5; fi
+echo "  PID USER         PR  NI VIRT  RES  SHR S[%CPU] %MEM     TIME+ ARGS"
+echo " 1205 system       18  -2 2.9G 217M 148M S  6.4   3.8  26:07.82 system_server"
+"""
+
+FAKE_CAT = """#!/bin/sh
+if [ "$1" = "/proc/schedstat" ]; then
+    echo "version 15"
+    echo "timestamp 4300965556"
+    echo "cpu0 3308979 0 22026491 5538180 15685565 5041083 1886626644290 1262756719810 13775887"
+    echo "domain0 0f 1209 1058 78 107262 90 0 1 1057 15 12 0 2026 35 0 0 12 11912 5235 4825 5296996 1852 0 19"
+    exit 0
+fi
+exec /bin/cat "$@"
+"""
+
+FAKE_PTY_SH = """#!/bin/sh
+while IFS= read -r line; do
+    printf '%s\\r\\n' "$line"
+    sh -c "$line" | sed 's/$/\\r/'
+done
+"""
+
+FAKE_DATE = """#!/bin/sh
+exec /bin/date -u '+%a %b %-d %H:%M:%S GMT %Y'
+"""
+
+
+def writeScript(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR)
+
+
+class FakeAdb(object):
+    """adb stand-in running device commands in a local sh, logging every invocation.
+
+       date prints GMT and top a fixed table, as toybox does on the devices, and cat serves a fixed
+       /proc/schedstat since not every host kernel has one; top takes half a
+       second on the device whose serial is 'slow'. The shell of the device whose serial is 'pty'
+       echoes its input and ends lines with \\r\\n, as one on a PTY does. devices maps serials to
+       their adb state.
+    """
+
+    def __init__(self, directory, devices={}):
+        bin_dir = os.path.join(directory, 'bin')
+        os.mkdir(bin_dir)
+        self.log_path = os.path.join(directory, 'adb.log')
+        self.adb_path = os.path.join(directory, 'adb')
+        devices_text = ''.join('{0}\\t{1}\\n'.format(serial, state) for serial, state in sorted(devices.items()))
+        writeScript(self.adb_path, FAKE_ADB.format(log_path=self.log_path, bin_dir=bin_dir, devices=devices_text))
+        writeScript(os.path.join(bin_dir, 'top'), FAKE_TOP)
+        writeScript(os.path.join(bin_dir, 'date'), FAKE_DATE)
+        writeScript(os.path.join(bin_dir, 'cat'), FAKE_CAT)
+        writeScript(os.path.join(bin_dir, 'pty_sh'), FAKE_PTY_SH)
+
+    def getInvocations(self):
+        if not os.path.exists(self.log_path): return []
+        with open(self.log_path, 'r') as f:
+            return f.read().splitlines()
+
+
+class FakeClock(object):
+    """Clock whose sleep only advances time; work() simulates time spent collecting."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def work(self, seconds):
+        self.now += seconds
+
+
+class TestFixedRateScheduler(unittest.TestCase):
+
+    def test_ticks_do_not_drift(self):
+        clock = FakeClock()
+        scheduler = FixedRateScheduler(3, clock, clock.sleep)
+        ticks = []
+        for _ in xrange(4):
+            self.assertEqual(0, scheduler.wait())
+            ticks.append(clock())
+            clock.work(0.7)
+        self.assertEqual([100.0, 103.0, 106.0, 109.0], ticks)
+        self.assertEqual(0, scheduler.missed_ticks)
+
+    def test_missed_ticks_are_skipped_and_counted(self):
+        clock = FakeClock()
+        scheduler = FixedRateScheduler(3, clock, clock.sleep)
+        scheduler.wait()
+        clock.work(7.5)
+        self.assertEqual(1, scheduler.wait())
+        self.assertEqual(107.5, clock())
+        clock.work(0.5)
+        self.assertEqual(0, scheduler.wait())
+        self.assertEqual(109.0, clock())
+        self.assertEqual(1, scheduler.missed_ticks)
+
+    def test_default_clock_is_not_the_wall_clock(self):
+        # time.monotonic and os.times() count from an arbitrary point such as boot, not from the epoch.
+        self.assertGreater(abs(time.time() - MONOTONIC_CLOCK()), 86400 * 365)
+
+
+class TestBufferedSampleWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def getFileContent(self):
+        with open(self.file_path, 'r') as f:
+            return f.read()
+
+    def test_flush_every_n_samples(self):
+        writer = BufferedSampleWriter(self.file_path, flush_samples=2)
+        writer.write('a')
+        self.assertEqual('', self.getFileContent())
+        writer.write('b')
+        self.assertEqual('ab', self.getFileContent())
+        writer.write('c')
+        writer.close()
+        self.assertEqual('abc', self.getFileContent())
+
+    def test_flush_interval(self):
+        clock = FakeClock()
+        writer = BufferedSampleWriter(self.file_path, flush_samples=100, flush_interval=10, clock=clock)
+        writer.write('a')
+        self.assertEqual('', self.getFileContent())
+        clock.work(10)
+        writer.write('b')
+        self.assertEqual('ab', self.getFileContent())
+        writer.close()
+
+
+class TestCommandFraming(unittest.TestCase):
+
+    def test_split_framed_output(self):
+        marker = '@@marker'
+        output = '@@marker 0\nline 1\nline 2\n@@marker 1\nno newline@@marker 2\n@@marker end\n'
+        self.assertEqual(['line 1\nline 2\n', 'no newline', ''], splitFramedOutput(output, marker, 3))
+
+    def test_split_pty_output(self):
+        marker = '@@marker'
+        output = ('$ echo @""@marker 0; echo a; echo @""@marker end\r\n'
+                  '@@marker 0\r\na\r\nnot @@marker 1 of ours\r\n@@marker end\r\n$ ')
+        self.assertEqual(['a\nnot @@marker 1 of ours\n'], splitFramedOutput(output, marker, 1))
+
+    def test_frame_commands(self):
+        self.assertEqual('echo @""@m 0; date -u; echo @""@m 1; cat /proc/stat; echo @""@m end',
+                         frameCommands(['date -u', 'cat /proc/stat'], '@@m'))
+
+
+class TestAndroidDevice(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.adb = FakeAdb(self.temp_dir)
+        self.device = Andoroid8Device(self.adb.adb_path)
+
+    def tearDown(self):
+        self.device.closeSession()
+        shutil.rmtree(self.temp_dir)
+
+    def test_batched_commands_use_one_adb_call(self):
+        outputs = self.device.sendCommands(['echo a', 'printf b', 'echo c; echo d'])
+        self.assertEqual(['a\n', 'b', 'c\nd\n'], outputs)
+        self.assertEqual(1, len(self.adb.getInvocations()))
+
+    def test_session_is_reused_across_batches(self):
+        self.device.openSession()
+        for i in xrange(5):
+            self.assertEqual([str(i) + '\n', 'x\n'], self.device.sendCommands(['echo ' + str(i), 'echo x']))
+        self.assertEqual(['shell'], self.adb.getInvocations())
+
+    def test_session_on_pty(self):
+        device = Andoroid8Device(self.adb.adb_path, 'pty')
+        device.openSession()
+        try:
+            for i in xrange(3):
+                self.assertEqual([str(i) + '\n', 'x\ny\n'], device.sendCommands(['echo ' + str(i), 'echo x; echo y']))
+        finally:
+            device.closeSession()
+
+    def test_serial_is_passed_to_adb(self):
+        device = Andoroid8Device(self.adb.adb_path, 'emulator-5554')
+        self.assertEqual(['x\n'], device.sendCommands(['echo x']))
+        invocations = self.adb.getInvocations()
+        self.assertEqual(1, len(invocations))
+        self.assertTrue(invocations[0].startswith('-s emulator-5554 shell '))
+
+    def test_session_exit_is_reported(self):
+        self.device.openSession()
+        self.assertRaises(Exception, self.device.sendCommands, ['exit 3'])
+
+
+class TestStatsCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.adb = FakeAdb(self.temp_dir)
+        self.data_file_path = os.path.join(self.temp_dir, 'resource_stats')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_collected_samples_parse(self):
+        device = AndroidDeviceFactory(self.adb.adb_path).createDevice()
+        self.assertIsInstance(device, Andoroid8Device)
+        collector = StatsCollector(device, self.data_file_path)
+        device.openSession()
+        try:
+            with open(self.data_file_path, 'w') as f:
+                for _ in xrange(2):
+                    f.write(collector.collectStat())
+        finally:
+            device.closeSession()
+        self.assertEqual(2, len(self.adb.getInvocations()))
+        cpu_stats_list, mem_stats_list = LogParser(self.data_file_path).parseLogFile()
+        self.assertEqual(2, len(cpu_stats_list))
+        self.assertEqual(2, len(mem_stats_list))
+        self.assertGreater(mem_stats_list.getColumn('MemTotal')[0], 0)
+        with open(self.data_file_path, 'r') as f:
+            self.assertIn('system_server', f.read())
+        self.assertIsNotNone(LogParser(self.data_file_path).findClockAnchor())
+        schedstat = LogParser(self.data_file_path).parseSchedstatTable()
+        self.assertEqual(2, len(schedstat))
+        self.assertEqual([1262756719810, 1262756719810], schedstat.counters['wait_time'][:, 1].tolist())
+
+    def test_run_collection(self):
+        device = AndroidDeviceFactory(self.adb.adb_path).createDevice()
+        collector = StatsCollector(device, self.data_file_path, interval=0.01, echo='none', flush_samples=10)
+        collector.runCollection(count=3)
+        self.assertEqual(2, len(self.adb.getInvocations()))
+        cpu_stats_list, mem_stats_list = LogParser(self.data_file_path).parseLogFile()
+        self.assertEqual(3, len(cpu_stats_list))
+
+    def test_run_collection_compressed(self):
+        device = AndroidDeviceFactory(self.adb.adb_path).createDevice()
+        for compression in ('gzip', 'bz2'):
+            file_path = self.data_file_path + '.' + compression
+            collector = StatsCollector(device, file_path, interval=0.01, echo='none', compression=compression)
+            collector.runCollection(count=3)
+            self.assertEqual(compression, getLogCompression(file_path))
+            cpu_stats_list, mem_stats_list = LogParser(file_path).parseLogFile()
+            self.assertEqual(3, len(cpu_stats_list))
+            self.assertEqual(3, len(LogParser(file_path).parseSchedstatTable()))
+        self.assertRaises(Exception, StatsCollector, device, self.data_file_path, compression='zip')
+
+    def test_run_collection_to_capture(self):
+        device = AndroidDeviceFactory(self.adb.adb_path).createDevice()
+        collector = StatsCollector(device, self.data_file_path, interval=0.01, echo='none', capture=True,
+                                   compress=True, keep_top=True)
+        collector.runCollection(count=2)
+        cpu_stats_list, mem_stats_list = LogParser(self.data_file_path).parseLogFile()
+        self.assertEqual(2, len(cpu_stats_list))
+        self.assertGreater(mem_stats_list.getColumn('MemTotal')[0], 0)
+        tops = CaptureReader(self.data_file_path).read().tops
+        self.assertEqual(2, len(tops))
+        self.assertIn('system_server', tops[0][1])
+        self.assertIn((1205, 'system_server'), LogParser(self.data_file_path).parseTopTable().processes)
+        self.assertEqual(2, len(LogParser(self.data_file_path).parseSchedstatTable()))
+
+    def test_unknown_echo_mode(self):
+        device = Andoroid8Device(self.adb.adb_path)
+        self.assertRaises(Exception, StatsCollector, device, self.data_file_path, echo='loud')
+
+
+class TestMultiDeviceCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.adb = FakeAdb(self.temp_dir, {'fast': 'device', 'slow': 'device', 'locked': 'unauthorized'})
+        self.output_dir = os.path.join(self.temp_dir, 'out')
+        os.mkdir(self.output_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_list_serials(self):
+        self.assertEqual(['fast', 'slow'], AndroidDeviceFactory(self.adb.adb_path).listSerials())
+
+    def test_slow_device_does_not_delay_others(self):
+        devices = AndroidDeviceFactory(self.adb.adb_path).createDevices()
+        collector = MultiDeviceCollector(devices, self.output_dir, interval=0.2, echo='none')
+        collector.runCollection(count=2)
+        fast, slow = collector.collectors
+        self.assertEqual(0, fast.missed_ticks)
+        self.assertGreater(slow.missed_ticks, 0)
+        for serial in ('fast', 'slow'):
+            file_path = os.path.join(self.output_dir, 'resource_stats_' + serial)
+            cpu_stats_list, mem_stats_list = LogParser(file_path).parseLogFile()
+            self.assertEqual(2, len(cpu_stats_list))
+        self.assertIn('-s slow shell', self.adb.getInvocations())
+
+    def test_dead_session_drops_only_its_device(self):
+        devices = AndroidDeviceFactory(self.adb.adb_path).createDevices()
+        dying = devices[1]
+        open_session = dying.openSession
+
+        def openDyingSession():
+            open_session()
+            session = dying.session
+            send = session.send
+
+            def sendUntilKilled(cmds):
+                if dying.session is session and os.path.getsize(
+                        os.path.join(self.output_dir, 'resource_stats_slow')) > 0:
+                    session.process.kill()
+                    session.process.wait()
+                send(cmds)
+            session.send = sendUntilKilled
+        dying.openSession = openDyingSession
+        collector = MultiDeviceCollector(devices, self.output_dir, interval=0.05, echo='none')
+        collector.runCollection(count=4)
+        fast, slow = collector.collectors
+        self.assertEqual(4, fast.collected)
+        self.assertEqual(1, slow.collected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+#! /usr/bin/env python
+
+"""
+This script is for reducing many resource_stats logs or captures at once, e.g. a nightly run
+over the captures of a whole fleet of devices and builds.
+
+Every file of a directory, or every file matching a glob, sidecar .idx and .cache.npz files aside,
+is reduced by StreamingStatsReducer in a process pool. The report has a row per file with
+the full summary metric set, percentiles included, and fleet aggregates: the min, avg and max of
+every metric over the files and the fleet-wide percentiles of the merged quantile sketches. A file
+that cannot be reduced gets a row with its error and is left out of the aggregates; the exit
+status is then 1. --profile logs the phase timings of every file to standard error and adds them
+to the JSON rows.
+
+Example:
+$ ./resource_stats_batch.py 'captures/*.cap' --jobs 8 --format csv --output fleet.csv
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import sys
+import csv
+import glob
+import json
+import argparse
+import multiprocessing
+
+from resource_stats_reduction import DISTRIBUTION_SERIES
+from resource_stats_reduction import DISTRIBUTION_SUMMARY_FORMATS
+from resource_stats_reduction import SUMMARY_FORMATS
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import PhaseProfiler
+from resource_stats_reduction import StreamingStatsReducer
+from resource_stats_reduction import computeDistributionMetrics
+
+
+SIDECAR_SUFFIXES = ('.idx', '.cache.npz')
+
+METRIC_KEYS = [key for key, _ in SUMMARY_FORMATS + DISTRIBUTION_SUMMARY_FORMATS]
+
+FLEET_AGGREGATES = ('min', 'avg', 'max')
+
+
+def findInputFiles(pattern):
+    """The files of directory pattern, or those matching glob pattern, sorted; hidden files and
+       the sidecars written next to the logs are left out either way."""
+    if os.path.isdir(pattern):
+        file_paths = [os.path.join(pattern, name) for name in os.listdir(pattern)]
+    else:
+        file_paths = glob.glob(pattern)
+    return sorted(file_path for file_path in file_paths if os.path.isfile(file_path)
+                  and not os.path.basename(file_path).startswith('.') and not file_path.endswith(SIDECAR_SUFFIXES))
+
+
+def logPhase(file_path, timing):
+    sys.stderr.write('{0}: {1}\n'.format(file_path, timing.format().replace('\n', '\n' + ' ' * (len(file_path) + 2))))
+
+
+def reduceFile(file_path, start=0, end=-1, profile=False):
+    """Returns the row of file_path and the quantile sketches of its series, None if it failed.
+
+       With profile, the phases are logged with logPhase and their seconds added to the row as 'profile'.
+    """
+    row = {'file': file_path, 'error': None}
+    profiler = PhaseProfiler()
+    if profile:
+        profiler.addHook(lambda timing: logPhase(file_path, timing))
+    try:
+        reducer = StreamingStatsReducer()
+        with profiler.phase('parse and reduce', remainder='read') as timing:
+            for sample in LogParser(file_path, profiler if profile else None).iterSamples(start, end):
+                reducer.addSample(sample)
+            reducer.flush()
+            timing.samples = reducer.getCpuStatsCount() + reducer.getMemStatsCount()
+        if reducer.getCpuStatsCount() < 1 or reducer.getMemStatsCount() < 1:
+            raise Exception('Not enough data for calculation')
+        with profiler.phase('summarize'):
+            row.update(reducer.getMetrics(distribution=True))
+        if profile:
+            row['profile'] = dict((timing.name, timing.seconds) for timing in profiler.timings)
+        return row, reducer.sketches
+    except Exception as e:
+        row['error'] = '{0}: {1}'.format(type(e).__name__, e)
+        return row, None
+
+
+def _reduceFile(args):
+    return reduceFile(*args)
+
+
+class BatchReduction(object):
+    """Rows of reduceFile for every file, in the order given, and the fleet aggregates."""
+
+
+    def __init__(self, file_paths, start=0, end=-1, jobs=1, profile=False):
+        self.file_paths = file_paths
+        self.start = start
+        self.end = end
+        self.jobs = jobs
+        self.profile = profile
+        self.rows = []
+        self.fleet = {}
+
+    def run(self):
+        tasks = [(file_path, self.start, self.end, self.profile) for file_path in self.file_paths]
+        if self.jobs > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(min(self.jobs, len(tasks)))
+            try:
+                results = pool.map(_reduceFile, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = [_reduceFile(task) for task in tasks]
+        self.rows = [row for row, _ in results]
+        self.fleet = self._aggregate([row for row, _ in results if row['error'] is None],
+                                     [sketches for _, sketches in results if sketches is not None])
+        return self
+
+    def getFailedCount(self):
+        return sum(1 for row in self.rows if row['error'] is not None)
+
+    def toJSON(self):
+        return json.dumps({'files': self.rows, 'fleet': self.fleet}, indent=2, sort_keys=True)
+
+    def writeCSV(self, f):
+        """A row per file, then a row per fleet aggregate with 'fleet <aggregate>' as its file."""
+        writer = csv.writer(f)
+        writer.writerow(['file', 'error'] + METRIC_KEYS)
+        for row in self.rows:
+            writer.writerow([row['file'], row['error'] or ''] + [row.get(key, '') for key in METRIC_KEYS])
+        for aggregate in FLEET_AGGREGATES + ('percentiles',):
+            values = self.fleet.get(aggregate, {})
+            writer.writerow(['fleet ' + aggregate, ''] + [values.get(key, '') for key in METRIC_KEYS])
+
+    def _aggregate(self, rows, sketches_list):
+        fleet = {'files': len(self.rows), 'failed': len(self.rows) - len(rows)}
+        if not rows: return fleet
+        for aggregate in FLEET_AGGREGATES:
+            fleet[aggregate] = {}
+        for key in METRIC_KEYS:
+            values = [row[key] for row in rows]
+            fleet['min'][key] = min(values)
+            fleet['avg'][key] = sum(values) / len(values)
+            fleet['max'][key] = max(values)
+        merged = sketches_list[0]
+        for sketches in sketches_list[1:]:
+            for name, _, _, _ in DISTRIBUTION_SERIES:
+                merged[name].merge(sketches[name])
+        fleet['percentiles'] = computeDistributionMetrics(merged)
+        return fleet
+
+
+if __name__ == '__main__':
+    script_description = """
+                           This script is for reducing every resource_stats log or capture
+                           of a directory or glob in parallel into one report
+                         """
+    args_parser = argparse.ArgumentParser(description=script_description)
+    args_parser.add_argument('inputs', type=str, nargs='+', help='input directories or globs')
+    args_parser.add_argument('--start', type=int, default=0, help='start timestamp, start from 0s')
+    args_parser.add_argument('--end', type=int, default=-1, help='end timestamp')
+    args_parser.add_argument('--jobs', type=int, default=multiprocessing.cpu_count(),
+                             help='number of processes reducing files in parallel')
+    args_parser.add_argument('--format', choices=('json', 'csv'), default='json', help='report format')
+    args_parser.add_argument('--output', type=str, help='report file, standard output by default')
+    args_parser.add_argument('--profile', action='store_true',
+                             help='log the phase timings of every file to standard error and add them to json rows')
+    args = args_parser.parse_args()
+    file_paths = sorted(set(file_path for pattern in args.inputs for file_path in findInputFiles(pattern)))
+    if not file_paths:
+        args_parser.error('no input file found')
+    batch = BatchReduction(file_paths, args.start, args.end, args.jobs, args.profile).run()
+    f = open(args.output, 'wb' if args.format == 'csv' else 'w') if args.output else sys.stdout
+    try:
+        if args.format == 'csv':
+            batch.writeCSV(f)
+        else:
+            f.write(batch.toJSON() + '\n')
+    finally:
+        if args.output: f.close()
+    sys.exit(1 if batch.getFailedCount() else 0)
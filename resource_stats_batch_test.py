@@ -0,0 +1,73 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+from resource_stats_batch import BatchReduction
+from resource_stats_batch import findInputFiles
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import ResourceUsageStats
+from resource_stats_benchmark import scaleSample
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'SampleData', 'resource_stats_sample')
+
+
+class TestBatchReduction(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_paths = []
+        for i, copies in enumerate((1, 2, 3)):
+            log_path = os.path.join(self.temp_dir, 'resource_stats_{0}'.format(i))
+            scaleSample(log_path, copies)
+            self.log_paths.append(log_path)
+        LogParser(self.log_paths[2]).writeCapture(os.path.join(self.temp_dir, 'resource_stats_3.cap'))
+        self.broken_path = os.path.join(self.temp_dir, 'resource_stats_broken')
+        with open(self.broken_path, 'w') as f:
+            f.write('not a log\n')
+        open(self.log_paths[0] + '.idx', 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_find_input_files(self):
+        self.assertEqual(5, len(findInputFiles(self.temp_dir)))
+        self.assertEqual(findInputFiles(self.temp_dir), findInputFiles(os.path.join(self.temp_dir, '*')))
+        self.assertEqual([os.path.join(self.temp_dir, 'resource_stats_3.cap')],
+                         findInputFiles(os.path.join(self.temp_dir, '*.cap')))
+
+    def test_failed_file_does_not_stop_batch(self):
+        for jobs in (1, 3):
+            batch = BatchReduction(findInputFiles(self.temp_dir), jobs=jobs).run()
+            self.assertEqual(1, batch.getFailedCount())
+            rows = dict((os.path.basename(row['file']), row) for row in batch.rows)
+            self.assertIn('Not enough data', rows['resource_stats_broken']['error'])
+            metrics = ResourceUsageStats(*LogParser(SAMPLE_FILE).parseLogFile()).getMetrics()
+            self.assertAlmostEqual(metrics['mem_used_max'], rows['resource_stats_0']['mem_used_max'])
+            self.assertEqual(rows['resource_stats_2']['mem_used_p99'], rows['resource_stats_3.cap']['mem_used_p99'])
+            self.assertEqual({'files': 5, 'failed': 1}, dict((key, batch.fleet[key]) for key in ('files', 'failed')))
+            self.assertAlmostEqual(metrics['mem_used_max'], batch.fleet['max']['mem_used_max'])
+            self.assertIn('per_core_user_sys_p99', batch.fleet['percentiles'])
+
+    def test_reports(self):
+        batch = BatchReduction(self.log_paths + [self.broken_path]).run()
+        report = json.loads(batch.toJSON())
+        self.assertEqual(4, len(report['files']))
+        self.assertEqual(1, report['fleet']['failed'])
+        self.assertIsNone(report['files'][0]['error'])
+        f = StringIO()
+        batch.writeCSV(f)
+        lines = f.getvalue().splitlines()
+        self.assertEqual(9, len(lines))
+        self.assertTrue(lines[0].startswith('file,error,overall_user_sys_min,'))
+        self.assertTrue(lines[-1].startswith('fleet percentiles,,'))
+
+    def test_profile(self):
+        batch = BatchReduction(self.log_paths[:1], profile=True).run()
+        self.assertEqual(['parse and reduce', 'summarize'], sorted(batch.rows[0]['profile']))
+
+
+if __name__ == '__main__':
+    unittest.main()
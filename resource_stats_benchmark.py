@@ -0,0 +1,298 @@
+#! /usr/bin/env python
+
+"""
+This script is for measuring how fast resource_stats_reduction.py parses and reduces logs.
+
+By default it builds a log by repeating SampleData/resource_stats_sample with renumbered sample
+headers, parses it with LogParser and reports the throughput against PARSE_THROUGHPUT_TARGET_MBPS,
+then how much smaller and faster to parse the same samples are as a binary capture, and how much
+smaller and how fast to parse they are as gzip, bz2 and xz compressed logs.
+
+With --samples it instead generates synthetic logs of every given size with generateLog, in the
+format of SampleData with the core count, process count and share of dropped or malformed
+sections asked for, and times parse, reduce, summary and csv export of each in a process of its
+own, reporting throughput and peak RSS. --json saves these results and --compare prints the
+speedup over results saved by an earlier version.
+
+Example:
+$ ./resource_stats_benchmark.py --copies 2000
+$ ./resource_stats_benchmark.py --samples 1000 100000 1000000 --json results.json
+"""
+from __future__ import print_function
+from __future__ import division
+
+import os
+import re
+import time
+import json
+import shutil
+import resource
+import multiprocessing
+import argparse
+import tempfile
+from datetime import datetime
+from datetime import timedelta
+
+import numpy as np
+
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import ResourceUsageStats
+from resource_stats_reduction import COMPRESSION_MAGICS
+from resource_stats_reduction import openCompressedFile
+
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'SampleData', 'resource_stats_sample')
+
+# Parse throughput the default LogParser backend is expected to sustain on the scaled sample.
+PARSE_THROUGHPUT_TARGET_MBPS = 20.0
+
+
+def scaleSample(file_path, copies, interval=3):
+    """Writes SampleData copies times over to file_path, renumbering headers interval seconds apart."""
+    with open(SAMPLE_FILE, 'r') as f:
+        text = f.read()
+    date = datetime(2018, 4, 5, 22, 52, 29)
+    sections = re.split('-------- .* GMT 2018 --------', text)[1:]
+    with open(file_path, 'w') as f:
+        for _ in xrange(copies):
+            for section in sections:
+                f.write('-------- {0} --------'.format(date.strftime('%a %b %d %H:%M:%S GMT %Y')))
+                f.write(section)
+                date += timedelta(seconds=interval)
+
+
+def readSampleMeminfo():
+    """(key, kB) pairs of the first /proc/meminfo section of SampleData, in order."""
+    with open(SAMPLE_FILE, 'r') as f:
+        text = f.read().replace('\r', '')
+    section = text.split('---- /proc/meminfo\n', 1)[1].split('----', 1)[0]
+    return [(key, int(value.split()[0])) for key, value in
+            (line.split(':', 1) for line in section.splitlines() if ':' in line)]
+
+
+# /proc/uptime of the first sample of generated logs.
+GENERATED_BOOT_UPTIME = 350735.0
+
+
+def generateLog(file_path, samples, cores=8, processes=20, drop_rate=0.0, malformed_rate=0.0, interval=3, seed=0):
+    """Writes samples synthetic samples in the format of SampleData to file_path.
+
+       Every core runs a random walk of load, accounted in /proc/stat at 100 jiffies a second and
+       in /proc/schedstat, memory in use drifts, and top lists processes processes by CPU. Samples
+       are taken off whole seconds, so the /proc/uptime section following each header has the
+       sub-second time the header date lacks; interval may be fractional. Each
+       section is left out with probability drop_rate, and cut short in the middle of a line, as
+       an interrupted adb shell leaves it, with probability malformed_rate.
+    """
+    random = np.random.RandomState(seed)
+    meminfo = readSampleMeminfo()
+    mem_total = dict(meminfo)['MemTotal']
+    mem_free = dict(meminfo)['MemFree']
+    jiffies = np.zeros((cores + 1, 7), dtype=np.int64)
+    schedstat = np.zeros((cores, 3), dtype=np.int64)
+    load = random.uniform(0.05, 0.3, cores)
+    process_load = random.exponential(1.0, processes)
+    process_res = random.exponential(100.0, processes)
+    process_time = np.zeros(processes)
+    first_date = date = datetime(2018, 4, 5, 22, 52, 29, 470000)
+    with open(file_path, 'w') as f:
+        for _ in xrange(samples):
+            load = np.clip(load + random.normal(0, 0.05, cores), 0.01, 1.0)
+            busy = load * interval * 100
+            increments = np.column_stack((busy * 0.6, busy * 0.02, busy * 0.3, interval * 100 - busy, busy * 0.03,
+                                          busy * 0.02, busy * 0.03)).astype(np.int64)
+            jiffies[1:] += increments
+            jiffies[0] = jiffies[1:].sum(axis=0)
+            schedstat += np.column_stack((busy * 1e7, busy * load * 2e6, busy * 20)).astype(np.int64)
+            mem_free = int(np.clip(mem_free + random.normal(0, 2000), mem_total * 0.01, mem_total * 0.5))
+            process_time += process_load * interval
+            cpu = process_load * random.exponential(1.0, processes) * load.mean() * 2
+            uptime = GENERATED_BOOT_UPTIME + (date - first_date).total_seconds()
+            sections = [
+                '---- /proc/uptime\r\n{0:.2f} {1:.2f}\r\n'.format(uptime, uptime * cores / 2),
+                '---- /proc/schedstat\r\nversion 15\r\ntimestamp 4300965556\r\n' + ''.join(
+                    'cpu{0} 0 0 0 0 0 0 {1} {2} {3}\r\n'.format(i, *schedstat[i]) for i in xrange(cores)),
+                '---- /proc/meminfo\r\n' + ''.join(
+                    '{0:<16}{1:>8} kB\r\n'.format(key + ':', mem_free if key == 'MemFree' else value)
+                    for key, value in meminfo),
+                '---- /proc/stat\r\n' + ''.join(
+                    '{0} {1}\r\n'.format('cpu ' if i == 0 else 'cpu' + str(i - 1), ' '.join(map(str, row)) + ' 0 0 0')
+                    for i, row in enumerate(jiffies)) + 'ctxt 80690124\r\nprocs_running 1\r\n',
+                '---- top\r\n  PID USER         PR  NI VIRT  RES  SHR S[%CPU] %MEM     TIME+ ARGS\r\n' + ''.join(
+                    '{0:5d} u0_a{1:<8d} 20   0 1.2G {2:3.0f}M  50M S {3:4.1f} {4:5.1f} {5:6d}:{6:05.2f} com.example.app{1}'
+                    '\r\n'.format(1000 + j, j, process_res[j], cpu[j], process_res[j] / mem_total * 102400,
+                                   int(process_time[j] // 60), process_time[j] % 60)
+                    for j in np.argsort(-cpu)),
+            ]
+            f.write('-------- {0} --------\r\n'.format(date.strftime('%a %b %d %H:%M:%S GMT %Y')))
+            for section in sections:
+                if random.random_sample() < drop_rate: continue
+                if random.random_sample() < malformed_rate:
+                    section = section[:random.randint(section.index('\n') + 1, len(section))] + '\r\n'
+                f.write(section)
+            date += timedelta(seconds=interval)
+
+
+def measureStages(file_path):
+    """Times of parse, reduce, summary and csv export of file_path, in seconds, and the peak RSS of
+       the process in KiB. The csv is written next to file_path, then removed.
+    """
+    results = {}
+    begin = time.time()
+    cpu_stats_list, mem_stats_list = LogParser(file_path).parseLogFile()
+    results['parse'] = time.time() - begin
+    stats = ResourceUsageStats(cpu_stats_list, mem_stats_list)
+    begin = time.time()
+    stats._getReduction()
+    results['reduce'] = time.time() - begin
+    begin = time.time()
+    stats.getSummary(0, -1)
+    results['summary'] = time.time() - begin
+    begin = time.time()
+    os.remove(stats.exportCSV(file_path + '.csv'))
+    results['export_csv'] = time.time() - begin
+    results['samples'] = len(cpu_stats_list)
+    results['peak_rss_kib'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return results
+
+
+def measureStagesInProcess(file_path):
+    """measureStages in a fresh process, so that the peak RSS is its own."""
+    pool = multiprocessing.Pool(1)
+    try:
+        return pool.apply(measureStages, (file_path,))
+    finally:
+        pool.close()
+        pool.join()
+
+
+def runSuite(directory, sizes, cores=8, processes=20, drop_rate=0.0, malformed_rate=0.0):
+    """measureStagesInProcess results of a generated log of each size of sizes, with its size in MB."""
+    suite = []
+    for samples in sizes:
+        file_path = os.path.join(directory, 'resource_stats_{0}'.format(samples))
+        generateLog(file_path, samples, cores, processes, drop_rate, malformed_rate)
+        results = measureStagesInProcess(file_path)
+        results['size_mb'] = os.path.getsize(file_path) / (1024 * 1024)
+        os.remove(file_path)
+        suite.append(results)
+    return suite
+
+
+def formatSuite(suite, baseline=None):
+    """A line per size with stage times and throughput, and the speedup over baseline when it has the size."""
+    baseline_results = dict((results['samples'], results) for results in baseline or [])
+    lines = []
+    for results in suite:
+        line = ('{samples} samples ({size_mb:.1f} MB): parse {parse:.2f}s ({0:.1f} MB/s, {1:.0f} samples/s), '
+                'reduce {reduce:.3f}s, summary {summary:.3f}s, csv {export_csv:.2f}s, peak RSS {2:.1f} MiB').format(
+            results['size_mb'] / results['parse'], results['samples'] / results['parse'],
+            results['peak_rss_kib'] / 1024, **results)
+        previous = baseline_results.get(results['samples'])
+        if previous is not None:
+            line += ', speedup ' + ' '.join('{0} {1:.2f}x'.format(stage, previous[stage] / max(results[stage], 1e-9))
+                                            for stage in ('parse', 'reduce', 'summary', 'export_csv'))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def measureParseTime(file_path, repeat=3):
+    """Returns the best parseLogFile time over repeat runs, in seconds."""
+    best = None
+    for _ in xrange(repeat):
+        begin = time.time()
+        LogParser(file_path).parseLogFile()
+        elapsed = time.time() - begin
+        if best is None or elapsed < best: best = elapsed
+    return best
+
+
+def measureParseThroughput(file_path, repeat=3):
+    """Returns the best parseLogFile throughput over repeat runs, in MB/s."""
+    return os.path.getsize(file_path) / measureParseTime(file_path, repeat) / (1024 * 1024)
+
+
+def measureCompression(file_path, repeat=3):
+    """Compression ratio and parse throughput, in MB/s of uncompressed log, of file_path compressed with
+       every available compression of COMPRESSION_MAGICS, next to those of the plain log.
+
+       The compressed copies are written next to file_path, then removed.
+    """
+    size = os.path.getsize(file_path)
+    results = [{'compression': None, 'ratio': 1.0, 'throughput_mbps': measureParseThroughput(file_path, repeat)}]
+    for compression, _ in COMPRESSION_MAGICS:
+        compressed_path = file_path + '.' + compression
+        try:
+            with open(file_path, 'rb') as f:
+                compressed = openCompressedFile(compressed_path, compression)
+                shutil.copyfileobj(f, compressed, 1 << 20)
+                compressed.close()
+        except Exception as e:
+            results.append({'compression': compression, 'error': str(e)})
+            continue
+        try:
+            results.append({'compression': compression, 'ratio': size / os.path.getsize(compressed_path),
+                            'throughput_mbps': size / measureParseTime(compressed_path, repeat) / (1024 * 1024)})
+        finally:
+            os.remove(compressed_path)
+    return results
+
+
+def formatCompression(results):
+    """A line per compression of measureCompression results, its throughput relative to the plain log."""
+    plain = results[0]['throughput_mbps']
+    lines = []
+    for result in results[1:]:
+        if 'error' in result:
+            lines.append('{compression}: skipped, {error}'.format(**result))
+        else:
+            lines.append('{compression}: {ratio:.1f}x smaller, parsed at {throughput_mbps:.1f} MB/s of log, '
+                         '{0:.2f}x the plain log throughput'.format(result['throughput_mbps'] / plain, **result))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    script_description = """
+                           This script is for measuring the log parsing throughput of
+                           resource_stats_reduction.py on a scaled-up SampleData log
+                         """
+    args_parser = argparse.ArgumentParser(description=script_description)
+    args_parser.add_argument('--copies', type=int, default=1000, help='how many times to repeat SampleData')
+    args_parser.add_argument('--repeat', type=int, default=3, help='parse runs, the best one is reported')
+    args_parser.add_argument('--samples', type=int, nargs='+',
+                             help='benchmark every stage on generated logs of these sizes, e.g. 1000 100000 1000000')
+    args_parser.add_argument('--cores', type=int, default=8, help='cores of the generated logs')
+    args_parser.add_argument('--processes', type=int, default=20, help='top processes of the generated logs')
+    args_parser.add_argument('--drop_rate', type=float, default=0.0, help='share of generated sections left out')
+    args_parser.add_argument('--malformed_rate', type=float, default=0.0, help='share of generated sections cut short')
+    args_parser.add_argument('--json', type=str, help='save the --samples results to this file')
+    args_parser.add_argument('--compare', type=str, help='--json file of an earlier run to report the speedup over')
+    args = args_parser.parse_args()
+    temp_dir = tempfile.mkdtemp()
+    try:
+        if args.samples:
+            suite = runSuite(temp_dir, args.samples, args.cores, args.processes, args.drop_rate, args.malformed_rate)
+            baseline = None
+            if args.compare:
+                with open(args.compare, 'r') as f:
+                    baseline = json.load(f)
+            print (formatSuite(suite, baseline))
+            if args.json:
+                with open(args.json, 'w') as f:
+                    json.dump(suite, f, indent=2, sort_keys=True)
+            raise SystemExit(0)
+        file_path = os.path.join(temp_dir, 'resource_stats')
+        scaleSample(file_path, args.copies)
+        throughput = measureParseThroughput(file_path, args.repeat)
+        print ('Parsed {0:.1f} MB at {1:.1f} MB/s (target {2:.1f} MB/s)'.format(
+            os.path.getsize(file_path) / (1024 * 1024), throughput, PARSE_THROUGHPUT_TARGET_MBPS))
+        text_time = measureParseTime(file_path, args.repeat)
+        for compress in (False, True):
+            capture_path = os.path.join(temp_dir, 'resource_stats.cap')
+            LogParser(file_path).writeCapture(capture_path, compress)
+            print ('Capture{0}: {1:.1f}x smaller, parsed {2:.1f}x faster'.format(
+                ' (zlib)' if compress else '', os.path.getsize(file_path) / os.path.getsize(capture_path),
+                text_time / measureParseTime(capture_path, args.repeat)))
+        print (formatCompression(measureCompression(file_path, args.repeat)))
+    finally:
+        shutil.rmtree(temp_dir)
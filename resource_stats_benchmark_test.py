@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from resource_stats_benchmark import generateLog
+from resource_stats_benchmark import runSuite
+from resource_stats_benchmark import formatSuite
+from resource_stats_benchmark import measureCompression
+from resource_stats_benchmark import formatCompression
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import ResourceUsageStats
+
+
+class TestGenerateLog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_generated_log_parses(self):
+        generateLog(self.file_path, 50, cores=4, processes=5)
+        log_parser = LogParser(self.file_path)
+        cpu_stats_list, mem_stats_list = log_parser.parseLogFile()
+        self.assertEqual(50, len(cpu_stats_list))
+        self.assertEqual(50, len(mem_stats_list))
+        self.assertEqual(4, cpu_stats_list.getCoreCount())
+        self.assertEqual(4, log_parser.parseSchedstatTable().getCoreCount())
+        self.assertEqual(5, len(log_parser.parseTopTable().processes))
+        metrics = ResourceUsageStats(cpu_stats_list, mem_stats_list).getMetrics()
+        self.assertGreater(metrics['overall_user_sys_min'], 0)
+        self.assertLess(metrics['per_core_user_sys_max'], 100)
+
+    def test_sub_second_interval(self):
+        generateLog(self.file_path, 20, cores=2, processes=2, interval=0.5)
+        cpu_stats_list, _ = LogParser(self.file_path).parseLogFile()
+        self.assertEqual([0.5] * 19, np.diff(cpu_stats_list.timestamps).tolist())
+        self.assertIsNotNone(LogParser(self.file_path).findClockAnchor())
+
+    def test_dropped_and_malformed_sections(self):
+        generateLog(self.file_path, 200, drop_rate=0.1, malformed_rate=0.1)
+        cpu_stats_list, mem_stats_list = LogParser(self.file_path).parseLogFile()
+        self.assertLess(len(cpu_stats_list), 200)
+        self.assertGreater(len(cpu_stats_list), 100)
+        self.assertIn('Overall CPU', ResourceUsageStats(cpu_stats_list, mem_stats_list).getSummary(0, -1))
+
+    def test_run_suite(self):
+        suite = runSuite(self.temp_dir, [20, 40], cores=2, processes=2)
+        self.assertEqual([20, 40], [results['samples'] for results in suite])
+        self.assertGreater(suite[0]['peak_rss_kib'], 0)
+        self.assertEqual([], [name for name in os.listdir(self.temp_dir) if name.startswith('resource_stats')])
+        self.assertIn('speedup parse', formatSuite(suite, suite).splitlines()[1])
+
+    def test_measure_compression(self):
+        generateLog(self.file_path, 100, cores=2, processes=2)
+        results = measureCompression(self.file_path, repeat=1)
+        self.assertEqual([None, 'gzip', 'bz2', 'xz'], [result['compression'] for result in results])
+        self.assertGreater(results[1]['ratio'], 5)
+        self.assertGreater(results[2]['throughput_mbps'], 0)
+        self.assertEqual(3, len(formatCompression(results).splitlines()))
+        self.assertEqual(['resource_stats'], os.listdir(self.temp_dir))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,246 @@
+#! /usr/bin/env python
+
+"""
+This script converts resource_stats logs to the binary capture format, which
+resource_data_collection.py can also write directly (--capture) and resource_stats_reduction.py
+reads in place of the text log.
+
+A capture starts with FILE_HEADER: MAGIC, the format version and flags. With FLAG_ZLIB the rest of
+the file is one zlib stream, sync-flushed whenever the writer flushes so that it can be read while
+it is still being written. The (decompressed) body is a sequence of records, each a RECORD_HEADER
+(record type, payload length) followed by the payload:
+
+    RECORD_MEMINFO_KEYS  newline separated /proc/meminfo keys of the samples that follow
+    RECORD_SAMPLE        SAMPLE_HEADER (timestamp, cpu columns W, meminfo values M), then W present
+                         bytes, W x len(CPU_COUNTERS) int64 /proc/stat counters and M int64 kB values
+                         (version 1 captures have no steal counter, which reads as 0)
+    RECORD_TOP           raw top output of the preceding sample, only kept on request
+    RECORD_SCHEDSTAT     /proc/schedstat of the preceding sample: W as uint16, then W present
+                         bytes and W x len(SCHEDSTAT_COUNTERS) int64 counters
+
+Cpu column 0 holds the aggregate 'cpu' line and column i + 1 'cpu<i>'.
+
+Example:
+$ ./resource_stats_capture.py resource_stats_01.txt resource_stats_01.cap --compress
+"""
+from __future__ import print_function
+from __future__ import division
+
+import zlib
+import struct
+import argparse
+
+import numpy as np
+
+
+MAGIC = 'RSTATCAP'
+VERSION = 2
+FLAG_ZLIB = 1
+
+FILE_HEADER = struct.Struct('<8sBB')
+RECORD_HEADER = struct.Struct('<BI')
+SAMPLE_HEADER = struct.Struct('<dHH')
+
+RECORD_MEMINFO_KEYS = 1
+RECORD_SAMPLE = 2
+RECORD_TOP = 3
+RECORD_SCHEDSTAT = 4
+
+CPU_COUNTERS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+# Counters of the cpu columns by format version.
+VERSION_CPU_COUNTERS = {1: CPU_COUNTERS[:7], 2: CPU_COUNTERS}
+SCHEDSTAT_COUNTERS = ('run_time', 'wait_time', 'timeslices')
+SCHEDSTAT_WIDTH = struct.Struct('<H')
+
+
+def isCaptureFile(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class CaptureWriter(object):
+    """Encodes samples into an open binary file; flush() makes everything written so far readable."""
+
+
+    def __init__(self, f, compress=False):
+        self.file = f
+        self._compressor = zlib.compressobj() if compress else None
+        self._meminfo_keys = None
+        f.write(FILE_HEADER.pack(MAGIC, VERSION, FLAG_ZLIB if compress else 0))
+
+    def writeSample(self, timestamp, cpu_counters, meminfo, top=None, schedstat=None):
+        """cpu_counters maps cpu ids to {counter name: value}, meminfo maps keys to kB values and
+           schedstat cpu ids to {counter name: value}, as the data of ProcStatData, ProcMeminfoData
+           and SchedstatData do.
+        """
+        keys = sorted(meminfo)
+        if keys != self._meminfo_keys:
+            self._writeRecord(RECORD_MEMINFO_KEYS, '\n'.join(keys))
+            self._meminfo_keys = keys
+        width, cpu_columns = self._encodeColumns(cpu_counters, CPU_COUNTERS)
+        self._writeRecord(RECORD_SAMPLE, ''.join((SAMPLE_HEADER.pack(timestamp, width, len(keys)), cpu_columns,
+                                                  np.array([meminfo[key] for key in keys], dtype='<i8').tostring())))
+        if top is not None:
+            self._writeRecord(RECORD_TOP, top)
+        if schedstat:
+            width, schedstat_columns = self._encodeColumns(schedstat, SCHEDSTAT_COUNTERS)
+            self._writeRecord(RECORD_SCHEDSTAT, SCHEDSTAT_WIDTH.pack(width) + schedstat_columns)
+
+    def flush(self):
+        if self._compressor is not None:
+            self.file.write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+        self.file.flush()
+
+    def close(self):
+        if self._compressor is not None:
+            self.file.write(self._compressor.flush(zlib.Z_FINISH))
+            self._compressor = None
+        self.file.close()
+
+    def _encodeColumns(self, cpu_counters, counter_names):
+        """Width, then present bytes and counters of the cpu columns (column 0 being 'cpu')."""
+        columns = dict((0 if cpu_id == 'cpu' else int(cpu_id[3:]) + 1, values)
+                       for cpu_id, values in cpu_counters.iteritems())
+        width = max(columns) + 1 if columns else 0
+        present = np.zeros(width, dtype=np.uint8)
+        counters = np.zeros((width, len(counter_names)), dtype='<i8')
+        for column, values in columns.iteritems():
+            present[column] = 1
+            counters[column] = [values[name] for name in counter_names]
+        return width, present.tostring() + counters.tostring()
+
+    def _writeRecord(self, record_type, payload):
+        data = RECORD_HEADER.pack(record_type, len(payload)) + payload
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        self.file.write(data)
+
+
+class CaptureData(object):
+    """Columnar content of a capture, laid out like ProcStatTable and ProcMeminfoTable.
+
+       counters is a (samples x cpu columns x CPU_COUNTERS) int64 array and meminfo_values a
+       (samples x meminfo_keys) one, meminfo_present telling the keys each sample has; tops holds
+       the (timestamp, text) of the kept top outputs. schedstat_counters and schedstat_present are
+       laid out like counters and present. origin is the timestamp of the first sample, None if
+       there is none.
+    """
+
+
+    def __init__(self, cpu_timestamps, counters, present, mem_timestamps, meminfo_keys, meminfo_values, tops,
+                 schedstat_timestamps, schedstat_counters, schedstat_present, meminfo_present, origin=None):
+        self.cpu_timestamps = cpu_timestamps
+        self.counters = counters
+        self.present = present
+        self.mem_timestamps = mem_timestamps
+        self.meminfo_keys = meminfo_keys
+        self.meminfo_values = meminfo_values
+        self.tops = tops
+        self.schedstat_timestamps = schedstat_timestamps
+        self.schedstat_counters = schedstat_counters
+        self.schedstat_present = schedstat_present
+        self.meminfo_present = meminfo_present
+        self.origin = origin
+
+
+class CaptureReader(object):
+    """Decodes a capture file; a record cut short by a writer still at work is ignored."""
+
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+
+    def read(self):
+        version, body = self._readBody()
+        samples = []
+        tops = []
+        schedstats = []
+        meminfo_keys = []
+        key_columns = []
+        key_index = {}
+        position = 0
+        while position + RECORD_HEADER.size <= len(body):
+            record_type, length = RECORD_HEADER.unpack_from(body, position)
+            payload = position + RECORD_HEADER.size
+            position = payload + length
+            if position > len(body): break
+            if record_type == RECORD_SAMPLE:
+                timestamp, cpu_width, value_count = SAMPLE_HEADER.unpack_from(body, payload)
+                samples.append((timestamp, cpu_width, value_count, payload + SAMPLE_HEADER.size, key_columns))
+            elif record_type == RECORD_MEMINFO_KEYS:
+                key_columns = []
+                for key in body[payload:position].split('\n') if length else []:
+                    if key not in key_index:
+                        key_index[key] = len(meminfo_keys)
+                        meminfo_keys.append(key)
+                    key_columns.append(key_index[key])
+            elif record_type == RECORD_TOP and samples:
+                tops.append((samples[-1][0], body[payload:position]))
+            elif record_type == RECORD_SCHEDSTAT and samples:
+                schedstats.append((samples[-1][0], SCHEDSTAT_WIDTH.unpack_from(body, payload)[0],
+                                   payload + SCHEDSTAT_WIDTH.size))
+        return self._buildData(body, samples, meminfo_keys, tops, schedstats, VERSION_CPU_COUNTERS[version])
+
+    def _readBody(self):
+        """Format version and decompressed body of the capture."""
+        with open(self.file_path, 'rb') as f:
+            header = f.read(FILE_HEADER.size)
+            data = f.read()
+        if len(header) < FILE_HEADER.size:
+            raise Exception(self.file_path + ' is not a resource stats capture')
+        magic, version, flags = FILE_HEADER.unpack(header)
+        if magic != MAGIC or version not in VERSION_CPU_COUNTERS:
+            raise Exception(self.file_path + ' is not a version {0} resource stats capture'.format(
+                ' or '.join(map(str, sorted(VERSION_CPU_COUNTERS)))))
+        if flags & FLAG_ZLIB:
+            return version, zlib.decompressobj().decompress(data)
+        return version, data
+
+    def _decodeColumns(self, body, rows, counter_count):
+        """present and counters arrays of the (cpu width, offset) rows."""
+        width = max([cpu_width for cpu_width, _ in rows] or [0])
+        counters = np.zeros((len(rows), width, counter_count), dtype=np.int64)
+        present = np.zeros((len(rows), width), dtype=np.bool_)
+        for i, (cpu_width, offset) in enumerate(rows):
+            present[i, :cpu_width] = np.frombuffer(body, np.uint8, cpu_width, offset)
+            counters[i, :cpu_width] = np.frombuffer(body, '<i8', cpu_width * counter_count,
+                                                    offset + cpu_width).reshape(cpu_width, counter_count)
+        return counters, present
+
+    def _buildData(self, body, samples, meminfo_keys, tops, schedstats, cpu_counters):
+        """cpu_counters are the counters the cpu columns hold; the others of CPU_COUNTERS read as 0."""
+        counter_count = len(cpu_counters)
+        cpu_rows = [sample for sample in samples if sample[1] > 0]
+        counters, present = self._decodeColumns(body, [(sample[1], sample[3]) for sample in cpu_rows], counter_count)
+        if counter_count < len(CPU_COUNTERS):
+            counters = np.concatenate((counters, np.zeros(counters.shape[:2] + (len(CPU_COUNTERS) - counter_count,),
+                                                          dtype=np.int64)), axis=2)
+        mem_rows = [sample for sample in samples if sample[2] > 0]
+        meminfo_values = np.zeros((len(mem_rows), len(meminfo_keys)), dtype=np.int64)
+        meminfo_present = np.zeros((len(mem_rows), len(meminfo_keys)), dtype=np.bool_)
+        for i, (_, cpu_width, value_count, offset, key_columns) in enumerate(mem_rows):
+            offset += cpu_width * (1 + 8 * counter_count)
+            meminfo_values[i, key_columns] = np.frombuffer(body, '<i8', value_count, offset)
+            meminfo_present[i, key_columns] = True
+        schedstat_counters, schedstat_present = self._decodeColumns(
+            body, [(width, offset) for _, width, offset in schedstats], len(SCHEDSTAT_COUNTERS))
+        return CaptureData(np.array([sample[0] for sample in cpu_rows], dtype=np.float64), counters, present,
+                           np.array([sample[0] for sample in mem_rows], dtype=np.float64), meminfo_keys,
+                           meminfo_values, tops, np.array([schedstat[0] for schedstat in schedstats], dtype=np.float64),
+                           schedstat_counters, schedstat_present, meminfo_present,
+                           samples[0][0] if samples else None)
+
+
+if __name__ == '__main__':
+    from resource_stats_reduction import LogParser
+
+    script_description = """
+                           This script is for converting a resource_stats text log to the
+                           binary capture format
+                         """
+    args_parser = argparse.ArgumentParser(description=script_description)
+    args_parser.add_argument('input_file', type=str, help='input text log')
+    args_parser.add_argument('output_file', type=str, help='output capture')
+    args_parser.add_argument('--compress', action='store_true', help='zlib compress the capture')
+    args = args_parser.parse_args()
+    LogParser(args.input_file).writeCapture(args.output_file, args.compress)
@@ -0,0 +1,123 @@
+import os
+import struct
+import shutil
+import tempfile
+import unittest
+from resource_stats_capture import CaptureReader
+from resource_stats_capture import CaptureWriter
+from resource_stats_capture import isCaptureFile
+from resource_stats_capture import FILE_HEADER
+from resource_stats_capture import MAGIC
+from resource_stats_capture import RECORD_HEADER
+from resource_stats_capture import RECORD_MEMINFO_KEYS
+from resource_stats_capture import RECORD_SAMPLE
+from resource_stats_capture import SAMPLE_HEADER
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import ResourceUsageStats
+from resource_stats_benchmark import scaleSample
+from resource_stats_benchmark import generateLog
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'SampleData', 'resource_stats_sample')
+
+
+class TestCapture(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.temp_dir, 'resource_stats')
+        self.capture_path = os.path.join(self.temp_dir, 'resource_stats.cap')
+        scaleSample(self.log_path, 20)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assertTablesEqual(self, expect, actual):
+        expect_cpu, expect_mem = expect
+        cpu, mem = actual
+        self.assertEqual(expect_cpu.timestamps.tolist(), cpu.timestamps.tolist())
+        for name in expect_cpu.CPU_COUNTERS:
+            self.assertEqual(expect_cpu.counters[name].tolist(), cpu.counters[name].tolist())
+        self.assertEqual(expect_cpu.present.tolist(), cpu.present.tolist())
+        self.assertEqual([m.data for m in expect_mem], [m.data for m in mem])
+
+    def test_capture_matches_text_log(self):
+        log_parser = LogParser(self.log_path)
+        for compress in (False, True):
+            log_parser.writeCapture(self.capture_path, compress)
+            self.assertTrue(isCaptureFile(self.capture_path))
+            self.assertFalse(isCaptureFile(self.log_path))
+            capture_parser = LogParser(self.capture_path)
+            for start, end in ((0, -1), (10, 50), (80, -1)):
+                self.assertTablesEqual(log_parser.parseLogFile(start, end), capture_parser.parseLogFile(start, end))
+            self.assertEqual([(type(s), s.date, s.data) for s in log_parser.iterSamples(10, 50)],
+                             [(type(s), s.date, s.data) for s in capture_parser.iterSamples(10, 50)])
+            expect = log_parser.parseSchedstatTable(10, 50)
+            schedstat = capture_parser.parseSchedstatTable(10, 50)
+            self.assertEqual(expect.timestamps.tolist(), schedstat.timestamps.tolist())
+            self.assertEqual(expect.counters['wait_time'].tolist(), schedstat.counters['wait_time'].tolist())
+
+    def test_sample_summary(self):
+        LogParser(SAMPLE_FILE).writeCapture(self.capture_path, compress=True)
+        self.assertEqual(ResourceUsageStats(*LogParser(SAMPLE_FILE).parseLogFile()).getSummary(0, -1),
+                         ResourceUsageStats(*LogParser(self.capture_path).parseLogFile()).getSummary(0, -1))
+
+    def test_malformed_sections(self):
+        generateLog(self.log_path, 300, cores=4, processes=3, malformed_rate=0.1, seed=3)
+        log_parser = LogParser(self.log_path)
+        log_parser.writeCapture(self.capture_path)
+        capture_parser = LogParser(self.capture_path)
+        self.assertTablesEqual(log_parser.parseLogFile(), capture_parser.parseLogFile())
+        self.assertEqual(log_parser.parseSchedstatTable().timestamps.tolist(),
+                         capture_parser.parseSchedstatTable().timestamps.tolist())
+        summaries = [ResourceUsageStats(*parser.parseLogFile()).getSummary(0, -1, distribution='exact')
+                     for parser in (log_parser, capture_parser)]
+        self.assertEqual(summaries[0], summaries[1])
+
+    def test_capture_being_written(self):
+        f = open(self.capture_path, 'wb')
+        writer = CaptureWriter(f, compress=True)
+        writer.writeSample(10.0, {'cpu': dict.fromkeys(('user', 'nice', 'system', 'idle', 'iowait', 'irq',
+                                                        'softirq', 'steal'), 1)},
+                           {'MemTotal': 100, 'MemFree': 50}, top='top output')
+        writer.flush()
+        writer.writeSample(13.0, {}, {'MemTotal': 100, 'Cached': 20})
+        data = CaptureReader(self.capture_path).read()
+        self.assertEqual([10.0], data.cpu_timestamps.tolist())
+        self.assertEqual([10.0], data.mem_timestamps.tolist())
+        self.assertEqual([(10.0, 'top output')], data.tops)
+        writer.close()
+        data = CaptureReader(self.capture_path).read()
+        self.assertEqual([10.0], data.cpu_timestamps.tolist())
+        self.assertEqual(['MemFree', 'MemTotal', 'Cached'], data.meminfo_keys)
+        self.assertEqual([[50, 100, 0], [0, 100, 20]], data.meminfo_values.tolist())
+        self.assertEqual([[True, True, False], [False, True, True]], data.meminfo_present.tolist())
+
+    def test_capture_of_top_only(self):
+        with open(SAMPLE_FILE, 'r') as f:
+            text = f.read()
+        top = text[text.index('\n', text.index('---- top')) + 1:text.index('-------- ', 1)]
+        with open(self.capture_path, 'wb') as f:
+            writer = CaptureWriter(f)
+            writer.writeSample(10.0, {}, {}, top=top)
+            writer.writeSample(13.0, {}, {}, top=top)
+            writer.close()
+        capture_parser = LogParser(self.capture_path)
+        self.assertEqual(10.0, CaptureReader(self.capture_path).read().origin)
+        self.assertTrue(len(capture_parser.parseTopTable()) > 0)
+        self.assertEqual(len(capture_parser.parseTopTable()) // 2, len(capture_parser.parseTopTable(2)))
+
+    def test_version_1_capture_has_no_steal(self):
+        keys = 'Cached\nMemFree\nMemTotal'
+        sample = SAMPLE_HEADER.pack(10.0, 1, 3) + '\x01' + struct.pack('<7q', *range(1, 8)) + \
+                 struct.pack('<3q', 20, 50, 100)
+        with open(self.capture_path, 'wb') as f:
+            f.write(FILE_HEADER.pack(MAGIC, 1, 0) + RECORD_HEADER.pack(RECORD_MEMINFO_KEYS, len(keys)) + keys +
+                    RECORD_HEADER.pack(RECORD_SAMPLE, len(sample)) + sample)
+        data = CaptureReader(self.capture_path).read()
+        self.assertEqual([[[1, 2, 3, 4, 5, 6, 7, 0]]], data.counters.tolist())
+        self.assertEqual([[20, 50, 100]], data.meminfo_values.tolist())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+#! /usr/bin/env python
+
+"""
+This script is for comparing the resource usage of a candidate build with that of a baseline,
+e.g. as the gate of a performance CI job.
+
+The baseline and candidate logs or captures are reduced in parallel. Text logs go through their
+SampleCache, so comparing again against the same baseline only parses what was appended to it.
+The report has, for every summary metric and percentile, the baseline and candidate values, the
+absolute delta and the delta relative to the baseline; per-core metrics when both have the same
+core count; and the shift of each distribution, the largest gap between the two cumulative
+distributions (0 same, 1 disjoint). --threshold sets how much a metric may grow: past any of
+them the exit status is 1. It is 2 when the comparison cannot be made, e.g. a log is unreadable
+or too short to reduce, so that a CI job tells an error from a regression.
+
+Example:
+$ ./resource_stats_compare.py baseline.cap candidate.cap --threshold '*_avg=5%' 'mem_used_max=100'
+"""
+from __future__ import print_function
+from __future__ import division
+
+import re
+import sys
+import json
+import fnmatch
+import argparse
+import multiprocessing
+
+import numpy as np
+
+from resource_stats_reduction import DISTRIBUTION_SERIES
+from resource_stats_reduction import DISTRIBUTION_SUMMARY_FORMATS
+from resource_stats_reduction import SUMMARY_FORMATS
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import ResourceUsageStats
+from resource_stats_capture import isCaptureFile
+
+
+METRIC_KEYS = [key for key, _ in SUMMARY_FORMATS + DISTRIBUTION_SUMMARY_FORMATS]
+
+# Per-core series compared core by core, and the statistics compared for each core.
+PER_CORE_METRICS = (('per_core_user_sys', ('avg', 'max')), ('per_core_user', ('avg',)), ('per_core_sys', ('avg',)))
+
+SHIFT_BINS = 200
+
+
+def reduceForComparison(file_path, start=0, end=-1, use_cache=True):
+    """Returns the metrics of file_path, percentiles and per-core metrics included, its core count
+       and the QuantileSketches of DISTRIBUTION_SERIES.
+
+       Text logs are parsed through their SampleCache with use_cache.
+    """
+    log_parser = LogParser(file_path)
+    if use_cache and not isCaptureFile(file_path):
+        cpu_stats_list, mem_stats_list = log_parser.parseCachedLogFile(start, end)
+    else:
+        cpu_stats_list, mem_stats_list = log_parser.parseLogFile(start, end)
+    if len(cpu_stats_list) < 2 or len(mem_stats_list) < 1:
+        raise Exception('{0}: not enough data for calculation'.format(file_path))
+    stats = ResourceUsageStats(cpu_stats_list, mem_stats_list)
+    sketches = stats.getDistributions()
+    metrics = stats.getMetrics(sketches)
+    reduction = stats._getReduction()
+    for name, statistics in PER_CORE_METRICS:
+        values = getattr(reduction, name)
+        for core in xrange(reduction.core_count):
+            column = values[:, core]
+            for statistic in statistics:
+                metrics[getPerCoreKey(name, core, statistic)] = float(column.max() if statistic == 'max' else
+                                                                      column.mean())
+    return {'file': file_path, 'metrics': metrics, 'core_count': reduction.core_count, 'sketches': sketches}
+
+
+def getPerCoreKey(name, core, statistic):
+    return '{0}_cpu{1}_{2}'.format(name, core, statistic)
+
+
+def _reduceForComparison(args):
+    return reduceForComparison(*args)
+
+
+def computeShift(baseline, candidate):
+    """Largest gap between the cumulative distributions of two QuantileSketches, over SHIFT_BINS bins
+       spanning both.
+    """
+    low = min(baseline.min, candidate.min)
+    high = max(baseline.max, candidate.max)
+    if high <= low: return 0.0
+    edges = np.linspace(low, high, SHIFT_BINS + 1)
+    baseline_cdf = np.cumsum(baseline.getHistogram(edges)) / baseline.count
+    candidate_cdf = np.cumsum(candidate.getHistogram(edges)) / candidate.count
+    return float(np.abs(baseline_cdf - candidate_cdf).max())
+
+
+def parseThreshold(text):
+    """(pattern, limit, relative) of a pattern=limit --threshold, limit ending with % if relative.
+
+       pattern is an fnmatch pattern of metric names.
+    """
+    m = re.match(r'^([^=]+)=\+?([0-9]*\.?[0-9]+)(%?)$', text.strip())
+    if m is None:
+        raise Exception('thresholds are metric=limit or metric=limit%: ' + text)
+    return m.group(1), float(m.group(2)), m.group(3) == '%'
+
+
+class Comparison(object):
+    """Metric by metric comparison of a candidate log with a baseline one.
+
+       thresholds are parseThreshold tuples: a metric matching a pattern regresses when it grows by
+       more than the limit, in its own unit or, if relative, in percent of the baseline. The relative
+       delta of a metric whose baseline is 0 is None, and any growth of it passes relative limits.
+    """
+
+
+    def __init__(self, baseline_path, candidate_path, start=0, end=-1, thresholds=(), jobs=2, use_cache=True):
+        self.baseline_path = baseline_path
+        self.candidate_path = candidate_path
+        self.start = start
+        self.end = end
+        self.thresholds = thresholds
+        self.jobs = jobs
+        self.use_cache = use_cache
+        self.rows = []
+        self.notes = []
+
+    def run(self):
+        tasks = [(file_path, self.start, self.end, self.use_cache)
+                 for file_path in (self.baseline_path, self.candidate_path)]
+        if self.jobs > 1:
+            pool = multiprocessing.Pool(2)
+            try:
+                baseline, candidate = pool.map(_reduceForComparison, tasks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            baseline, candidate = [_reduceForComparison(task) for task in tasks]
+        keys = list(METRIC_KEYS)
+        if baseline['core_count'] == candidate['core_count']:
+            keys += [getPerCoreKey(name, core, statistic) for name, statistics in PER_CORE_METRICS
+                     for core in xrange(baseline['core_count']) for statistic in statistics]
+        else:
+            self.notes.append('Per-core metrics not compared: {0} baseline cores, {1} candidate cores'.format(
+                baseline['core_count'], candidate['core_count']))
+        self.rows = [self._getRow(key, baseline['metrics'][key], candidate['metrics'][key]) for key in keys]
+        for name, _, _, _ in DISTRIBUTION_SERIES:
+            shift = computeShift(baseline['sketches'][name], candidate['sketches'][name])
+            self.rows.append(self._getRow(name + '_shift', 0.0, shift))
+        return self
+
+    def getRegressions(self):
+        """(row, threshold) of every row past a threshold its metric matches."""
+        regressions = []
+        for row in self.rows:
+            for threshold in self.thresholds:
+                pattern, limit, relative = threshold
+                if not fnmatch.fnmatchcase(row['metric'], pattern): continue
+                if not relative:
+                    past = row['delta'] > limit
+                elif row['relative'] is None:
+                    past = row['delta'] > 0
+                else:
+                    past = row['relative'] * 100 > limit
+                if past:
+                    regressions.append((row, threshold))
+        return regressions
+
+    def toJSON(self):
+        regressions = [{'metric': row['metric'], 'threshold': '{0}={1:g}{2}'.format(
+                            pattern, limit, '%' if relative else '')}
+                       for row, (pattern, limit, relative) in self.getRegressions()]
+        return json.dumps({'baseline': self.baseline_path, 'candidate': self.candidate_path, 'rows': self.rows,
+                           'notes': self.notes, 'regressions': regressions}, indent=2, sort_keys=True)
+
+    def format(self):
+        width = max(len(row['metric']) for row in self.rows)
+        lines = ['Baseline: ' + self.baseline_path, 'Candidate: ' + self.candidate_path]
+        lines.append('{0:<{width}} {1:>12} {2:>12} {3:>12} {4:>10}'.format(
+            'metric', 'baseline', 'candidate', 'delta', 'relative', width=width))
+        for row in self.rows:
+            lines.append('{metric:<{width}} {baseline:>12.2f} {candidate:>12.2f} {delta:>+12.2f} {0:>10}'.format(
+                '-' if row['relative'] is None else '{0:+.1f}%'.format(row['relative'] * 100),
+                width=width, **row))
+        lines += self.notes
+        regressions = self.getRegressions()
+        lines.append('Regressions past thresholds: {0}'.format(len(regressions)))
+        for row, (pattern, limit, relative) in regressions:
+            growth = '{0:+.2f}'.format(row['delta'])
+            if relative:
+                growth = '-' if row['relative'] is None else '{0:+.1f}%'.format(row['relative'] * 100)
+            lines.append('  {0}: {1} exceeds {2}={3:g}{4}'.format(row['metric'], growth, pattern, limit,
+                                                                  '%' if relative else ''))
+        return '\n'.join(lines)
+
+    def _getRow(self, metric, baseline, candidate):
+        delta = candidate - baseline
+        if baseline != 0:
+            relative = delta / abs(baseline)
+        else:
+            relative = 0.0 if delta == 0 else None
+        return {'metric': metric, 'baseline': baseline, 'candidate': candidate, 'delta': delta,
+                'relative': relative}
+
+
+if __name__ == '__main__':
+    script_description = """
+                           This script is for comparing the resource usage of a candidate
+                           log or capture with a baseline one
+                         """
+    args_parser = argparse.ArgumentParser(description=script_description)
+    args_parser.add_argument('baseline', type=str, help='baseline log or capture')
+    args_parser.add_argument('candidate', type=str, help='candidate log or capture')
+    args_parser.add_argument('--start', type=int, default=0, help='start timestamp, start from 0s')
+    args_parser.add_argument('--end', type=int, default=-1, help='end timestamp')
+    args_parser.add_argument('--threshold', type=str, nargs='+', default=[], metavar='METRIC=LIMIT[%]',
+                             help='largest growth allowed for the metrics matching the fnmatch pattern METRIC, '
+                                  'in their unit or in percent of the baseline; exit status 1 past any, 2 on errors')
+    args_parser.add_argument('--jobs', type=int, default=2, help='1 reduces the two logs one after the other')
+    args_parser.add_argument('--no_cache', action='store_true', help='parse text logs without their sample cache')
+    args_parser.add_argument('--format', choices=('text', 'json'), default='text', help='report format')
+    args = args_parser.parse_args()
+    try:
+        thresholds = [parseThreshold(threshold) for threshold in args.threshold]
+    except Exception as e:
+        args_parser.error('--threshold: {0}'.format(e))
+    try:
+        comparison = Comparison(args.baseline, args.candidate, args.start, args.end, thresholds, args.jobs,
+                                not args.no_cache).run()
+    except Exception as e:
+        sys.stderr.write('comparison failed: {0}\n'.format(e))
+        sys.exit(2)
+    print (comparison.toJSON() if args.format == 'json' else comparison.format())
+    sys.exit(1 if comparison.getRegressions() else 0)
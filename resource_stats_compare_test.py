@@ -0,0 +1,98 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from resource_stats_compare import Comparison
+from resource_stats_compare import computeShift
+from resource_stats_compare import parseThreshold
+from resource_stats_compare import reduceForComparison
+from resource_stats_reduction import LogParser
+from resource_stats_reduction import QuantileSketch
+from resource_stats_reduction import ResourceUsageStats
+from resource_stats_reduction import SampleCache
+from resource_stats_benchmark import generateLog
+
+
+class TestComparison(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.baseline_path = os.path.join(self.temp_dir, 'baseline')
+        self.candidate_path = os.path.join(self.temp_dir, 'candidate')
+        generateLog(self.baseline_path, 200, cores=4, processes=2, seed=1)
+        generateLog(self.candidate_path, 200, cores=4, processes=2, seed=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_rows_match_summaries(self):
+        for jobs in (1, 2):
+            comparison = Comparison(self.baseline_path, self.candidate_path, jobs=jobs).run()
+            rows = dict((row['metric'], row) for row in comparison.rows)
+            baseline = ResourceUsageStats(*LogParser(self.baseline_path).parseLogFile()).getMetrics()
+            candidate = ResourceUsageStats(*LogParser(self.candidate_path).parseLogFile()).getMetrics()
+            for key in ('overall_user_sys_avg', 'per_core_sys_max', 'mem_used_change'):
+                self.assertAlmostEqual(baseline[key], rows[key]['baseline'])
+                self.assertAlmostEqual(candidate[key] - baseline[key], rows[key]['delta'])
+            self.assertAlmostEqual(rows['mem_used_max']['delta'] / baseline['mem_used_max'],
+                                   rows['mem_used_max']['relative'])
+            self.assertIn('per_core_user_sys_cpu3_max', rows)
+            self.assertIn('overall_user_sys_p99', rows)
+            self.assertGreater(rows['overall_user_sys_shift']['candidate'], 0)
+            self.assertEqual([], comparison.notes)
+
+    def test_core_count_mismatch(self):
+        generateLog(self.candidate_path, 200, cores=2, processes=2, seed=2)
+        comparison = Comparison(self.baseline_path, self.candidate_path, jobs=1).run()
+        self.assertFalse([row for row in comparison.rows if '_cpu0_' in row['metric']])
+        self.assertEqual(['Per-core metrics not compared: 4 baseline cores, 2 candidate cores'], comparison.notes)
+
+    def test_thresholds(self):
+        comparison = Comparison(self.baseline_path, self.baseline_path, thresholds=[parseThreshold('*=0')]).run()
+        self.assertEqual([], comparison.getRegressions())
+        rows = dict((row['metric'], row) for row in
+                    Comparison(self.baseline_path, self.candidate_path, jobs=1).run().rows)
+        growing = [key for key, row in rows.items() if row['relative'] is not None and row['relative'] > 0.01]
+        comparison = Comparison(self.baseline_path, self.candidate_path, jobs=1,
+                                thresholds=[parseThreshold('*=1%'), parseThreshold('mem_used_avg=+1000000')]).run()
+        self.assertEqual(sorted(growing + [key for key, row in rows.items() if row['relative'] is None]),
+                         sorted(row['metric'] for row, _ in comparison.getRegressions()))
+        self.assertIn('Regressions past thresholds: {0}'.format(len(comparison.getRegressions())), comparison.format())
+        self.assertEqual(len(comparison.getRegressions()), len(json.loads(comparison.toJSON())['regressions']))
+        self.assertEqual(('*_avg', 5.0, True), parseThreshold('*_avg=5%'))
+        self.assertRaises(Exception, parseThreshold, 'mem_used_max')
+
+    def test_exit_status(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'resource_stats_compare.py')
+        broken_path = os.path.join(self.temp_dir, 'broken')
+        with open(broken_path, 'w') as f:
+            f.write('not a log\n')
+        with open(os.devnull, 'w') as devnull:
+            def run(*args):
+                return subprocess.call([sys.executable, script, '--jobs', '1'] + list(args),
+                                       stdout=devnull, stderr=devnull)
+            self.assertEqual(0, run(self.baseline_path, self.baseline_path, '--threshold', '*=0'))
+            self.assertEqual(1, run(self.baseline_path, self.candidate_path, '--threshold', '*=0'))
+            self.assertEqual(2, run(self.baseline_path, broken_path))
+
+    def test_cache_is_reused(self):
+        reduceForComparison(self.baseline_path)
+        self.assertIsNotNone(SampleCache.load(self.baseline_path))
+        log_parser = LogParser(self.baseline_path)
+        log_parser._parseBytes = None
+        self.assertEqual(len(log_parser.parseCachedLogFile()[0]), 200)
+
+    def test_shift(self):
+        baseline = QuantileSketch()
+        baseline.update(range(100))
+        candidate = QuantileSketch()
+        candidate.update(range(50, 150))
+        self.assertAlmostEqual(0.5, computeShift(baseline, candidate), 1)
+        self.assertEqual(0.0, computeShift(baseline, baseline))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,6 +15,7 @@ $ ./resource_stats_reduction.py resource_stats_01.txt | tee reduced_stats_output
 Command to collect raw data from system file:
 
 adb shell "while :; do echo -------- \`date -u\` --------; \
+echo ---- /proc/uptime; cat /proc/uptime; \
 echo ---- /proc/schedstat; cat /proc/schedstat; \
 echo ---- /proc/meminfo; cat /proc/meminfo; \
 echo ---- /proc/stat; \
@@ -27,116 +28,1398 @@ from __future__ import division
 
 
 import re
+import os
+import sys
+import time
+import json
+import bisect
+import hashlib
+import io
+import gzip
+import bz2
+import zlib
+import heapq
+import math
+import cProfile
+import resource
 import argparse
+import multiprocessing
+import calendar
 from datetime import datetime
+from datetime import timedelta
+from collections import deque
+from contextlib import contextmanager
+from StringIO import StringIO
 from __builtin__ import int
 
+import numpy as np
+
+from resource_stats_capture import CPU_COUNTERS as CAPTURE_CPU_COUNTERS
+from resource_stats_capture import SCHEDSTAT_COUNTERS as CAPTURE_SCHEDSTAT_COUNTERS
+from resource_stats_capture import CaptureReader
+from resource_stats_capture import CaptureWriter
+from resource_stats_capture import isCaptureFile
+
+
+SUMMARY_FORMATS = (
+    ('overall_user_sys_min', 'Overall CPU - user + sys + irq min: {0:.1f}%'),
+    ('overall_user_sys_avg', 'Overall CPU - user + sys + irq avg: {0:.1f}%'),
+    ('overall_user_sys_max', 'Overall CPU - user + sys + irq max: {0:.1f}%'),
+    ('overall_user_sys_range', 'Overall CPU - user + sys + irq Max - Min: {0:.1f}%'),
+    ('overall_user_sys_change', 'Overall CPU - user + sys + irq Last - First: {0:.1f}%'),
+    ('overall_user_min', 'Overall CPU - user min: {0:.1f}%'),
+    ('overall_user_avg', 'Overall CPU - user avg: {0:.1f}%'),
+    ('overall_user_max', 'Overall CPU - user max: {0:.1f}%'),
+    ('overall_sys_min', 'Overall CPU - sys min: {0:.1f}%'),
+    ('overall_sys_avg', 'Overall CPU - sys avg: {0:.1f}%'),
+    ('overall_sys_max', 'Overall CPU - sys max: {0:.1f}%'),
+    ('per_core_user_sys_min', 'Per CPU - user + sys min: {0:.1f}%'),
+    ('per_core_user_sys_max', 'Per CPU - user + sys max: {0:.1f}%'),
+    ('per_core_user_min', 'Per CPU - user min: {0:.1f}%'),
+    ('per_core_user_max', 'Per CPU - user max: {0:.1f}%'),
+    ('per_core_sys_min', 'Per CPU - sys min: {0:.1f}%'),
+    ('per_core_sys_max', 'Per CPU - sys max: {0:.1f}%'),
+    ('mem_used_min', 'Memory in use (MiB) min: {0:.1f}'),
+    ('mem_used_avg', 'Memory in use (MiB) avg: {0:.1f}'),
+    ('mem_used_max', 'Memory in use (MiB) max: {0:.1f}'),
+    ('mem_used_range', 'Memory in use (MiB) Max - Min : {0:.1f}'),
+    ('mem_used_change', 'Memory in use (MiB) Last - First: {0:.1f}'),
+)
+
+
+CPU_SERIES = ('overall_user_sys', 'overall_user', 'overall_sys')
+PER_CORE_SERIES = ('per_core_user_sys', 'per_core_user', 'per_core_sys')
+SERIES_NAMES = CPU_SERIES + PER_CORE_SERIES + ('mem_used',)
+
+# (series, threshold, min_duration) rules of SpikeAnalysis by default: CPU thresholds in percent,
+# mem_used ones in MiB, durations in seconds.
+DEFAULT_SPIKE_RULES = (('overall_user_sys', 80.0, 9), ('per_core_user_sys', 95.0, 6))
+ZSCORE_SERIES = ('overall_user_sys', 'mem_used')
+
+
+def computeSummaryMetrics(running_stats):
+    """Summary metrics keyed as in SUMMARY_FORMATS from the RunningStats of every series in SERIES_NAMES."""
+    metrics = {}
+    for name in CPU_SERIES:
+        stats = running_stats[name]
+        series_min = float(stats.min)
+        series_max = float(stats.max)
+        metrics[name + '_min'] = series_min
+        metrics[name + '_avg'] = float(stats.sum) / stats.count
+        metrics[name + '_max'] = series_max
+        metrics[name + '_range'] = series_max - series_min
+        metrics[name + '_change'] = float(stats.last - stats.first)
+    for name in PER_CORE_SERIES:
+        stats = running_stats[name]
+        metrics[name + '_min'] = float(stats.min.min())
+        metrics[name + '_max'] = float(stats.max.max())
+    stats = running_stats['mem_used']
+    mem_min = int(stats.min)
+    mem_max = int(stats.max)
+    metrics['mem_used_min'] = mem_min / 1024
+    metrics['mem_used_avg'] = (int(stats.sum) / 1024) / stats.count
+    metrics['mem_used_max'] = mem_max / 1024
+    metrics['mem_used_range'] = (mem_max - mem_min) / 1024
+    metrics['mem_used_change'] = (int(stats.last) - int(stats.first)) / 1024
+    return metrics
+
+
+SCHEDSTAT_SUMMARY_FORMATS = (
+    ('per_core_wait_min', 'Per CPU - run queue wait per interval (ms) min: {0:.1f}'),
+    ('per_core_wait_avg', 'Per CPU - run queue wait per interval (ms) avg: {0:.1f}'),
+    ('per_core_wait_max', 'Per CPU - run queue wait per interval (ms) max: {0:.1f}'),
+    ('latency_avg', 'Scheduling latency per timeslice (ms) avg: {0:.3f}'),
+    ('per_core_latency_max', 'Per CPU - scheduling latency per timeslice (ms) max: {0:.3f}'),
+)
+
+
+def computeSchedstatMetrics(reduction):
+    """Metrics keyed as in SCHEDSTAT_SUMMARY_FORMATS from a StatsReduction with schedstat series.
+
+       latency_avg weighs every interval by its timeslices: total wait over total timeslices.
+    """
+    wait = reduction.per_core_wait
+    timeslices = reduction.overall_timeslices.sum()
+    return {'per_core_wait_min': float(wait.min()),
+            'per_core_wait_avg': float(wait.mean()),
+            'per_core_wait_max': float(wait.max()),
+            'latency_avg': float(reduction.overall_wait.sum() / timeslices) if timeslices > 0 else 0.0,
+            'per_core_latency_max': float(reduction.per_core_latency.max())}
+
+
+PERCENTILES = (50, 90, 95, 99)
+HISTOGRAM_BINS = 10
+
+# (series name, title, value format, scale the series is divided by for display)
+DISTRIBUTION_SERIES = (
+    ('overall_user_sys', 'Overall CPU - user + sys + irq', '{0:.1f}%', 1),
+    ('per_core_user_sys', 'Per CPU - user + sys', '{0:.1f}%', 1),
+    ('mem_used', 'Memory in use (MiB)', '{0:.1f}', 1024),
+)
+
+# kB within which memory in use quantiles are sketched, and its bucket count bound: 4 GiB of
+# range before the lowest buckets collapse.
+MEM_USED_SKETCH_ACCURACY = 16
+MEM_USED_SKETCH_BUCKETS = 131072
+
+DISTRIBUTION_SUMMARY_FORMATS = tuple(('{0}_p{1}'.format(name, percentile),
+                                      '{0} p{1}: {2}'.format(title, percentile, value_format))
+                                     for name, title, value_format, _ in DISTRIBUTION_SERIES
+                                     for percentile in PERCENTILES)
+
+
+def computeDistributionMetrics(distributions):
+    """Percentile metrics keyed as in DISTRIBUTION_SUMMARY_FORMATS from a QuantileSketch or
+       ExactDistribution of every series in DISTRIBUTION_SERIES.
+    """
+    metrics = {}
+    for name, _, _, scale in DISTRIBUTION_SERIES:
+        for percentile in PERCENTILES:
+            metrics['{0}_p{1}'.format(name, percentile)] = distributions[name].getQuantile(percentile / 100) / scale
+    return metrics
+
+
+def formatHistograms(distributions):
+    """One line per series in DISTRIBUTION_SERIES with the share of values in each of HISTOGRAM_BINS bins.
+
+       CPU bins split 0-100%, memory bins the range between the lowest and highest value.
+    """
+    lines = []
+    for name, title, value_format, scale in DISTRIBUTION_SERIES:
+        distribution = distributions[name]
+        if value_format.endswith('%'):
+            edges = np.linspace(0, 100, HISTOGRAM_BINS + 1)
+        else:
+            edges = np.linspace(distribution.min, max(distribution.max, distribution.min + 1), HISTOGRAM_BINS + 1)
+        counts = distribution.getHistogram(edges)
+        bins = ', '.join('{0:.1f}-{1:.1f}: {2:.1f}%'.format(edges[i] / scale, edges[i + 1] / scale,
+                                                            100 * counts[i] / distribution.count)
+                         for i in xrange(HISTOGRAM_BINS))
+        lines.append('{0} histogram: {1}'.format(title, bins))
+    return '\n'.join(lines)
+
+
+def formatSummary(metrics, start, end, distributions=None):
+    """Lines of SUMMARY_FORMATS, then those of DISTRIBUTION_SUMMARY_FORMATS and SCHEDSTAT_SUMMARY_FORMATS
+       whose metrics are present, then the histograms of distributions if given.
+    """
+    res = 'Stats Range: From {0}s to {1}s\n'.format(start, end)
+    res += '\n'.join(line.format(metrics[key])
+                     for key, line in SUMMARY_FORMATS + DISTRIBUTION_SUMMARY_FORMATS + SCHEDSTAT_SUMMARY_FORMATS
+                     if key in metrics)
+    if distributions is not None:
+        res += '\n' + formatHistograms(distributions)
+    return res
+
+
+TOP_PROCESS_RANKINGS = (
+    ('cpu_avg', 'CPU avg'),
+    ('cpu_max', 'CPU max'),
+    ('res_avg', 'RES avg'),
+    ('res_max', 'RES max'),
+)
+
+
+def formatTopProcesses(top_table, count):
+    """Top count processes by each of TOP_PROCESS_RANKINGS, averages being over the samples that list them."""
+    stats = top_table.getProcessStats()
+    res = ''
+    for key, title in TOP_PROCESS_RANKINGS:
+        res += 'Top processes by {0}:\n'.format(title)
+        for process in top_table.getTopProcesses(count, key, stats):
+            pid, command = top_table.processes[process]
+            res += '{0:>6} {1}: CPU avg {2:.1f}% max {3:.1f}%, RES avg {4:.1f} MiB max {5:.1f} MiB\n'.format(
+                pid, command, stats['cpu_avg'][process], stats['cpu_max'][process],
+                stats['res_avg'][process] / 1024, stats['res_max'][process] / 1024)
+    return res
+
 
 class ResourceUsageStats(object):
 
+    EXPORT_FORMATS = {'.csv': 'exportCSV', '.npz': 'exportNpz', '.npy': 'exportNpy', '.jsonl': 'exportJSONLines'}
 
-    def __init__(self, cpu_stats_list, mem_stats_list):
+    # Schedstat series of getColumns(), which have a row per schedstat interval rather than per CPU interval.
+    SCHEDSTAT_COLUMNS = ('per_core_wait', 'per_core_latency', 'latency')
+
+
+    def __init__(self, cpu_stats_list, mem_stats_list, schedstat_list=None, resample=None):
+        """resample, in seconds, reports on the ResampledReduction of the series instead: summary and
+           exports then have a row per bucket, exports adding the min and max within it.
+        """
+        if resample is not None and schedstat_list is not None:
+            raise Exception('schedstat series cannot be resampled')
         self.cpu_stats_list = cpu_stats_list
         self.mem_stats_list = mem_stats_list
+        self.schedstat_list = schedstat_list
+        self.resample = resample
+        self._reduction = None
         
-    def exportCSV(self):
-        file_path = 'stats_%s.csv' % datetime.now().strftime('%y_%m_%d-%H_%M_%S')
-        cpu_count = self._getCpuCoreCount()
-        with open (file_path, 'w') as f:
-            #write titles to csv
-            titles = 'time,overall cpu'
-            for i in xrange(cpu_count):
-                titles += ',' + 'cpu' + str(i)
-            titles += ',mem\n'
-            f.write(titles)
-            #fill data to csv
-            overall_cpu_user_sys_usages = self._getOverallCpuUserSysUsages()
-            per_core_user_sys_stats = self._getPerCoreUserSysStats()
-            mem_used_stats = self._getMemUsedStats()
-            for i in xrange(self._getCpuStatsCount()):
-                date = cpu_stats_list[i+1].date.strftime('%y/%m/%d-%H:%M:%S')
-                output = str(date)
-                output += ',' + str(overall_cpu_user_sys_usages[i])
-                for j in xrange(cpu_count):
-                    output += ',' + str(per_core_user_sys_stats[i][j])
-                output += ',' + str(mem_used_stats[i+1])
-                f.write(output + '\n')
-            
+    def export(self, file_path):
+        """Exports to file_path in the format of its extension, one of EXPORT_FORMATS."""
+        extension = os.path.splitext(file_path)[1]
+        if extension not in self.EXPORT_FORMATS:
+            raise Exception('unknown export format {0}, expected one of {1}'.format(
+                extension, ', '.join(sorted(self.EXPORT_FORMATS))))
+        return getattr(self, self.EXPORT_FORMATS[extension])(file_path)
+
+    def exportCSV(self, file_path=None, batch_rows=4096):
+        """Writes a row per interval to file_path, stats_<date>.csv by default, batch_rows at a time.
+
+           Cells are the repr of the reduced series; the memory in use and schedstat cells of an
+           interval without a sample of their own at its end are left empty.
+        """
+        if file_path is None:
+            file_path = 'stats_%s.csv' % datetime.now().strftime('%y_%m_%d-%H_%M_%S')
+        reduction = self._getReduction()
+        titles = ['time', 'overall cpu'] + ['cpu' + str(i) for i in xrange(reduction.core_count)] + ['mem']
+        columns = np.column_stack((reduction.overall_user_sys, reduction.per_core_user_sys))
+        mem_rows, mem_found = self._alignRows(reduction.mem_timestamps, reduction.timestamps)
+        mem_cells = [str(value) if found else '' for value, found in
+                     zip(reduction.mem_used[mem_rows].tolist(), mem_found.tolist())]
+        if self.resample is not None:
+            titles[-1:-1] = ['overall cpu min', 'overall cpu max']
+            columns = np.column_stack((columns, reduction.minimums['overall_user_sys'],
+                                       reduction.maximums['overall_user_sys']))
+            titles += ['mem min', 'mem max']
+            mem_cells = [cell + (',{0},{1}'.format(low, high) if found else ',,') for cell, low, high, found in
+                         zip(mem_cells, reduction.minimums['mem_used'][mem_rows].tolist(),
+                             reduction.maximums['mem_used'][mem_rows].tolist(), mem_found.tolist())]
+        schedstat_columns = None
+        if self._hasSchedstat():
+            titles += ['cpu' + str(i) + ' run queue wait ms' for i in xrange(reduction.per_core_wait.shape[1])]
+            titles.append('latency per timeslice ms')
+            schedstat_rows, schedstat_found = self._alignRows(reduction.schedstat_timestamps, reduction.timestamps)
+            schedstat_columns = np.column_stack((reduction.per_core_wait, reduction.latency))[schedstat_rows]
+            schedstat_missing = ',' * schedstat_columns.shape[1]
+        dates = self._formatDates(reduction.timestamps, '%y/%m/%d-%H:%M:')
+        with open(file_path, 'w') as f:
+            f.write(','.join(titles) + '\n')
+            for begin in xrange(0, len(reduction.timestamps), batch_rows):
+                stop = begin + batch_rows
+                rows = [date + ',' + ','.join(map(repr, values)) + ',' + mem for date, values, mem in
+                        zip(dates[begin:stop], columns[begin:stop].tolist(), mem_cells[begin:stop])]
+                if schedstat_columns is not None:
+                    rows = [row + (',' + ','.join(map(repr, values)) if found else schedstat_missing)
+                            for row, values, found in zip(rows, schedstat_columns[begin:stop].tolist(),
+                                                          schedstat_found[begin:stop].tolist())]
+                f.write('\n'.join(rows) + '\n')
+        return file_path
+
+    def getColumns(self):
+        """(name, array) of every exported series: per-interval CPU percentages, overall and per
+           core (intervals x cores), timestamped by cpu_timestamps; the (samples x meminfo_keys)
+           kB matrix and memory in use timestamped by mem_timestamps; and the schedstat series.
+           Resampled, there is a row per bucket and <series>_min and <series>_max follow every series.
+        """
+        reduction = self._getReduction()
+        columns = [('cpu_timestamps', reduction.timestamps),
+                   ('overall_user', reduction.overall_user),
+                   ('overall_sys', reduction.overall_sys),
+                   ('overall_user_sys', reduction.overall_user_sys),
+                   ('per_core_user', reduction.per_core_user),
+                   ('per_core_sys', reduction.per_core_sys),
+                   ('per_core_user_sys', reduction.per_core_user_sys),
+                   ('mem_timestamps', reduction.mem_timestamps),
+                   ('meminfo_keys', np.array(reduction.meminfo_keys, dtype=str)),
+                   ('meminfo', reduction.meminfo),
+                   ('mem_used', reduction.mem_used)]
+        if self.resample is None:
+            irq = CpuStats(self.cpu_stats_list, reduction.core_count).getIrqPercentages()
+            columns[3:3] = [('overall_irq', irq[:, 0])]
+            columns[7:7] = [('per_core_irq', irq[:, 1:reduction.core_count + 1])]
+        else:
+            columns = [column for name, values in columns for column in
+                       [(name, values)] + ([(name + '_min', reduction.minimums[name]),
+                                            (name + '_max', reduction.maximums[name])]
+                                           if name in reduction.minimums else [])]
+        if self._hasSchedstat():
+            columns += [('schedstat_timestamps', reduction.schedstat_timestamps),
+                        ('per_core_wait', reduction.per_core_wait),
+                        ('per_core_latency', reduction.per_core_latency),
+                        ('latency', reduction.latency)]
+        return columns
+
+    def exportNpz(self, file_path):
+        """Saves getColumns() to a .npz archive."""
+        np.savez(file_path, **dict(self.getColumns()))
+        return file_path
+
+    def exportNpy(self, file_path):
+        """Saves a structured array with a record per interval to a .npy file.
+
+           Every per-interval column of getColumns() is a field, per-core ones holding a subarray,
+           and the meminfo field is the /proc/meminfo sample at the end of the interval, a field per
+           key, along with mem_used; meminfo_found tells the intervals that have one. Likewise the
+           schedstat series are those of the schedstat interval ending with the interval, and
+           schedstat_found tells the intervals that have one.
+        """
+        columns = self._getIntervalColumns()
+        reduction = self._getReduction()
+        mem_rows, mem_found = self._alignRows(reduction.mem_timestamps, columns[0][1])
+        schedstat_columns, schedstat_found = self._getSchedstatColumns(columns[0][1])
+        if schedstat_columns:
+            columns += [(name, np.where(schedstat_found.reshape((-1,) + (1,) * (values.ndim - 1)), values, 0))
+                        for name, values in schedstat_columns] + [('schedstat_found', schedstat_found)]
+        dtype = [(name, values.dtype, values.shape[1:]) for name, values in columns]
+        dtype += [('meminfo', [(key, reduction.meminfo.dtype) for key in reduction.meminfo_keys]),
+                  ('mem_used', reduction.mem_used.dtype), ('meminfo_found', np.bool_)]
+        records = np.zeros(len(columns[0][1]), dtype=dtype)
+        for name, values in columns:
+            records[name] = values
+        for i, key in enumerate(reduction.meminfo_keys):
+            records['meminfo'][key] = np.where(mem_found, reduction.meminfo[mem_rows, i], 0)
+        records['mem_used'] = np.where(mem_found, reduction.mem_used[mem_rows], 0)
+        records['meminfo_found'] = mem_found
+        np.save(file_path, records)
+        return file_path
+
+    def exportJSONLines(self, file_path, batch_rows=4096):
+        """Writes a JSON object per interval to file_path, with the fields of exportNpy; meminfo maps
+           keys to kB values and is left out with mem_used when the interval has no sample at its end,
+           and so are the schedstat series when it has no schedstat interval ending with it.
+        """
+        columns = self._getIntervalColumns()
+        reduction = self._getReduction()
+        mem_rows, mem_found = self._alignRows(reduction.mem_timestamps, columns[0][1])
+        schedstat_columns, schedstat_found = self._getSchedstatColumns(columns[0][1])
+        names = [name for name, _ in columns]
+        schedstat_names = [name for name, _ in schedstat_columns]
+        with open(file_path, 'w') as f:
+            for begin in xrange(0, len(columns[0][1]), batch_rows):
+                stop = begin + batch_rows
+                schedstat_values = zip(*[column[begin:stop].tolist() for _, column in schedstat_columns])
+                lines = []
+                for i, values in enumerate(zip(*[column[begin:stop].tolist() for _, column in columns]), begin):
+                    record = dict(zip(names, values))
+                    if mem_found[i]:
+                        record['meminfo'] = dict(zip(reduction.meminfo_keys, reduction.meminfo[mem_rows[i]].tolist()))
+                        record['mem_used'] = reduction.mem_used[mem_rows[i]].item()
+                    if schedstat_names and schedstat_found[i]:
+                        record.update(zip(schedstat_names, schedstat_values[i - begin]))
+                    lines.append(json.dumps(record, sort_keys=True))
+                f.write('\n'.join(lines) + '\n')
+        return file_path
+
+    def _getIntervalColumns(self):
+        columns = self.getColumns()
+        return [('timestamp', columns[0][1])] + \
+               [(name, values) for name, values in columns[1:]
+                if name.startswith(('overall_', 'per_core_')) and name not in self.SCHEDSTAT_COLUMNS]
+
+    def _getSchedstatColumns(self, interval_timestamps):
+        """(name, series) of SCHEDSTAT_COLUMNS aligned with interval_timestamps, and whether each
+           interval has a schedstat interval ending with it; no columns without schedstat series.
+        """
+        if not self._hasSchedstat():
+            return [], np.zeros(len(interval_timestamps), dtype=np.bool_)
+        reduction = self._getReduction()
+        rows, found = self._alignRows(reduction.schedstat_timestamps, interval_timestamps)
+        return [(name, getattr(reduction, name)[rows]) for name in self.SCHEDSTAT_COLUMNS], found
+
+    def _alignRows(self, timestamps, interval_timestamps):
+        """Rows of timestamps equal to each of interval_timestamps, and whether there is one."""
+        rows = np.minimum(np.searchsorted(timestamps, interval_timestamps), max(len(timestamps) - 1, 0))
+        if len(timestamps) == 0:
+            return rows, np.zeros(len(interval_timestamps), dtype=np.bool_)
+        return rows, timestamps[rows] == interval_timestamps
+
+    def _formatDates(self, timestamps, minute_format):
+        """Timestamps formatted as minute_format followed by the seconds, with milliseconds when any
+           timestamp has some, strftime running once per minute.
+        """
+        milliseconds = toMilliseconds(timestamps)
+        fractional = bool((milliseconds % 1000).any())
+        minutes = {}
+        dates = []
+        for millisecond in milliseconds.tolist():
+            seconds = millisecond // 1000
+            minute = seconds - seconds % 60
+            if minute not in minutes:
+                minutes[minute] = toDate(minute).strftime(minute_format)
+            if fractional:
+                dates.append('{0}{1:02d}.{2:03d}'.format(minutes[minute], seconds - minute, millisecond % 1000))
+            else:
+                dates.append('{0}{1:02d}'.format(minutes[minute], seconds - minute))
+        return dates
 
-    def getSummary(self, start, end):
-        res = 'Stats Range: From {0}s to {1}s\n'.format(start, end)
-        res += 'Overall CPU - user + sys + irq min: {0:.1f}%\n'.format(min(self._getOverallCpuUserSysUsages()))
-
-        res += 'Overall CPU - user + sys + irq avg: {0:.1f}%\n'.format(sum(self._getOverallCpuUserSysUsages()) / \
-                                                                       self._getCpuStatsCount())
-        res += 'Overall CPU - user + sys + irq max: {0:.1f}%\n'.format(max(self._getOverallCpuUserSysUsages()))
-        res += 'Overall CPU - user + sys + irq Max - Min: {0:.1f}%\n'.format(max(self._getOverallCpuUserSysUsages()) -  \
-                                                                             min(self._getOverallCpuUserSysUsages()))
-        res += 'Overall CPU - user + sys + irq Last - First: {0:.1f}%\n'.format((self._getOverallCpuUserSysUsages())[-1] - \
-                                                                                (self._getOverallCpuUserSysUsages())[0])
-
-        res += 'Overall CPU - user min: {0:.1f}%\n'.format(min(self._getOverallCpuUserUsages()))
-        res += 'Overall CPU - user avg: {0:.1f}%\n'.format(sum(self._getOverallCpuUserUsages()) / \
-                                                           self._getCpuStatsCount())
-        res += 'Overall CPU - user max: {0:.1f}%\n'.format(max(self._getOverallCpuUserUsages()))
-
-        res += 'Overall CPU - sys min: {0:.1f}%\n'.format(min(self._getOverallCpuSysUsages()))
-        res += 'Overall CPU - sys avg: {0:.1f}%\n'.format(sum(self._getOverallCpuSysUsages()) / \
-                                                          self._getCpuStatsCount())
-        res += 'Overall CPU - sys max: {0:.1f}%\n'.format(max(self._getOverallCpuSysUsages()))
-
-        res += 'Per CPU - user + sys min: {0:.1f}%\n'.format(min([min(x) for x in self._getPerCoreUserSysStats()]))
-        res += 'Per CPU - user + sys max: {0:.1f}%\n'.format(max([max(x) for x in self._getPerCoreUserSysStats()]))
-
-        res += 'Per CPU - user min: {0:.1f}%\n'.format(min([min(x) for x in self._getPerCoreUserStats()]))
-        res += 'Per CPU - user max: {0:.1f}%\n'.format(max([max(x) for x in self._getPerCoreUserStats()]))
-
-        res += 'Per CPU - sys min: {0:.1f}%\n'.format(min([min(x) for x in self._getPerCoreSysStats()]))
-        res += 'Per CPU - sys max: {0:.1f}%\n'.format(max([max(x) for x in self._getPerCoreSysStats()]))
-
-        res += 'Memory in use (MiB) min: {0:.1f}\n'.format(min(self._getMemUsedStats()) / 1024)
-        res += 'Memory in use (MiB) avg: {0:.1f}\n'.format((sum(self._getMemUsedStats()) / 1024) /
-                                                           self._getMemStatsCount())
-        res += 'Memory in use (MiB) max: {0:.1f}\n'.format(max(self._getMemUsedStats()) / 1024)
-
-        res += 'Memory in use (MiB) Max - Min : {0:.1f}\n'.format((max(self._getMemUsedStats()) - \
-                                                         min(self._getMemUsedStats()))  / 1024)
-        res += 'Memory in use (MiB) Last - First: {0:.1f}'.format(((self._getMemUsedStats())[-1] - \
-                                                                   (self._getMemUsedStats())[0]) / 1024)
-        return res
+    def getSummary(self, start, end, distribution=None):
+        """distribution 'sketch' or 'exact' adds percentiles and histograms, from QuantileSketches
+           or from the sorted series.
+        """
+        if distribution is None:
+            return formatSummary(self.getMetrics(), start, end)
+        distributions = self.getDistributions(distribution == 'exact')
+        return formatSummary(self.getMetrics(distributions), start, end, distributions)
+
+    def getMetrics(self, distributions=None):
+        """Returns every summary metric keyed as in SUMMARY_FORMATS, memory values in MiB, plus the
+           percentiles of distributions if given.
+        """
+        reduction = self._getReduction()
+        running_stats = {}
+        for name in SERIES_NAMES:
+            running_stats[name] = RunningStats()
+            running_stats[name].update(getattr(reduction, name))
+        metrics = computeSummaryMetrics(running_stats)
+        if distributions is not None:
+            metrics.update(computeDistributionMetrics(distributions))
+        if self._hasSchedstat():
+            metrics.update(computeSchedstatMetrics(reduction))
+        return metrics
+
+    def getDistributions(self, exact=False):
+        """QuantileSketch, or ExactDistribution if exact, of every series in DISTRIBUTION_SERIES."""
+        reduction = self._getReduction()
+        distributions = {}
+        for name, _, _, _ in DISTRIBUTION_SERIES:
+            if exact:
+                distributions[name] = ExactDistribution(getattr(reduction, name))
+            else:
+                distributions[name] = createQuantileSketch(name)
+                distributions[name].update(getattr(reduction, name))
+        return distributions
+
+    def getSpikeAnalysis(self, rules=DEFAULT_SPIKE_RULES, zscore_window=20, zscore_threshold=3.0):
+        """SpikeAnalysis of the series, which are not resampled for it."""
+        if self.resample is not None:
+            raise Exception('spikes are found in the series as sampled, not in resampled ones')
+        return SpikeAnalysis(self._getReduction(), rules, zscore_window, zscore_threshold)
+
+    def _getReduction(self):
+        if self._reduction is None and self.resample is not None:
+            self._reduction = ResampledReduction(self.cpu_stats_list, self.mem_stats_list, self.resample)
+        elif self._reduction is None:
+            self._reduction = StatsReduction(self.cpu_stats_list, self.mem_stats_list,
+                                             schedstat_list=self.schedstat_list if self._hasSchedstat() else None)
+        return self._reduction
+
+    def _hasSchedstat(self):
+        return self.schedstat_list is not None and len(self.schedstat_list) > 1
     
     def _getCpuCoreCount(self):
-        cpu_stats = CpuStats(self.cpu_stats_list)
-        return cpu_stats.getCpuCoreCount()
+        return self._getReduction().core_count
 
     def _getOverallCpuUserSysUsages(self):
-        return CpuOverallUserSysStats(CpuStats(self.cpu_stats_list))
+        return self._getReduction().overall_user_sys
 
     def _getCpuStatsCount(self):
         return len(self.cpu_stats_list) - 1
 
     def _getOverallCpuUserUsages(self):
-        return CpuOverallUserStats(CpuStats(self.cpu_stats_list))
+        return self._getReduction().overall_user
 
     def _getOverallCpuSysUsages(self):
-        return CpuOverallSysStats(CpuStats(self.cpu_stats_list))
+        return self._getReduction().overall_sys
 
     def _getPerCoreUserSysStats(self):
-        return CpuPerCoreUserSysStats(CpuStats(self.cpu_stats_list))
+        return self._getReduction().per_core_user_sys
     
     def _getPerCoreUserStats(self):
-        return CpuPerCoreUserStats(CpuStats(self.cpu_stats_list))
+        return self._getReduction().per_core_user
     
     def _getPerCoreSysStats(self):
-        return CpuPerCoreSysStats(CpuStats(self.cpu_stats_list))
+        return self._getReduction().per_core_sys
 
     def _getMemUsedStats(self):
-        return MemUsedStats(MemStats(self.mem_stats_list))
+        return self._getReduction().mem_used
 
     def _getMemStatsCount(self):
         return len(self.mem_stats_list)
 
 
+class StatsReduction(object):
+    """Materializes every series ResourceUsageStats reports on in a single pass over the samples.
+
+       CPU series hold one entry per consecutive pair of /proc/stat samples, timestamped by the
+       later sample, the earlier one being in interval_starts; per-core series are (intervals x
+       cores) arrays. Either list may be None to reduce only the other half; core_count overrides
+       the count taken from the first sample. The /proc/schedstat series, in milliseconds, are
+       only there when schedstat_list is given. Memory series and the (samples x meminfo_keys)
+       meminfo matrix are timestamped by mem_timestamps.
+    """
+
+
+    def __init__(self, cpu_stats_list, mem_stats_list, core_count=None, schedstat_list=None):
+        if cpu_stats_list is not None:
+            self._reduceCpuStats(CpuStats(cpu_stats_list, core_count))
+        if mem_stats_list is not None:
+            self._reduceMemStats(MemStats(mem_stats_list))
+        if schedstat_list is not None:
+            self._reduceSchedstat(SchedstatStats(schedstat_list))
+
+    def _reduceCpuStats(self, cpu_stats):
+        self.core_count = cpu_stats.getCpuCoreCount()
+        self.timestamps = cpu_stats.stats_list.timestamps[1:]
+        self.interval_starts = cpu_stats.stats_list.timestamps[:-1]
+        user = cpu_stats.getUserPercentages()
+        sys = cpu_stats.getSysPercentages()
+        user_sys = user + sys
+        cores = slice(1, self.core_count + 1)
+        self.overall_user = user[:, 0]
+        self.overall_sys = sys[:, 0]
+        self.overall_user_sys = user_sys[:, 0]
+        self.per_core_user = user[:, cores]
+        self.per_core_sys = sys[:, cores]
+        self.per_core_user_sys = user_sys[:, cores]
+
+    def _reduceMemStats(self, mem_stats):
+        self.mem_timestamps = mem_stats.stats_list.timestamps
+        self.meminfo_keys = mem_stats.stats_list.keys
+        self.meminfo = mem_stats.stats_list.values
+        self.mem_used = MemUsedStats(mem_stats).getUsedSeries()
+
+    def _reduceSchedstat(self, schedstat):
+        self.schedstat_timestamps = schedstat.stats_list.timestamps[1:]
+        wait = schedstat.getWaitTimes()
+        timeslices = schedstat.getTimesliceCounts()
+        self.per_core_wait = wait
+        self.per_core_latency = schedstat.getLatencies()
+        self.overall_wait = wait.sum(axis=1)
+        self.overall_timeslices = timeslices.sum(axis=1)
+        self.latency = np.where(self.overall_timeslices > 0,
+                                self.overall_wait / np.maximum(self.overall_timeslices, 1), 0.0)
+
+
+class ResampledReduction(object):
+    """StatsReduction series aggregated into buckets of bucket_seconds, aligned to the epoch.
+
+       Every series holds the bucket means, timestamped by the bucket starts, and minimums and
+       maximums hold the min and max of the series within each bucket. An interval belongs to the
+       bucket of its later sample. CPU means are computed from the jiffies the bucket accumulated,
+       i.e. the difference of the cumulative counters across it over that of all of them, rather
+       than by averaging the percentages of intervals of possibly different lengths.
+    """
+
+
+    def __init__(self, cpu_stats_list, mem_stats_list, bucket_seconds, core_count=None):
+        self.bucket_seconds = bucket_seconds
+        self.minimums = {}
+        self.maximums = {}
+        if cpu_stats_list is not None:
+            self._resampleCpuStats(CpuStats(cpu_stats_list, core_count))
+        if mem_stats_list is not None:
+            self._resampleMemStats(MemStats(mem_stats_list))
+
+    def _resampleCpuStats(self, cpu_stats):
+        reduction = StatsReduction(cpu_stats.stats_list, None, cpu_stats.core_count)
+        self.core_count = reduction.core_count
+        starts, self.timestamps = self._getBuckets(reduction.timestamps)
+        totals = np.add.reduceat(cpu_stats.getTotalDeltas(), starts) if len(starts) else cpu_stats.getTotalDeltas()
+        user = toPercentages(self._sumBuckets(cpu_stats.getDeltas(('user', 'nice')), starts), totals)
+        sys = toPercentages(self._sumBuckets(cpu_stats.getDeltas(('system', 'irq', 'softirq')), starts), totals)
+        user_sys = user + sys
+        cores = slice(1, self.core_count + 1)
+        self.overall_user = user[:, 0]
+        self.overall_sys = sys[:, 0]
+        self.overall_user_sys = user_sys[:, 0]
+        self.per_core_user = user[:, cores]
+        self.per_core_sys = sys[:, cores]
+        self.per_core_user_sys = user_sys[:, cores]
+        for name in CPU_SERIES + PER_CORE_SERIES:
+            self._setExtremes(name, getattr(reduction, name), starts)
+
+    def _resampleMemStats(self, mem_stats):
+        reduction = StatsReduction(None, mem_stats.stats_list)
+        starts, self.mem_timestamps = self._getBuckets(reduction.mem_timestamps)
+        counts = np.diff(np.append(starts, len(reduction.mem_timestamps)))
+        self.meminfo_keys = reduction.meminfo_keys
+        self.meminfo = self._sumBuckets(reduction.meminfo, starts) / counts[:, np.newaxis]
+        self.mem_used = self._sumBuckets(reduction.mem_used, starts) / counts
+        self._setExtremes('mem_used', reduction.mem_used, starts)
+
+    def _getBuckets(self, timestamps):
+        """Indexes of the first timestamp of every bucket, and the bucket start timestamps."""
+        buckets = np.floor(timestamps / self.bucket_seconds)
+        starts = np.flatnonzero(np.diff(buckets)) + 1 if len(buckets) else np.zeros(0, dtype=np.int64)
+        if len(buckets):
+            starts = np.insert(starts, 0, 0)
+        return starts, buckets[starts] * self.bucket_seconds
+
+    def _sumBuckets(self, values, starts):
+        if len(starts) == 0: return values[:0].astype(np.float64)
+        return np.add.reduceat(values, starts, axis=0).astype(np.float64)
+
+    def _setExtremes(self, name, values, starts):
+        if len(starts) == 0:
+            self.minimums[name] = self.maximums[name] = values[:0]
+            return
+        self.minimums[name] = np.minimum.reduceat(values, starts, axis=0)
+        self.maximums[name] = np.maximum.reduceat(values, starts, axis=0)
+
+
+def parseDuration(text, allow_zero=False):
+    """Seconds of a duration such as 30s, 1m, 2h or 1d; a plain number is in seconds."""
+    m = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*([smhd]?)\s*$', text)
+    if m is None:
+        raise Exception('invalid duration ' + text)
+    seconds = float(m.group(1)) * {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}[m.group(2)]
+    if seconds <= 0 and not allow_zero:
+        raise Exception('duration must be positive: ' + text)
+    return seconds
+
+
+class SparseTable(object):
+    """Range min or max of a series in constant time.
+
+       The series is cut in blocks of BLOCK_SIZE; a sparse table over the block extremes answers
+       the whole blocks of a range with two lookups, and the at most two partial blocks at its
+       ends are scanned, keeping memory at n / BLOCK_SIZE * log(n) rather than n * log(n).
+    """
+
+    BLOCK_SIZE = 64
+
+
+    def __init__(self, values, function=np.minimum):
+        self.values = values
+        self.function = function
+        block_count = len(values) // self.BLOCK_SIZE
+        blocks = function.reduceat(values[:block_count * self.BLOCK_SIZE], np.arange(0, block_count * self.BLOCK_SIZE,
+                                                                                    self.BLOCK_SIZE)) \
+            if block_count else values[:0]
+        self.levels = [blocks]
+        width = 1
+        while 2 * width <= block_count:
+            previous = self.levels[-1]
+            self.levels.append(function(previous[:-width], previous[width:]))
+            width *= 2
+
+    def query(self, begin, end):
+        """Extreme of values[begin:end], which must not be empty."""
+        first_block = -(-begin // self.BLOCK_SIZE)
+        last_block = end // self.BLOCK_SIZE
+        if last_block - first_block < 1:
+            return self.function.reduce(self.values[begin:end])
+        level = int(math.log(last_block - first_block, 2))
+        res = self.function(self.levels[level][first_block], self.levels[level][last_block - (1 << level)])
+        if begin < first_block * self.BLOCK_SIZE:
+            res = self.function(res, self.function.reduce(self.values[begin:first_block * self.BLOCK_SIZE]))
+        if end > last_block * self.BLOCK_SIZE:
+            res = self.function(res, self.function.reduce(self.values[last_block * self.BLOCK_SIZE:end]))
+        return res
+
+
+class WindowIndex(object):
+    """Summary metrics of any [start, end) window of a log from a single parse and reduction.
+
+       Windows select samples as --start/--end do. Averages come from prefix sums of the series, and
+       range min and max from SparseTables, so every window costs a few lookups whatever its length.
+       When the dates of the log are not in order, e.g. the wall clock was set back, every window is
+       instead selected with isInWindow and reduced on its own.
+    """
+
+
+    def __init__(self, cpu_stats_list, mem_stats_list):
+        if not isinstance(mem_stats_list, ProcMeminfoTable):
+            mem_stats_list = ProcMeminfoTable.fromDataList(mem_stats_list)
+        if not isinstance(cpu_stats_list, ProcStatTable):
+            cpu_stats_list = ProcStatTable.fromDataList(cpu_stats_list)
+        firsts = [table.timestamps[0] for table in (cpu_stats_list, mem_stats_list) if len(table)]
+        self.origin = min(firsts) if firsts else 0
+        self.cpu_elapsed = getElapsedSeconds(cpu_stats_list.timestamps, self.origin)
+        self.mem_elapsed = getElapsedSeconds(mem_stats_list.timestamps, self.origin)
+        self.tables = None
+        if np.any(np.diff(self.cpu_elapsed) < 0) or np.any(np.diff(self.mem_elapsed) < 0):
+            self.tables = (cpu_stats_list, mem_stats_list)
+            return
+        reduction = StatsReduction(cpu_stats_list, mem_stats_list)
+        self.series = {}
+        self.sums = {}
+        self.minimums = {}
+        self.maximums = {}
+        for name in CPU_SERIES + ('mem_used',):
+            self._addSeries(name, getattr(reduction, name), getattr(reduction, name), getattr(reduction, name))
+        for name in PER_CORE_SERIES:
+            values = getattr(reduction, name)
+            self._addSeries(name, None, values.min(axis=1), values.max(axis=1))
+
+    def getMetrics(self, start, end):
+        """Same metrics as ResourceUsageStats.getMetrics of the window parsed on its own."""
+        if self.tables is not None:
+            return self._getWindowMetrics(start, end)
+        cpu_begin, cpu_end = self._findSamples(self.cpu_elapsed, start, end)
+        mem_begin, mem_end = self._findSamples(self.mem_elapsed, start, end)
+        if cpu_end - cpu_begin < 2 or mem_end - mem_begin < 1:
+            raise Exception('Not enough data for calculation')
+        metrics = {}
+        begin, end = cpu_begin, cpu_end - 1
+        for name in CPU_SERIES:
+            metrics.update(self._getSeriesMetrics(name, begin, end))
+        for name in PER_CORE_SERIES:
+            metrics[name + '_min'] = float(self.minimums[name].query(begin, end))
+            metrics[name + '_max'] = float(self.maximums[name].query(begin, end))
+        for key, value in self._getSeriesMetrics('mem_used', mem_begin, mem_end).iteritems():
+            metrics[key] = value / 1024
+        return metrics
+
+    def getSummary(self, start, end):
+        return formatSummary(self.getMetrics(start, end), start, end)
+
+    def _getWindowMetrics(self, start, end):
+        cpu_stats_list, mem_stats_list = [table.selectWindow(self.origin, start, end) for table in self.tables]
+        if len(cpu_stats_list) < 2 or len(mem_stats_list) < 1:
+            raise Exception('Not enough data for calculation')
+        return ResourceUsageStats(cpu_stats_list, mem_stats_list).getMetrics()
+
+    def _addSeries(self, name, values, minimums, maximums):
+        if values is not None:
+            self.series[name] = values
+            self.sums[name] = np.concatenate(([0], np.cumsum(values)))
+        self.minimums[name] = SparseTable(minimums, np.minimum)
+        self.maximums[name] = SparseTable(maximums, np.maximum)
+
+    def _findSamples(self, elapsed, start, end):
+        if start < 0: start = 0
+        begin = np.searchsorted(elapsed, start)
+        return begin, len(elapsed) if end < 0 else max(begin, np.searchsorted(elapsed, end))
+
+    def _getSeriesMetrics(self, name, begin, end):
+        values = self.series[name]
+        series_min = self.minimums[name].query(begin, end)
+        series_max = self.maximums[name].query(begin, end)
+        return {name + '_min': float(series_min),
+                name + '_avg': float(self.sums[name][end] - self.sums[name][begin]) / (end - begin),
+                name + '_max': float(series_max),
+                name + '_range': float(series_max - series_min),
+                name + '_change': float(values[end - 1] - values[begin])}
+
+
+def parseWindows(text):
+    """(name, start, end) windows of --windows.
+
+       text is either a comma separated list of [name=]start:end, end -1 leaving the window open,
+       or the path of a phase marker file, whose lines hold a name, a start and optionally an end;
+       a phase without an end lasts until the next one starts, the last one until the end of the
+       log. Blank lines and lines starting with # are ignored.
+    """
+    windows = []
+    if os.path.isfile(text):
+        with open(text, 'r') as f:
+            markers = [line.split() for line in f if line.strip() and not line.lstrip().startswith('#')]
+        for i, fields in enumerate(markers):
+            if len(fields) not in (2, 3):
+                raise Exception('phase marker lines are "name start [end]": ' + ' '.join(fields))
+            if len(fields) == 3:
+                end = int(fields[2])
+            else:
+                end = int(markers[i + 1][1]) if i + 1 < len(markers) else -1
+            windows.append((fields[0], int(fields[1]), end))
+        return windows
+    for item in text.split(','):
+        name, _, bounds = item.strip().rpartition('=')
+        m = re.match(r'^(-?[0-9]+):(-?[0-9]+)$', bounds)
+        if m is None:
+            raise Exception('windows are [name=]start:end: ' + item)
+        windows.append((name or None, int(m.group(1)), int(m.group(2))))
+    return windows
+
+
+def findRuns(mask):
+    """begin and end indexes, end excluded, of the runs of True of the boolean array mask."""
+    edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+def computeRollingZScores(values, window):
+    """z-score of every value against the mean and standard deviation of the window values before it;
+       NaN for the first window values. After window equal values, a value equal to them scores 0
+       and any other one an infinite z-score.
+
+       Window sums are differences of the cumulative sums of the centered values and of their squares,
+       so each value costs O(1) whatever the window. Variances within the rounding error of these sums
+       count as 0.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    zscores = np.full(len(values), np.nan)
+    if len(values) <= window: return zscores
+    centered = values - values.mean()
+    sums = np.concatenate(([0.0], np.cumsum(centered)))
+    squares = np.concatenate(([0.0], np.cumsum(centered * centered)))
+    count = len(values)
+    mean = (sums[window:count] - sums[:count - window]) / window
+    variance = (squares[window:count] - squares[:count - window]) / window - mean * mean
+    noise = count * 1e-14 * np.max(np.abs(centered)) ** 2
+    deviation = centered[window:] - mean
+    flat = variance <= noise
+    with np.errstate(divide='ignore', invalid='ignore'):
+        flat_zscores = np.where(np.abs(deviation) <= np.sqrt(noise), 0.0, deviation / 0.0)
+    zscores[window:] = np.where(flat, flat_zscores, deviation / np.sqrt(np.where(flat, 1.0, variance)))
+    return zscores
+
+
+def computeGrowthSlope(timestamps, values):
+    """Least-squares slope of values over timestamps, per hour; 0 without two distinct timestamps."""
+    hours = (np.asarray(timestamps, dtype=np.float64) - np.mean(timestamps)) / 3600
+    denominator = (hours * hours).sum()
+    if denominator == 0: return 0.0
+    return float((hours * (values - np.mean(values))).sum() / denominator)
+
+
+def parseSpikeRule(text):
+    """(series, threshold, min_duration) of a series:threshold:duration --spikes rule."""
+    fields = text.split(':')
+    if len(fields) != 3 or fields[0] not in SERIES_NAMES:
+        raise Exception('rules are series:threshold:duration, series being one of ' + ', '.join(SERIES_NAMES))
+    try:
+        return fields[0], float(fields[1]), parseDuration(fields[2], allow_zero=True)
+    except ValueError:
+        raise Exception('invalid threshold ' + fields[1])
+
+
+class SpikeAnalysis(object):
+    """Spike episodes, rolling z-score anomalies and memory growth of a StatsReduction.
+
+       Every rule (series, threshold, min_duration) yields the runs of consecutive values at or
+       above threshold lasting min_duration seconds or more, per core for per-core series. A CPU
+       value covers the interval ending at its timestamp, so its episodes start with the first
+       interval; memory values are instants and thresholds on them are in MiB. Anomalies are the
+       runs of ZSCORE_SERIES values whose z-score against the zscore_window values before them
+       reaches zscore_threshold in magnitude. Each series is analyzed in one vectorized pass.
+    """
+
+
+    def __init__(self, reduction, rules=DEFAULT_SPIKE_RULES, zscore_window=20, zscore_threshold=3.0):
+        self.reduction = reduction
+        self.rules = rules
+        self.zscore_window = zscore_window
+        self.zscore_threshold = zscore_threshold
+        self._fractional = None
+
+    def getEpisodes(self):
+        """An episode dict per spike, by start: series, core (None for overall series), start and end
+           timestamps, duration in seconds, peak and mean.
+        """
+        episodes = []
+        for series, threshold, min_duration in self.rules:
+            starts, ends, values = self._getSeries(series)
+            if series == 'mem_used': threshold *= 1024
+            columns = [(None, values)] if values.ndim == 1 else enumerate(values.T)
+            for core, column in columns:
+                for begin, end in zip(*findRuns(column >= threshold)):
+                    duration = float(ends[end - 1] - starts[begin])
+                    if duration < min_duration: continue
+                    episode = column[begin:end]
+                    scale = 1024 if series == 'mem_used' else 1
+                    episodes.append({'series': series, 'core': core, 'start': float(starts[begin]),
+                                     'end': float(ends[end - 1]), 'duration': duration,
+                                     'peak': float(episode.max()) / scale, 'mean': float(episode.mean()) / scale})
+        return sorted(episodes, key=lambda episode: episode['start'])
+
+    def getAnomalies(self):
+        """An anomaly dict per run of outlying values, by start: series, start and end timestamps, the
+           z-score of largest magnitude and the value it was reached with.
+        """
+        anomalies = []
+        for series in ZSCORE_SERIES:
+            starts, ends, values = self._getSeries(series)
+            zscores = computeRollingZScores(values, self.zscore_window)
+            with np.errstate(invalid='ignore'):
+                outlying = np.abs(zscores) >= self.zscore_threshold
+            for begin, end in zip(*findRuns(outlying)):
+                peak = begin + np.argmax(np.abs(zscores[begin:end]))
+                anomalies.append({'series': series, 'start': float(starts[begin]), 'end': float(ends[end - 1]),
+                                  'zscore': float(zscores[peak]),
+                                  'value': float(values[peak]) / (1024 if series == 'mem_used' else 1)})
+        return sorted(anomalies, key=lambda anomaly: anomaly['start'])
+
+    def getMemoryGrowth(self):
+        """Least-squares growth of the memory in use, in KiB per hour."""
+        return computeGrowthSlope(self.reduction.mem_timestamps, self.reduction.mem_used)
+
+    def getReport(self):
+        return {'episodes': self.getEpisodes(), 'anomalies': self.getAnomalies(),
+                'mem_used_growth_kib_per_hour': self.getMemoryGrowth()}
+
+    def format(self):
+        lines = []
+        episodes = self.getEpisodes()
+        for series, threshold, min_duration in self.rules:
+            matching = [episode for episode in episodes if episode['series'] == series]
+            lines.append('Spikes of {0} >= {1:g}{2} for {3:g}s or more: {4}'.format(
+                series, threshold, ' MiB' if series == 'mem_used' else '%', min_duration, len(matching)))
+            for episode in matching:
+                lines.append('  {0}{1} - {2} ({3:g}s): peak {4:.1f}, mean {5:.1f}'.format(
+                    '' if episode['core'] is None else 'cpu{0} '.format(episode['core']),
+                    self._formatTimestamp(episode['start']), self._formatTimestamp(episode['end']),
+                    episode['duration'], episode['peak'], episode['mean']))
+        anomalies = self.getAnomalies()
+        lines.append('Anomalies, |z-score| >= {0:g} over the previous {1} values: {2}'.format(
+            self.zscore_threshold, self.zscore_window, len(anomalies)))
+        for anomaly in anomalies:
+            lines.append('  {0} {1} - {2}: z-score {3:.1f} at {4:.1f}'.format(
+                anomaly['series'], self._formatTimestamp(anomaly['start']), self._formatTimestamp(anomaly['end']),
+                anomaly['zscore'], anomaly['value']))
+        lines.append('Memory in use growth: {0:+.1f} KiB/hour'.format(self.getMemoryGrowth()))
+        return '\n'.join(lines)
+
+    def _getSeries(self, series):
+        """Start and end timestamps of the values of series, and the values."""
+        reduction = self.reduction
+        if series == 'mem_used':
+            return reduction.mem_timestamps, reduction.mem_timestamps, reduction.mem_used
+        return reduction.interval_starts, reduction.timestamps, getattr(reduction, series)
+
+    def _formatTimestamp(self, timestamp):
+        """Date of timestamp, with milliseconds when any timestamp of the reduction has some."""
+        if self._fractional is None:
+            milliseconds = toMilliseconds(np.concatenate((self.reduction.timestamps, self.reduction.mem_timestamps)))
+            self._fractional = bool((milliseconds % 1000).any())
+        millisecond = int(toMilliseconds(timestamp))
+        date = toDate(millisecond // 1000).strftime('%y/%m/%d-%H:%M:%S')
+        return date + '.{0:03d}'.format(millisecond % 1000) if self._fractional else date
+
+
+class RunningStats(object):
+    """Online min/max/sum/count and first/last of a series fed in chunks along axis 0.
+
+       Per-core series keep one accumulator per core, so min/max/sum/first/last are then arrays.
+    """
+
+
+    def __init__(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.sum = None
+        self.first = None
+        self.last = None
+
+    def update(self, chunk):
+        if len(chunk) == 0: return
+        chunk_min = chunk.min(axis=0)
+        chunk_max = chunk.max(axis=0)
+        chunk_sum = chunk.sum(axis=0)
+        if self.count == 0:
+            self.min = chunk_min
+            self.max = chunk_max
+            self.sum = chunk_sum
+            self.first = chunk[0]
+        else:
+            self.min = np.minimum(self.min, chunk_min)
+            self.max = np.maximum(self.max, chunk_max)
+            self.sum = self.sum + chunk_sum
+        self.last = chunk[-1]
+        self.count += len(chunk)
+
+
+class QuantileSketch(object):
+    """Mergeable quantile sketch whose quantiles are within relative_accuracy of the exact ones.
+
+       As in DDSketch, a value x > 0 is counted in bucket ceil(log(x) / log(gamma)), gamma being
+       (1 + relative_accuracy) / (1 - relative_accuracy), and a bucket is read back as the value
+       within relative_accuracy of everything it holds. Values <= 0 share a zero bucket. Beyond
+       max_buckets the lowest buckets are collapsed, which only costs accuracy at the low end, so
+       memory stays bounded however many values are added.
+
+       With absolute_accuracy the buckets are instead 2 * absolute_accuracy wide, x being counted
+       in bucket floor(x / width), for series such as memory whose range is narrow next to their
+       values.
+    """
+
+
+    def __init__(self, relative_accuracy=0.01, max_buckets=2048, absolute_accuracy=None):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.width = None if absolute_accuracy is None else 2.0 * absolute_accuracy
+        self.buckets = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        """Adds the values of an array of any shape."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if len(values) == 0: return
+        positive = values[values > 0] if self.width is None else values
+        if len(positive):
+            if self.width is None:
+                keys = np.ceil(np.log(positive) / math.log(self.gamma))
+            else:
+                keys = np.floor(positive / self.width)
+            keys, counts = np.unique(keys.astype(np.int64), return_counts=True)
+            for key, count in zip(keys.tolist(), counts.tolist()):
+                self.buckets[key] = self.buckets.get(key, 0) + count
+            self._collapse()
+        self.zero_count += len(values) - len(positive)
+        self._addCount(len(values), float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        """Adds the values of another sketch with the same accuracy."""
+        if other.gamma != self.gamma or other.width != self.width:
+            raise Exception('cannot merge quantile sketches of different accuracy')
+        if other.count == 0: return
+        for key, count in other.buckets.iteritems():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+        self._collapse()
+        self.zero_count += other.zero_count
+        self._addCount(other.count, other.min, other.max)
+
+    def getQuantile(self, quantile):
+        """Value of rank quantile * (count - 1), quantile being in [0, 1]."""
+        if self.count == 0:
+            raise Exception('no value in quantile sketch')
+        rank = quantile * (self.count - 1)
+        if rank < self.zero_count:
+            return min(0.0, self.max)
+        cumulative = self.zero_count
+        for key in sorted(self.buckets):
+            cumulative += self.buckets[key]
+            if cumulative > rank:
+                return min(max(self._getBucketValue(key), self.min), self.max)
+        return self.max
+
+    def getHistogram(self, edges):
+        """Value counts of the bins between consecutive edges; values outside go to the end bins."""
+        counts = np.zeros(len(edges) - 1, dtype=np.int64)
+        keys = sorted(self.buckets)
+        values = [0.0] + [self._getBucketValue(key) for key in keys]
+        bins = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, len(counts) - 1)
+        np.add.at(counts, bins, [self.zero_count] + [self.buckets[key] for key in keys])
+        return counts
+
+    def _getBucketValue(self, key):
+        if self.width is not None:
+            return (key + 0.5) * self.width
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def _addCount(self, count, values_min, values_max):
+        self.min = values_min if self.count == 0 else min(self.min, values_min)
+        self.max = values_max if self.count == 0 else max(self.max, values_max)
+        self.count += count
+
+    def _collapse(self):
+        if len(self.buckets) <= self.max_buckets: return
+        keys = sorted(self.buckets)
+        lowest = keys[len(keys) - self.max_buckets]
+        for key in keys[:len(keys) - self.max_buckets]:
+            self.buckets[lowest] += self.buckets.pop(key)
+
+
+def createQuantileSketch(name):
+    """QuantileSketch of the DISTRIBUTION_SERIES name. Memory in use, in kB, is sketched within
+       MEM_USED_SKETCH_ACCURACY kB rather than within 1%, tens of MiB at its usual values.
+    """
+    if name == 'mem_used':
+        return QuantileSketch(absolute_accuracy=MEM_USED_SKETCH_ACCURACY, max_buckets=MEM_USED_SKETCH_BUCKETS)
+    return QuantileSketch()
+
+
+class ExactDistribution(object):
+    """QuantileSketch interface over a whole series held in memory, for exact percentiles."""
+
+
+    def __init__(self, values):
+        self.values = np.sort(np.asarray(values, dtype=np.float64).ravel())
+        self.count = len(self.values)
+        self.min = float(self.values[0])
+        self.max = float(self.values[-1])
+
+    def getQuantile(self, quantile):
+        return float(np.percentile(self.values, quantile * 100, interpolation='lower'))
+
+    def getHistogram(self, edges):
+        bins = np.clip(np.searchsorted(edges, self.values, side='right') - 1, 0, len(edges) - 2)
+        return np.bincount(bins, minlength=len(edges) - 1)
+
+
+class StreamingStatsReducer(object):
+    """Produces the ResourceUsageStats summary from a stream of samples in bounded memory.
+
+       Samples are buffered into tables of at most chunk_size rows; each full table is reduced by
+       StatsReduction and only folded into RunningStats accumulators and the QuantileSketches of
+       DISTRIBUTION_SERIES. The last /proc/stat sample of a chunk is carried over into the next one
+       so the interval across the boundary is kept.
+    """
+
+
+    def __init__(self, chunk_size=4096):
+        self.chunk_size = chunk_size
+        self.core_count = None
+        self.running_stats = dict((name, RunningStats()) for name in SERIES_NAMES)
+        self.sketches = dict((name, createQuantileSketch(name)) for name, _, _, _ in DISTRIBUTION_SERIES)
+        self._cpu_stats = None
+        self._mem_stats = ProcMeminfoTableBuilder()
+
+    def addSample(self, sample):
+        if isinstance(sample, ProcStatData):
+            self.addProcStatData(sample)
+        else:
+            self.addProcMeminfoData(sample)
+
+    def addProcStatData(self, proc_stat_data):
+        if not proc_stat_data.isComplete(): return
+        if self.core_count is None:
+            self.core_count = proc_stat_data.getCoreCount()
+            self._cpu_stats = ProcStatTableBuilder(self.core_count + 1)
+        self._cpu_stats.append(proc_stat_data)
+        if len(self._cpu_stats) >= self.chunk_size:
+            self._reduceCpuStats()
+
+    def addProcMeminfoData(self, proc_meminfo_data):
+        self._mem_stats.append(proc_meminfo_data)
+        if len(self._mem_stats) >= self.chunk_size:
+            self._reduceMemStats()
+
+    def flush(self):
+        if self._cpu_stats is not None and len(self._cpu_stats) > 1:
+            self._reduceCpuStats()
+        if len(self._mem_stats) > 0:
+            self._reduceMemStats()
+
+    def getCpuStatsCount(self):
+        self.flush()
+        return self.running_stats['overall_user_sys'].count
+
+    def getMemStatsCount(self):
+        self.flush()
+        return self.running_stats['mem_used'].count
+
+    def getMetrics(self, distribution=False):
+        self.flush()
+        metrics = computeSummaryMetrics(self.running_stats)
+        if distribution:
+            metrics.update(computeDistributionMetrics(self.sketches))
+        return metrics
+
+    def getSummary(self, start, end, distribution=False):
+        """distribution adds the percentiles and histograms of the sketches."""
+        metrics = self.getMetrics(distribution)
+        return formatSummary(metrics, start, end, self.sketches if distribution else None)
+
+    def _reduceCpuStats(self):
+        table = self._cpu_stats.build()
+        self._cpu_stats = ProcStatTableBuilder(self.core_count + 1)
+        self._cpu_stats.append(table[-1])
+        reduction = StatsReduction(table, None, self.core_count)
+        for name in CPU_SERIES + PER_CORE_SERIES:
+            self.running_stats[name].update(getattr(reduction, name))
+        self._updateSketches(reduction, ('overall_user_sys', 'per_core_user_sys'))
+
+    def _reduceMemStats(self):
+        table = self._mem_stats.build()
+        self._mem_stats = ProcMeminfoTableBuilder()
+        reduction = StatsReduction(None, table)
+        self.running_stats['mem_used'].update(reduction.mem_used)
+        self._updateSketches(reduction, ('mem_used',))
+
+    def _updateSketches(self, reduction, names):
+        for name in names:
+            self.sketches[name].update(getattr(reduction, name))
+
+
+class RollingWindowStats(object):
+    """min/avg/max of the values added during the last duration seconds, O(1) amortized per value.
+
+       min and max are read off monotonic deques: each keeps only the values that can still
+       become the extreme once older ones expire, so their front is always the answer.
+    """
+
+
+    def __init__(self, duration):
+        self.duration = duration
+        self._values = deque()
+        self._min = deque()
+        self._max = deque()
+        self._sum = 0.0
+        self._added = 0
+
+    def __len__(self):
+        return len(self._values)
+
+    def add(self, timestamp, value):
+        sequence = self._added
+        self._added += 1
+        self._values.append((sequence, timestamp, value))
+        self._sum += value
+        while self._min and self._min[-1][1] >= value:
+            self._min.pop()
+        self._min.append((sequence, value))
+        while self._max and self._max[-1][1] <= value:
+            self._max.pop()
+        self._max.append((sequence, value))
+        while self._values[0][1] <= timestamp - self.duration:
+            sequence, _, value = self._values.popleft()
+            self._sum -= value
+            if self._min[0][0] == sequence: self._min.popleft()
+            if self._max[0][0] == sequence: self._max.popleft()
+
+    def getMin(self):
+        return self._min[0][1]
+
+    def getAvg(self):
+        return self._sum / len(self._values)
+
+    def getMax(self):
+        return self._max[0][1]
+
+
+class PhaseTiming(object):
+    """Wall time of a phase, the samples it went through and the peak RSS of the process at its end,
+       in KiB; parts holds the (name, seconds) of the parts timed within it.
+    """
+
+
+    def __init__(self, name, samples=None):
+        self.name = name
+        self.samples = samples
+        self.seconds = None
+        self.peak_rss_kib = None
+        self.parts = []
+
+    def format(self):
+        res = '{0}: {1:.3f}s'.format(self.name, self.seconds)
+        if self.samples and self.seconds > 0:
+            res += ', {0:.0f} samples/s'.format(self.samples / self.seconds)
+        res += ', peak RSS {0:.1f} MiB'.format(self.peak_rss_kib / 1024)
+        for name, seconds in self.parts:
+            res += '\n  {0}: {1:.3f}s'.format(name, seconds)
+        return res
+
+
+class PhaseProfiler(object):
+    """Times the phases of a reduction.
+
+       with profiler.phase('reduce') as timing: ... times a phase, whose samples may be set on
+       timing inside the block; with profiler.part('...') and addPartTime time parts of the phase
+       in progress, the time no part accounts for being reported as remainder. Every finished
+       PhaseTiming is passed to the hooks, which is how the batch and follow modes log them.
+    """
+
+
+    def __init__(self):
+        self.timings = []
+        self.hooks = []
+        self._parts = None
+
+    def addHook(self, hook):
+        self.hooks.append(hook)
+
+    @contextmanager
+    def phase(self, name, samples=None, remainder=None):
+        timing = PhaseTiming(name, samples)
+        self._parts = {}
+        begin = time.time()
+        try:
+            yield timing
+        finally:
+            timing.seconds = time.time() - begin
+            timing.peak_rss_kib = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            timing.parts = sorted(self._parts.items())
+            if remainder is not None and self._parts:
+                timing.parts.insert(0, (remainder, timing.seconds - sum(self._parts.values())))
+            self._parts = None
+            self.timings.append(timing)
+            for hook in self.hooks:
+                hook(timing)
+
+    @contextmanager
+    def part(self, name):
+        begin = time.time()
+        try:
+            yield
+        finally:
+            self.addPartTime(name, time.time() - begin)
+
+    def addPartTime(self, name, seconds):
+        if self._parts is not None:
+            self._parts[name] = self._parts.get(name, 0) + seconds
+
+    def formatReport(self):
+        return 'Profile:\n' + '\n'.join(timing.format() for timing in self.timings)
+
+
+class LogFollower(object):
+    """Follows a log the collector is still appending to.
+
+       Every poll parses only the bytes written since the previous one, and only up to the last
+       sample header, the sample after it being possibly incomplete. Samples go to a
+       StreamingStatsReducer for the summary of the whole log, and to RollingWindowStats keeping
+       the overall CPU and memory in use over the last FOLLOW_WINDOWS seconds. With a
+       PhaseProfiler, every poll that parsed something is timed as a phase.
+    """
+
+    FOLLOW_WINDOWS = (60, 300, 900)
+
+
+    def __init__(self, file_path, windows=FOLLOW_WINDOWS, profiler=None):
+        self.log_parser = LogParser(file_path, profiler)
+        self.profiler = profiler
+        self.offset = 0
+        self.origin = None
+        self.reducer = StreamingStatsReducer()
+        self.cpu_windows = [RollingWindowStats(duration) for duration in windows]
+        self.mem_windows = [RollingWindowStats(duration) for duration in windows]
+        self._previous_stat = None
+        self._previous_date = None
+        self._core_count = None
+
+    def poll(self, final=False):
+        """Parses the samples completed since the last poll, or every remaining one if final.
+
+           Returns the number of sections parsed.
+        """
+        size = os.path.getsize(self.log_parser.file_path)
+        if size < self.offset:
+            raise Exception(self.log_parser.file_path + ' was truncated')
+        stop = size if final else self.log_parser.findLastHeaderOffset(size)
+        if stop <= self.offset: return 0
+        if self.origin is None:
+            self.origin = self.log_parser.findFirstDate()
+        if self.profiler is None:
+            count = self._addSamples(stop)
+        else:
+            with self.profiler.phase('poll', remainder='read') as timing:
+                count = timing.samples = self._addSamples(stop)
+        self.offset = stop
+        return count
+
+    def _addSamples(self, stop):
+        count = 0
+        for sample in self.log_parser.iterByteRange(self.offset, stop, origin=self.origin,
+                                                    previous_date=self._previous_date):
+            self._previous_date = sample.date
+            if self.profiler is None:
+                self._addSample(sample)
+            else:
+                with self.profiler.part('reduce'):
+                    self._addSample(sample)
+            count += 1
+        return count
+
+    def getReport(self):
+        if self.reducer.getCpuStatsCount() < 1 or self.reducer.getMemStatsCount() < 1:
+            return 'Not enough data for calculation yet'
+        res = self.reducer.getSummary(0, -1)
+        for cpu_window, mem_window in zip(self.cpu_windows, self.mem_windows):
+            label = 'Last {0:g} min'.format(cpu_window.duration / 60)
+            if len(cpu_window) > 0:
+                res += '\n{0} - Overall CPU - user + sys + irq min/avg/max: {1:.1f}% / {2:.1f}% / {3:.1f}%'.format(
+                    label, cpu_window.getMin(), cpu_window.getAvg(), cpu_window.getMax())
+            if len(mem_window) > 0:
+                res += '\n{0} - Memory in use (MiB) min/avg/max: {1:.1f} / {2:.1f} / {3:.1f}'.format(
+                    label, mem_window.getMin() / 1024, mem_window.getAvg() / 1024, mem_window.getMax() / 1024)
+        return res
+
+    def _addSample(self, sample):
+        if not sample.isComplete(): return
+        self.reducer.addSample(sample)
+        timestamp = toTimestamp(sample.date)
+        if isinstance(sample, ProcStatData):
+            if self._previous_stat is None:
+                self._core_count = sample.getCoreCount()
+            else:
+                cpu_stats = CpuStats([self._previous_stat, sample], self._core_count)
+                usage = cpu_stats.getUserPercentages()[0, 0] + cpu_stats.getSysPercentages()[0, 0]
+                for window in self.cpu_windows:
+                    window.add(timestamp, usage)
+            self._previous_stat = sample
+        else:
+            used = MemUsedStats(MemStats([sample]))[0]
+            for window in self.mem_windows:
+                window.add(timestamp, used)
+
+
 class Stats(object):
 
 
@@ -153,8 +1436,11 @@ class Stats(object):
 class CpuStats(Stats):
 
 
-    def __init__(self, stats_list):
+    def __init__(self, stats_list, core_count=None):
+        if not isinstance(stats_list, ProcStatTable):
+            stats_list = ProcStatTable.fromDataList(stats_list)
         self.stats_list = stats_list
+        self.core_count = core_count
         self.pre_stat = self.stats_list[0]
         self.current_stat = self.stats_list[1]
         self.index = 0
@@ -185,32 +1471,60 @@ class CpuStats(Stats):
             self.current_stat = self.stats_list[self.index]
 
     def getTotalDelta(self, previous, current, cpu_id):
-        time_delta = (current.date - previous.date).total_seconds() * 100
-        if cpu_id == 'cpu':
-            time_delta *= self.getCpuCoreCount()
-        return time_delta
-    
+        """Jiffies cpu_id accounted in any state between the two samples, 0 if either lacks it."""
+        if cpu_id not in current.data or cpu_id not in previous.data: return 0
+        return sum(current.data[cpu_id][name] - previous.data[cpu_id][name] for name in ProcStatTable.CPU_COUNTERS)
+
     def getUserPercentage(self, previous, current, cpu_id):
         total_delta = self.getTotalDelta(previous, current, cpu_id)
-        if cpu_id not in current.data or cpu_id not in previous.data: return 0.0
+        if total_delta <= 0: return 0.0
         current_user_time = (current.data[cpu_id])['user'] + (current.data[cpu_id])['nice']
         previous_user_time = (previous.data[cpu_id])['user'] + (previous.data[cpu_id])['nice']
         user_delta = current_user_time - previous_user_time
-        percentage = float(user_delta) / total_delta * 100
+        percentage = float(user_delta) * 100 / total_delta
         return percentage
 
     def getSysPercentage(self, previous, current, cpu_id):
         total_delta = self.getTotalDelta(previous, current, cpu_id)
-        if cpu_id not in current.data or cpu_id not in previous.data: return 0.0
+        if total_delta <= 0: return 0.0
         current_sys_time = (current.data[cpu_id])['system'] + (current.data[cpu_id])['irq'] + (current.data[cpu_id])['softirq']
         previous_sys_time = (previous.data[cpu_id])['system'] + (previous.data[cpu_id])['irq'] + (previous.data[cpu_id])['softirq']
         sys_delta = current_sys_time - previous_sys_time
-        percentage = float(sys_delta) / total_delta * 100
+        percentage = float(sys_delta) * 100 / total_delta
         return percentage
 
+    def getTotalDeltas(self):
+        """Vectorized getTotalDelta: (intervals x cpu ids) array, column 0 being 'cpu'."""
+        return self.getDeltas(ProcStatTable.CPU_COUNTERS)
+
+    def getUserPercentages(self):
+        """Vectorized getUserPercentage for every interval and cpu id."""
+        return self._getPercentages(('user', 'nice'))
+
+    def getSysPercentages(self):
+        """Vectorized getSysPercentage for every interval and cpu id."""
+        return self._getPercentages(('system', 'irq', 'softirq'))
+
+    def getIrqPercentages(self):
+        """Share of the sys percentages spent in irq and softirq, for every interval and cpu id."""
+        return self._getPercentages(('irq', 'softirq'))
+
+    def getDeltas(self, counter_names):
+        """Jiffies spent in counter_names over every interval and cpu id, 0 where the cpu is absent."""
+        table = self.stats_list
+        busy = table.counters[counter_names[0]]
+        for name in counter_names[1:]:
+            busy = busy + table.counters[name]
+        present = table.present[:-1] & table.present[1:]
+        return np.where(present, np.diff(busy, axis=0), 0)
+
+    def _getPercentages(self, counter_names):
+        return toPercentages(self.getDeltas(counter_names), self.getTotalDeltas())
+
     def getCpuCoreCount(self):
+        if self.core_count is not None: return self.core_count
         if len(self.stats_list) == 0: return 0
-        return len(self.stats_list[0].data) - 1
+        return self.stats_list.getCoreCount()
     
     def getStatsCount(self):
         return len(self.stats_list) - 1
@@ -341,6 +1655,8 @@ class MemStats(Stats):
 
 
     def __init__(self, mem_stats_list):
+        if not isinstance(mem_stats_list, ProcMeminfoTable):
+            mem_stats_list = ProcMeminfoTable.fromDataList(mem_stats_list)
         self.stats_list = mem_stats_list
         self.current_stat = self.stats_list[0]
         self.index = 0
@@ -386,6 +1702,42 @@ class MemUsedStats(Stats):
                stat.data['Cached']
         return used
 
+    def getUsedSeries(self):
+        """Vectorized getUsed over every sample."""
+        table = self.mem_stats.stats_list
+        return table.getColumn('MemTotal') - table.getColumn('MemFree') - table.getColumn('Cached')
+
+
+class SchedstatStats(object):
+    """Vectorized per-interval deltas of a SchedstatTable, one column per core.
+
+       A core missing from either sample of an interval, being offline, counts as idle.
+    """
+
+
+    def __init__(self, stats_list):
+        if not isinstance(stats_list, SchedstatTable):
+            stats_list = SchedstatTable.fromDataList(stats_list)
+        self.stats_list = stats_list
+
+    def getWaitTimes(self):
+        """Run queue wait of every core per interval, in ms."""
+        return self._getDeltas('wait_time') / 1e6
+
+    def getTimesliceCounts(self):
+        return self._getDeltas('timeslices')
+
+    def getLatencies(self):
+        """Average run queue wait per timeslice of every core per interval, in ms."""
+        timeslices = self.getTimesliceCounts()
+        return np.where(timeslices > 0, self.getWaitTimes() / np.maximum(timeslices, 1), 0.0)
+
+    def _getDeltas(self, counter_name):
+        table = self.stats_list
+        deltas = np.diff(table.counters[counter_name], axis=0)
+        present = table.present[:-1] & table.present[1:]
+        return np.where(present, deltas, 0)[:, 1:]
+
 
 class Data(object):
 
@@ -396,6 +1748,18 @@ class Data(object):
 
 class ProcStatData(Data):
 
+    DATA_REGEXP = re.compile(''.join(('(?P<cpu_id>^cpu[0-9]*) +', 
+                                      '(?P<user>[0-9]+) ', 
+                                      '(?P<nice>[0-9]+) ', 
+                                      '(?P<system>[0-9]+) '
+                                      '(?P<idle>[0-9]+) '
+                                      '(?P<iowait>[0-9]+) '
+                                      '(?P<irq>[0-9]+) '
+                                      '(?P<softirq>[0-9]+) '
+                                      '(?P<steal>[0-9]+) '
+                                      '(?P<guest>[0-9]+) '
+                                      '(?P<guest_nice>[0-9]+)')))
+
 
     def __init__(self, date):
 
@@ -408,37 +1772,50 @@ class ProcStatData(Data):
            
            Example:
            cpu       74608 2520 24433  1117073 6176   4054 0       0     0     0 
+
+           Lines are split on whitespace; the ones that do not tokenize cleanly go through
+           DATA_REGEXP instead.
         """
-        end_regexp = re.compile('---- ')
-        data_regexp = re.compile(''.join(('(?P<cpu_id>^cpu[0-9]*) +', 
-                                               '(?P<user>[0-9]+) ', 
-                                               '(?P<nice>[0-9]+) ', 
-                                               '(?P<system>[0-9]+) '
-                                               '(?P<idle>[0-9]+) '
-                                               '(?P<iowait>[0-9]+) '
-                                               '(?P<irq>[0-9]+) '
-                                               '(?P<softirq>[0-9]+) '
-                                               '(?P<steal>[0-9]+) '
-                                               '(?P<guest>[0-9]+) '
-                                               '(?P<guest_nice>[0-9]+)')))
         line = log_file.readline()
-        while line and not end_regexp.search(line):
-            m = data_regexp.match(line)
-            if m:
-                cpu_id = m.group('cpu_id')
-                self.data[cpu_id] = {'user': int(m.group('user')),
-                                     'nice': int(m.group('nice')),
-                                     'system': int(m.group('system')),
-                                     'idle': int(m.group('idle')),
-                                     'iowait': int(m.group('iowait')),
-                                     'irq': int(m.group('irq')),
-                                     'softirq': int(m.group('softirq'))}
+        while line and '---- ' not in line:
+            if line.startswith('cpu'):
+                fields = line.split()
+                cpu_id = fields[0]
+                if len(fields) >= 11 and (cpu_id == 'cpu' or cpu_id[3:].isdigit()) and \
+                   ''.join(fields[1:11]).isdigit():
+                    self.data[cpu_id] = {'user': int(fields[1]),
+                                         'nice': int(fields[2]),
+                                         'system': int(fields[3]),
+                                         'idle': int(fields[4]),
+                                         'iowait': int(fields[5]),
+                                         'irq': int(fields[6]),
+                                         'softirq': int(fields[7]),
+                                         'steal': int(fields[8])}
+                else:
+                    self._parseLineWithRegexp(line)
             line = log_file.readline()
         return line
 
+    def _parseLineWithRegexp(self, line):
+        m = self.DATA_REGEXP.match(line)
+        if m:
+            cpu_id = m.group('cpu_id')
+            self.data[cpu_id] = {'user': int(m.group('user')),
+                                 'nice': int(m.group('nice')),
+                                 'system': int(m.group('system')),
+                                 'idle': int(m.group('idle')),
+                                 'iowait': int(m.group('iowait')),
+                                 'irq': int(m.group('irq')),
+                                 'softirq': int(m.group('softirq')),
+                                 'steal': int(m.group('steal'))}
+
     def getCoreCount(self):
         return len(self.data) - 1
 
+    def isComplete(self):
+        """False for a section cut short before its first cpu line, which is dropped."""
+        return len(self.data) > 0
+
     def __str__(self):
         res = ''
         res += str(self.date) + ': '
@@ -451,6 +1828,11 @@ class ProcStatData(Data):
 
 class ProcMeminfoData(Data):
 
+    DATA_REGEXP = re.compile('(?P<key>^[a-zA-Z]+):\s+(?P<value>[0-9]+)\s+kB')
+
+    # Keys memory in use is computed from; sections cut short before any of them are dropped.
+    REQUIRED_KEYS = ('MemTotal', 'MemFree', 'Cached')
+
 
     def __init__(self, date):
 
@@ -474,19 +1856,28 @@ class ProcMeminfoData(Data):
            ....
            .....
            ---- /proc/stat
-        """
 
-        end_regexp = re.compile('---- ')
-        data_regexp = re.compile('(?P<key>^[a-zA-Z]+):\s+(?P<value>[0-9]+)\s+kB')
+           Lines are split at the colon and on whitespace; the ones that do not tokenize cleanly
+           go through DATA_REGEXP instead.
+        """
         line = log_file.readline()
-        while line and not end_regexp.search(line):
-            m = data_regexp.match(line)
-            if m:
-                value_name = m.group('key')
-                self.data[value_name] = int(m.group('value'))
+        while line and '---- ' not in line:
+            key, _, value = line.partition(':')
+            fields = value.split()
+            if key.isalpha() and value[:1].isspace() and len(fields) >= 2 and fields[0].isdigit() and \
+               fields[1].startswith('kB'):
+                self.data[key] = int(fields[0])
+            else:
+                m = self.DATA_REGEXP.match(line)
+                if m:
+                    value_name = m.group('key')
+                    self.data[value_name] = int(m.group('value'))
             line = log_file.readline()
         return line
 
+    def isComplete(self):
+        return all(key in self.data for key in self.REQUIRED_KEYS)
+
     def __str__(self):
         res = ''
         res += str(self.date) + ': '
@@ -497,50 +1888,1332 @@ class ProcMeminfoData(Data):
         return self.__str__()
 
 
+class TopData(Data):
+    """Process rows of a top section: (pid, user, state, %cpu, %mem, res KiB, command) tuples.
+
+       Columns are located through the header line, so both the toybox (PID USER ... S[%CPU] %MEM
+       ... RES ... ARGS) and the older toolbox (PID ... CPU% S ... RSS ... UID Name) layouts work;
+       the command must be the last column since it may contain spaces.
+    """
+
+    COLUMN_NAMES = {'PID': 'pid', 'USER': 'user', 'UID': 'user', 'S': 'state', '%CPU': 'cpu', 'CPU%': 'cpu',
+                    '%MEM': 'mem', 'RES': 'res', 'RSS': 'res', 'ARGS': 'command', 'CMD': 'command',
+                    'NAME': 'command', 'Name': 'command'}
+    SIZE_UNITS = {'K': 1, 'M': 1024, 'G': 1024 ** 2, 'T': 1024 ** 3}
+
+
+    def __init__(self, date):
+
+        self.data = []
+        self.date = date
+
+    def parseText(self, log_file):
+        """Reads up to the next line starting with '--', which top rows never do."""
+        columns = None
+        line = log_file.readline()
+        while line and not line.startswith('--'):
+            fields = line.split()
+            if columns is None:
+                if 'PID' in fields:
+                    names = line.replace('[', ' ').replace(']', ' ').split()
+                    columns = dict((self.COLUMN_NAMES.get(name), i) for i, name in enumerate(names))
+                    field_count = len(names)
+            elif fields and fields[0].isdigit() and 'cpu' in columns:
+                fields = line.split(None, field_count - 1)
+                if len(fields) == field_count:
+                    self.data.append(self._parseRow(fields, columns))
+            line = log_file.readline()
+        return line
+
+    def _parseRow(self, fields, columns):
+        def get(name, default=''):
+            return fields[columns[name]] if name in columns else default
+        return (int(get('pid')), get('user'), get('state'), float(get('cpu').rstrip('%')),
+                float(get('mem', 'nan')), self._parseSize(get('res', '0')), get('command').rstrip())
+
+    def _parseSize(self, text):
+        """KiB in a top size such as 2.2M or 1234K; a plain number counts bytes."""
+        unit = self.SIZE_UNITS.get(text[-1:].upper())
+        if unit is None:
+            return float(text) / 1024
+        return float(text[:-1]) * unit
+
+    def __str__(self):
+        res = ''
+        res += str(self.date) + ': '
+        res += 'Top Data: {0}\n'.format(self.data)
+        return res
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class SchedstatData(Data):
+    """Per-cpu counters of /proc/schedstat (version 15 and later).
+
+       Only the cpu lines are read; the per-domain load balancing lines are skipped by their first
+       character without being split.
+    """
+
+
+    def __init__(self, date):
+
+        self.data = {}
+        self.date = date
+
+    def parseText(self, log_file):
+        """Data format:
+           cpu<N> <yld_count> 0 <sched_count> <sched_goidle> <ttwu_count> <ttwu_local>
+                  <run_time ns> <wait_time ns> <timeslices>
+
+           Example:
+           cpu0 3308979 0 22026491 5538180 15685565 5041083 1886626644290 1262756719810 13775887
+        """
+        line = log_file.readline()
+        while line and '---- ' not in line:
+            if line.startswith('cpu'):
+                fields = line.split()
+                if len(fields) >= 10 and fields[0][3:].isdigit() and ''.join(fields[-3:]).isdigit():
+                    self.data[fields[0]] = {'run_time': int(fields[-3]),
+                                            'wait_time': int(fields[-2]),
+                                            'timeslices': int(fields[-1])}
+            line = log_file.readline()
+        return line
+
+    def __str__(self):
+        res = ''
+        res += str(self.date) + ': '
+        res += 'Schedstat Data: {0}\n'.format(self.data)
+        return res
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class UptimeData(Data):
+    """Seconds since boot of /proc/uptime, None if the section holds none."""
+
+
+    def __init__(self, date):
+
+        self.uptime = None
+        self.date = date
+
+    def parseText(self, log_file):
+        """Data format:
+           <seconds since boot> <seconds idle, summed over the cores>
+
+           Example:
+           350735.47 234388.90
+        """
+        line = log_file.readline()
+        while line and '---- ' not in line:
+            fields = line.split()
+            if fields and self.uptime is None:
+                try:
+                    self.uptime = float(fields[0])
+                except ValueError:
+                    pass
+            line = log_file.readline()
+        return line
+
+    def __str__(self):
+        return str(self.date) + ': ' + 'Uptime Data: {0}\n'.format(self.uptime)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class UptimeClock(object):
+    """Sub-second sample dates from /proc/uptime, which is monotonic, unlike the whole-second
+       header dates of the wall clock.
+
+       The anchor is the (header date, uptime) of the first sample of the log, and the date of a
+       later sample is the anchor date plus the uptime elapsed since. The header date is kept when
+       there is no anchor or uptime, when the uptime went backwards (a reboot) or when the two dates
+       are more than MAX_SKEW seconds apart (the wall clock was set). A header date less than a
+       second before the date of the previous sample only lost its fraction of a second, so that
+       date is kept instead and dates never go backwards. Dates only depend on the anchor and the
+       previous date, so byte ranges parsed apart agree with a sequential parse.
+    """
+
+    MAX_SKEW = 60
+
+
+    def __init__(self, anchor=None):
+        self.anchor = anchor
+
+    def getDate(self, header_date, uptime, previous=None):
+        """previous is the date of the sample before, None for the first one."""
+        if self.anchor is not None and uptime is not None:
+            anchor_date, anchor_uptime = self.anchor
+            date = anchor_date + timedelta(seconds=uptime - anchor_uptime)
+            if uptime >= anchor_uptime and abs((date - header_date).total_seconds()) <= self.MAX_SKEW:
+                return date
+        if previous is not None and timedelta(0) < previous - header_date < timedelta(seconds=1):
+            return previous
+        return header_date
+
+
+def toTimestamp(date):
+    """Seconds since the epoch for a naive UTC datetime."""
+    return calendar.timegm(date.utctimetuple()) + date.microsecond / 1e6
+
+
+def toDate(timestamp):
+    return datetime.utcfromtimestamp(timestamp)
+
+
+def getLastDate(tables):
+    """Date of the last sample of (ProcStatTable, ProcMeminfoTable), None if both are empty."""
+    timestamps = [table.timestamps[-1] for table in tables if len(table) > 0]
+    return toDate(max(timestamps)) if timestamps else None
+
+
+def toMilliseconds(timestamps):
+    """timestamps rounded to whole milliseconds, as int64. Works on arrays."""
+    return np.round(np.asarray(timestamps, dtype=np.float64) * 1000).astype(np.int64)
+
+
+def getElapsedSeconds(timestamps, origin):
+    """Seconds, fractional ones included, from origin to timestamps, the elapsed time --start/--end are
+       compared with. Works on arrays.
+    """
+    return np.asarray(timestamps, dtype=np.float64) - origin
+
+
+def isInWindow(elapsed, start, end):
+    """Whether elapsed seconds fall in [start, end); end < 0 leaves the window open. Works on arrays."""
+    return (elapsed >= start) & ((elapsed < end) | (end < 0))
+
+
+def toPercentages(deltas, totals):
+    """deltas in percent of totals, 0 where totals is not positive. Works on arrays."""
+    positive = totals > 0
+    return np.where(positive, deltas * 100 / np.where(positive, totals, 1), 0.0)
+
+
+class _RowBuffer(object):
+    """Growable int64 matrix that rows are appended to; it widens when new columns show up."""
+
+
+    def __init__(self, width=1, dtype=np.int64):
+        self._data = np.zeros((64, width), dtype=dtype)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def addRow(self):
+        if self._size == self._data.shape[0]:
+            self._resize(self._size * 2, self._data.shape[1])
+        self._size += 1
+        return self._size - 1
+
+    def ensureWidth(self, width):
+        if width > self._data.shape[1]:
+            self._resize(self._data.shape[0], width)
+
+    def setRange(self, row, column, values):
+        self._data[row, column:column + len(values)] = values
+
+    def set(self, row, column, value):
+        self._data[row, column] = value
+
+    def getArray(self):
+        return self._data[:self._size].copy()
+
+    def _resize(self, rows, width):
+        data = np.zeros((rows, width), dtype=self._data.dtype)
+        data[:self._size, :self._data.shape[1]] = self._data[:self._size]
+        self._data = data
+
+
+def _padColumns(values, width):
+    if values.shape[1] == width: return values
+    padded = np.zeros((values.shape[0], width), dtype=values.dtype)
+    padded[:, :values.shape[1]] = values
+    return padded
+
+
+class ProcStatTable(object):
+    """Columnar store of /proc/stat samples.
+
+       counters maps each name in CPU_COUNTERS to an int64 (samples x cpu ids) array. Column 0
+       holds the aggregate 'cpu' line and column i + 1 holds 'cpu<i>'; present marks the cpu ids a
+       sample actually reported, since offline cores drop out of /proc/stat.
+
+       CPU_COUNTERS are the columns whose sum is the jiffies a cpu accounted; guest and guest_nice
+       are left out, being counted in user and nice already.
+    """
+
+    CPU_COUNTERS = ('user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal')
+    DATA_CLASS = ProcStatData
+
+
+    def __init__(self, timestamps, counters, present):
+        self.timestamps = timestamps
+        self.counters = counters
+        self.present = present
+
+    @classmethod
+    def fromDataList(cls, stats_list):
+        builder = ProcStatTableBuilder(table_class=cls)
+        for stat in stats_list:
+            builder.append(stat)
+        return builder.build()
+
+    @classmethod
+    def concatenate(cls, tables):
+        width = max(table.getColumnCount() for table in tables)
+        counters = {}
+        for name in cls.CPU_COUNTERS:
+            counters[name] = np.concatenate([_padColumns(table.counters[name], width) for table in tables])
+        present = np.concatenate([_padColumns(table.present, width) for table in tables])
+        return cls(np.concatenate([table.timestamps for table in tables]), counters, present)
+
+    @staticmethod
+    def getColumnIndex(cpu_id):
+        if cpu_id == 'cpu': return 0
+        return int(cpu_id[3:]) + 1
+
+    @staticmethod
+    def getCpuId(column):
+        if column == 0: return 'cpu'
+        return 'cpu' + str(column - 1)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, (slice, np.ndarray)):
+            return type(self)(self.timestamps[index],
+                              dict((name, values[index]) for name, values in self.counters.iteritems()),
+                              self.present[index])
+        if index < -len(self) or index >= len(self):
+            raise IndexError(type(self).__name__ + ' index out of range')
+        stat = self.DATA_CLASS(toDate(self.timestamps[index]))
+        for column in np.flatnonzero(self.present[index]):
+            stat.data[self.getCpuId(column)] = dict((name, int(self.counters[name][index, column]))
+                                                    for name in self.CPU_COUNTERS)
+        return stat
+
+    def selectWindow(self, origin, start, end):
+        """Rows inside the [start, end) window, in seconds from the origin timestamp."""
+        return self[isInWindow(getElapsedSeconds(self.timestamps, origin), start, end)]
+
+    def getColumnCount(self):
+        return self.present.shape[1]
+
+    def getCoreCount(self):
+        return int(self.present[0].sum()) - 1
+
+
+class SchedstatTable(ProcStatTable):
+    """Columnar store of /proc/schedstat samples, laid out like ProcStatTable.
+
+       Column i + 1 holds 'cpu<i>'; column 0 stays empty as /proc/schedstat has no aggregate line.
+    """
+
+    CPU_COUNTERS = ('run_time', 'wait_time', 'timeslices')
+    DATA_CLASS = SchedstatData
+
+
+    def getCoreCount(self):
+        return int(self.present[0].sum())
+
+
+class ProcStatTableBuilder(object):
+    """Builds a ProcStatTable, or a table_class sharing its layout such as SchedstatTable."""
+
+
+    def __init__(self, width=1, table_class=ProcStatTable):
+        self._table_class = table_class
+        self._timestamps = []
+        self._counters = _RowBuffer(width * len(table_class.CPU_COUNTERS))
+        self._present = _RowBuffer(width, np.bool_)
+        self._width = width
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def append(self, proc_stat_data):
+        self.appendCounters(proc_stat_data.date, proc_stat_data.data.iteritems())
+
+    def appendCounters(self, date, cpu_counters):
+        """cpu_counters yields (cpu_id, {counter name: value}) pairs; a sample without any is dropped."""
+        columns = dict((self._table_class.getColumnIndex(cpu_id), values) for cpu_id, values in cpu_counters)
+        if not columns: return
+        row = self._present.addRow()
+        self._counters.addRow()
+        self._timestamps.append(toTimestamp(date))
+        counter_names = self._table_class.CPU_COUNTERS
+        width = max(columns) + 1
+        self._ensureWidth(width)
+        counter_count = len(counter_names)
+        present = [False] * width
+        row_values = [0] * (width * counter_count)
+        for column, values in columns.iteritems():
+            present[column] = True
+            row_values[column * counter_count:(column + 1) * counter_count] = \
+                [values[name] for name in counter_names]
+        self._present.setRange(row, 0, present)
+        self._counters.setRange(row, 0, row_values)
+
+    def _ensureWidth(self, width):
+        if width > self._width:
+            self._width = width
+            self._present.ensureWidth(width)
+            self._counters.ensureWidth(width * len(self._table_class.CPU_COUNTERS))
+
+    def build(self):
+        counter_names = self._table_class.CPU_COUNTERS
+        values = self._counters.getArray()[:, :self._width * len(counter_names)]
+        values = values.reshape(len(self), self._width, len(counter_names))
+        counters = dict((name, np.ascontiguousarray(values[:, :, i])) for i, name in enumerate(counter_names))
+        return self._table_class(np.array(self._timestamps, dtype=np.float64), counters,
+                                 self._present.getArray()[:, :self._width])
+
+
+class ProcMeminfoTable(object):
+    """Columnar store of /proc/meminfo samples: a (samples x keys) int64 matrix of kB values.
+
+       Every sample has the ProcMeminfoData.REQUIRED_KEYS; other keys a sample lacks are 0.
+    """
+
+
+    def __init__(self, timestamps, keys, values):
+        self.timestamps = timestamps
+        self.keys = keys
+        self.values = values
+        self._key_index = dict((key, i) for i, key in enumerate(keys))
+
+    @classmethod
+    def fromDataList(cls, stats_list):
+        builder = ProcMeminfoTableBuilder()
+        for stat in stats_list:
+            builder.append(stat)
+        return builder.build()
+
+    @classmethod
+    def fromCompleteRows(cls, timestamps, keys, values, present):
+        """Table of the rows whose (samples x keys) present flags include every REQUIRED_KEYS."""
+        complete = np.ones(len(timestamps), dtype=np.bool_)
+        for key in ProcMeminfoData.REQUIRED_KEYS:
+            complete &= present[:, keys.index(key)] if key in keys else False
+        return cls(timestamps[complete], keys, values[complete])
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, (slice, np.ndarray)):
+            return ProcMeminfoTable(self.timestamps[index], self.keys, self.values[index])
+        if index < -len(self) or index >= len(self):
+            raise IndexError('ProcMeminfoTable index out of range')
+        stat = ProcMeminfoData(toDate(self.timestamps[index]))
+        stat.data = dict((key, int(value)) for key, value in zip(self.keys, self.values[index]))
+        return stat
+
+    @classmethod
+    def concatenate(cls, tables):
+        keys = []
+        for table in tables:
+            keys.extend(key for key in table.keys if key not in keys)
+        values = []
+        for table in tables:
+            aligned = np.zeros((len(table), len(keys)), dtype=np.int64)
+            aligned[:, [keys.index(key) for key in table.keys]] = table.values
+            values.append(aligned)
+        return cls(np.concatenate([table.timestamps for table in tables]), keys, np.concatenate(values))
+
+    def selectWindow(self, origin, start, end):
+        """Rows inside the [start, end) window, in seconds from the origin timestamp."""
+        return self[isInWindow(getElapsedSeconds(self.timestamps, origin), start, end)]
+
+    def getColumn(self, key):
+        return self.values[:, self._key_index[key]]
+
+
+class ProcMeminfoTableBuilder(object):
+
+
+    def __init__(self):
+        self._timestamps = []
+        self._keys = []
+        self._key_index = {}
+        self._values = _RowBuffer(64)
+
+    def __len__(self):
+        return len(self._timestamps)
+
+    def append(self, proc_meminfo_data):
+        """Incomplete samples, see ProcMeminfoData.isComplete, are dropped."""
+        if proc_meminfo_data.isComplete():
+            self.appendValues(proc_meminfo_data.date, proc_meminfo_data.data.iteritems())
+
+    def appendValues(self, date, items):
+        """items yields (meminfo key, kB value) pairs."""
+        row = self._values.addRow()
+        self._timestamps.append(toTimestamp(date))
+        for key, value in items:
+            column = self._key_index.get(key)
+            if column is None:
+                column = self._key_index[key] = len(self._keys)
+                self._keys.append(key)
+                self._values.ensureWidth(len(self._keys))
+            self._values.set(row, column, value)
+
+    def build(self):
+        return ProcMeminfoTable(np.array(self._timestamps, dtype=np.float64), list(self._keys),
+                                self._values.getArray()[:, :len(self._keys)])
+
+
+class TopTable(object):
+    """Per-process samples of the top sections in long format.
+
+       Row i says that process process_ids[i] used cpu[i] % of a core, mem[i] % of the memory and
+       res[i] KiB at timestamps[i]. Processes are interned as (pid, command) pairs in processes, so
+       a reused pid running another command is another process; users[k] is the user of process k.
+    """
+
+
+    def __init__(self, timestamps, process_ids, cpu, mem, res, processes, users):
+        self.timestamps = timestamps
+        self.process_ids = process_ids
+        self.cpu = cpu
+        self.mem = mem
+        self.res = res
+        self.processes = processes
+        self.users = users
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def getSeries(self, process):
+        """timestamps, cpu and res of the rows of the process with the given index in processes."""
+        rows = self.process_ids == process
+        return self.timestamps[rows], self.cpu[rows], self.res[rows]
+
+    def getProcessStats(self):
+        """Per-process sample count and average and peak cpu and res, as arrays indexed like processes."""
+        process_count = len(self.processes)
+        counts = np.bincount(self.process_ids, minlength=process_count)
+        stats = {'count': counts}
+        for name, values in (('cpu', self.cpu), ('res', self.res)):
+            sums = np.bincount(self.process_ids, values, minlength=process_count)
+            stats[name + '_avg'] = sums / np.maximum(counts, 1)
+            peaks = np.zeros(process_count)
+            np.maximum.at(peaks, self.process_ids, values)
+            stats[name + '_max'] = peaks
+        return stats
+
+    def getTopProcesses(self, count, key, stats=None):
+        """Indexes of the count processes with the largest stats[key], largest first.
+
+           heapq keeps this O(processes x log count), which matters when a long capture has
+           seen thousands of short-lived pids.
+        """
+        if stats is None: stats = self.getProcessStats()
+        values = stats[key]
+        return heapq.nlargest(count, xrange(len(self.processes)), key=values.__getitem__)
+
+
+class TopTableBuilder(object):
+
+
+    def __init__(self):
+        self._timestamps = []
+        self._process_ids = []
+        self._cpu = []
+        self._mem = []
+        self._res = []
+        self._processes = []
+        self._users = []
+        self._process_index = {}
+
+    def append(self, top_data):
+        timestamp = toTimestamp(top_data.date)
+        for pid, user, _, cpu, mem, res, command in top_data.data:
+            key = (pid, command)
+            process = self._process_index.get(key)
+            if process is None:
+                process = self._process_index[key] = len(self._processes)
+                self._processes.append(key)
+                self._users.append(user)
+            self._timestamps.append(timestamp)
+            self._process_ids.append(process)
+            self._cpu.append(cpu)
+            self._mem.append(mem)
+            self._res.append(res)
+
+    def build(self):
+        return TopTable(np.array(self._timestamps, dtype=np.float64), np.array(self._process_ids, dtype=np.int64),
+                        np.array(self._cpu), np.array(self._mem), np.array(self._res), list(self._processes),
+                        list(self._users))
+
+
+# Leading bytes of the compressed formats text logs are read from; compressed logs are archives
+# read start to end, so seeking features (index, byte ranges, follow) only apply to plain ones.
+COMPRESSION_MAGICS = (('gzip', '\x1f\x8b'), ('bz2', 'BZh'), ('xz', '\xfd7zXZ\x00'))
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz'}
+DECOMPRESS_READ_SIZE = 1 << 20
+
+
+def getLogCompression(file_path):
+    """Compression of file_path judging by its magic bytes, one of COMPRESSION_MAGICS, or None."""
+    with open(file_path, 'rb') as f:
+        head = f.read(6)
+    for compression, magic in COMPRESSION_MAGICS:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _importLzma():
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise Exception('xz needs the lzma module, from backports.lzma on Python 2')
+    return lzma
+
+
+def _createDecompressor(compression):
+    if compression == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if compression == 'bz2':
+        return bz2.BZ2Decompressor()
+    return _importLzma().LZMADecompressor()
+
+
+class DecompressingReader(io.RawIOBase):
+    """Raw stream of the decompressed content of a gzip, bz2 or xz file.
+
+       The file is read DECOMPRESS_READ_SIZE bytes at a time; concatenated streams, as appending
+       to a compressed file leaves, are decompressed one after the other, and a last stream cut
+       short, by a collector still writing, ends the content at what could be decompressed.
+    """
+
+
+    def __init__(self, file_path, compression):
+        self.file = open(file_path, 'rb')
+        self.compression = compression
+        self.decompressor = _createDecompressor(compression)
+        self.pending = ''
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while self.position == len(self.pending):
+            data = self.decompressor.unused_data
+            if data:
+                self.decompressor = _createDecompressor(self.compression)
+            else:
+                data = self.file.read(DECOMPRESS_READ_SIZE)
+                if not data: return 0
+            try:
+                self.pending = self.decompressor.decompress(data)
+            except EOFError:
+                self.decompressor = _createDecompressor(self.compression)
+                self.pending = self.decompressor.decompress(data)
+            self.position = 0
+        size = min(len(buffer), len(self.pending) - self.position)
+        buffer[:size] = self.pending[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.file.close()
+        io.RawIOBase.close(self)
+
+
+def openLogFile(file_path, compression=None):
+    """Text log opened for reading, streaming its decompressed content if compression is set."""
+    if compression is None:
+        return open(file_path, 'r')
+    return io.BufferedReader(DecompressingReader(file_path, compression), DECOMPRESS_READ_SIZE)
+
+
+def openCompressedFile(file_path, compression, mode='wb'):
+    """File object writing file_path compressed with compression, one of COMPRESSION_MAGICS."""
+    if compression == 'gzip':
+        return gzip.GzipFile(file_path, mode, 6)
+    if compression == 'bz2':
+        return bz2.BZ2File(file_path, mode, compresslevel=9)
+    if compression == 'xz':
+        return _importLzma().LZMAFile(file_path, mode)
+    raise Exception('unknown compression ' + compression)
+
+
+class LogIndex(object):
+    """Sidecar index of a log file, saved next to it as <log>.idx.
+
+       For every '-------- <date> --------' header it records the sample timestamp, refined by the
+       UptimeClock, and the byte offsets of the header and of the sample's /proc/stat and
+       /proc/meminfo sections (-1 when the sample has none). The log's size and mtime are stored
+       too, and an index that no longer matches them is treated as missing.
+    """
+
+    SUFFIX = '.idx'
+    VERSION = 3
+
+
+    def __init__(self, file_path, size, mtime):
+        self.file_path = file_path
+        self.size = size
+        self.mtime = mtime
+        self.timestamps = []
+        self.header_offsets = []
+        self.stat_offsets = []
+        self.meminfo_offsets = []
+        self._sorted = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @classmethod
+    def getIndexPath(cls, file_path):
+        return file_path + cls.SUFFIX
+
+    @classmethod
+    def load(cls, file_path):
+        """Returns the saved index of file_path, or None if there is none or it is stale."""
+        try:
+            with open(cls.getIndexPath(file_path), 'r') as f:
+                content = json.load(f)
+        except (IOError, ValueError):
+            return None
+        file_stat = os.stat(file_path)
+        if content.get('version') != cls.VERSION or content['size'] != file_stat.st_size or \
+           content['mtime'] != file_stat.st_mtime:
+            return None
+        index = cls(file_path, content['size'], content['mtime'])
+        index.timestamps = content['timestamps']
+        index.header_offsets = content['header_offsets']
+        index.stat_offsets = content['stat_offsets']
+        index.meminfo_offsets = content['meminfo_offsets']
+        return index
+
+    def save(self):
+        content = {'version': self.VERSION,
+                   'size': self.size,
+                   'mtime': self.mtime,
+                   'timestamps': self.timestamps,
+                   'header_offsets': self.header_offsets,
+                   'stat_offsets': self.stat_offsets,
+                   'meminfo_offsets': self.meminfo_offsets}
+        with open(self.getIndexPath(self.file_path), 'w') as f:
+            json.dump(content, f)
+
+    def addHeader(self, timestamp, offset):
+        self._sorted = None
+        self.timestamps.append(timestamp)
+        self.header_offsets.append(offset)
+        self.stat_offsets.append(-1)
+        self.meminfo_offsets.append(-1)
+
+    def isSorted(self):
+        """Binary search needs increasing timestamps; a device clock jump breaks that."""
+        if self._sorted is None:
+            self._sorted = all(self.timestamps[i] <= self.timestamps[i + 1] for i in xrange(len(self) - 1))
+        return self._sorted
+
+    def findRange(self, start, end):
+        """Returns the [first, stop) entries lying in the [start, end) window, in seconds from the
+           first sample, by binary search. end < 0 means up to the last sample.
+        """
+        if len(self) == 0: return 0, 0
+        origin = self.timestamps[0]
+        elapsed = _ElapsedSeconds(self.timestamps, origin)
+        first = bisect.bisect_left(elapsed, start)
+        stop = len(self) if end < 0 else max(first, bisect.bisect_left(elapsed, end))
+        return first, stop
+
+
+class _ElapsedSeconds(object):
+    """Lazy getElapsedSeconds view of a timestamp list, so bisect only touches log(n) items."""
+
+
+    def __init__(self, timestamps, origin):
+        self.timestamps = timestamps
+        self.origin = origin
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        return getElapsedSeconds(self.timestamps[index], self.origin)
+
+
+class SampleCache(object):
+    """Parsed tables of a whole log file, saved next to it as <log>.cache.npz.
+
+       The samples before the last header (the body) are kept apart from the last sample (the
+       tail), which the collector may still be writing. Along with them go the log's size and
+       mtime, a digest of its first bytes and the offset of that last header: as long as the log
+       has only been appended to, parsing resumes from there and the new samples join the body.
+    """
+
+    SUFFIX = '.cache.npz'
+    VERSION = 6
+    HEAD_SIZE = 65536
+
+
+    def __init__(self, file_path, size, mtime, head_digest, origin, resume_offset, body, tail):
+        self.file_path = file_path
+        self.size = size
+        self.mtime = mtime
+        self.head_digest = head_digest
+        self.origin = origin
+        self.resume_offset = resume_offset
+        self.body = body
+        self.tail = tail
+
+    @classmethod
+    def getCachePath(cls, file_path):
+        return file_path + cls.SUFFIX
+
+    @classmethod
+    def getHeadDigest(cls, file_path, resume_offset):
+        with open(file_path, 'rb') as f:
+            return hashlib.md5(f.read(min(cls.HEAD_SIZE, resume_offset))).hexdigest()
+
+    @classmethod
+    def load(cls, file_path):
+        """Returns the saved cache of file_path, or None if there is none or it is unreadable."""
+        try:
+            content = np.load(cls.getCachePath(file_path))
+            if int(content['version']) != cls.VERSION: return None
+            tables = []
+            for part in ('body', 'tail'):
+                counters = dict((name, content[part + '_cpu_' + name]) for name in ProcStatTable.CPU_COUNTERS)
+                tables.append((ProcStatTable(content[part + '_cpu_timestamps'], counters,
+                                             content[part + '_cpu_present']),
+                               ProcMeminfoTable(content[part + '_mem_timestamps'],
+                                                [str(key) for key in content[part + '_mem_keys']],
+                                                content[part + '_mem_values'])))
+            return cls(file_path, int(content['size']), float(content['mtime']), str(content['head_digest']),
+                       float(content['origin']), int(content['resume_offset']), tables[0], tables[1])
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def save(self):
+        content = {'version': self.VERSION,
+                   'size': self.size,
+                   'mtime': self.mtime,
+                   'head_digest': self.head_digest,
+                   'origin': self.origin,
+                   'resume_offset': self.resume_offset}
+        for part, (cpu_stats, mem_stats) in (('body', self.body), ('tail', self.tail)):
+            content[part + '_cpu_timestamps'] = cpu_stats.timestamps
+            content[part + '_cpu_present'] = cpu_stats.present
+            for name in ProcStatTable.CPU_COUNTERS:
+                content[part + '_cpu_' + name] = cpu_stats.counters[name]
+            content[part + '_mem_timestamps'] = mem_stats.timestamps
+            content[part + '_mem_keys'] = np.array(mem_stats.keys, dtype=str)
+            content[part + '_mem_values'] = mem_stats.values
+        cache_path = self.getCachePath(self.file_path)
+        temp_path = cache_path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, **content)
+        os.rename(temp_path, cache_path)
+
+    def isCurrent(self, file_stat):
+        return self.size == file_stat.st_size and self.mtime == file_stat.st_mtime
+
+    def isPrefixOf(self, file_stat):
+        """Whether the log only grew since the cache was saved, judging by its size and first bytes."""
+        return file_stat.st_size >= self.size and \
+               self.getHeadDigest(self.file_path, self.resume_offset) == self.head_digest
+
+    def getTables(self):
+        return (ProcStatTable.concatenate([self.body[0], self.tail[0]]),
+                ProcMeminfoTable.concatenate([self.body[1], self.tail[1]]))
+
+
 class LogParser(object):
 
+    DATE_REGEXP = re.compile('^--------\s+[a-zA-Z]{3,}\s+[a-zA-Z]{3,}\s+[0-9]{1,2}\s+[0-9]{2,}:[0-9]{2,}:[0-9]{2,}\s+GMT\s+[0-9]{4,}\s+--------')
+    PROC_STAT_START_REGEXP = re.compile('^---- /proc/stat')
+    PROC_MEMINFO_START_REGEXP = re.compile('^---- /proc/meminfo')
+    UPTIME_START_REGEXP = re.compile('^---- /proc/uptime')
 
-    def __init__(self, file_path):
+
+    def __init__(self, file_path, profiler=None):
+        """With a PhaseProfiler, the parsing of every section type of text logs is timed as a part."""
         self.file_path = file_path
+        self.profiler = profiler
+        self._minute_dates = {}
+        self._clock = None
+
+    def parseLogFile(self, start=0, end=-1, index=None, jobs=1):
+        """Returns the ProcStatTable and ProcMeminfoTable of the [start, end) window.
+
+           With jobs > 1 the file is cut into byte ranges that begin at sample headers, and each
+           range is parsed in its own process. The raw counter tables are concatenated in file
+           order, so the intervals spanning two ranges are computed exactly as in one process.
+
+           Binary captures (see resource_stats_capture) are recognized by their magic bytes and
+           read directly, index and jobs being unnecessary for them. So are gzip, bz2 and xz
+           compressed logs, which are decompressed while they are parsed, in one pass.
+        """
+        if isCaptureFile(self.file_path):
+            return self.parseCaptureFile(start, end)
+        if getLogCompression(self.file_path) is not None:
+            return self._buildTables(self.iterSamples(start, end))
+        if jobs > 1:
+            return self._parseLogFileInParallel(start, end, index, jobs)
+        return self._buildTables(self.iterSamples(start, end, index))
+
+    def parseCaptureFile(self, start=0, end=-1):
+        """Returns the ProcStatTable and ProcMeminfoTable of the [start, end) window of a capture."""
+        if start < 0: start = 0
+        data = CaptureReader(self.file_path).read()
+        counters = dict((name, np.ascontiguousarray(data.counters[:, :, i]))
+                        for i, name in enumerate(CAPTURE_CPU_COUNTERS))
+        cpu_stats = ProcStatTable(data.cpu_timestamps, counters, data.present)
+        mem_stats = ProcMeminfoTable.fromCompleteRows(data.mem_timestamps, data.meminfo_keys, data.meminfo_values,
+                                                      data.meminfo_present)
+        if data.origin is None:
+            return cpu_stats, mem_stats
+        return cpu_stats.selectWindow(data.origin, start, end), mem_stats.selectWindow(data.origin, start, end)
+
+    def parseTopTable(self, start=0, end=-1):
+        """Returns the TopTable of the top sections in the [start, end) window.
+
+           Top sections are skipped by the other parse methods; this reads them in a pass of its own.
+           Captures only hold the top output when the collector kept it.
+        """
+        if start < 0: start = 0
+        builder = TopTableBuilder()
+        if isCaptureFile(self.file_path):
+            data = CaptureReader(self.file_path).read()
+            for timestamp, text in data.tops:
+                date = toDate(timestamp)
+                if self._isInWindow(date - toDate(data.origin), start, end):
+                    top_data = TopData(date)
+                    top_data.parseText(StringIO(text))
+                    builder.append(top_data)
+            return builder.build()
+        with self.openLog() as f:
+            for sample in self._iterSections(f, start, end, top=True):
+                if isinstance(sample, TopData):
+                    builder.append(sample)
+        return builder.build()
+
+    def parseSchedstatTable(self, start=0, end=-1):
+        """Returns the SchedstatTable of the /proc/schedstat sections in the [start, end) window.
+
+           Like top sections, schedstat sections are skipped by the other parse methods and read
+           in a pass of their own.
+        """
+        if start < 0: start = 0
+        if isCaptureFile(self.file_path):
+            data = CaptureReader(self.file_path).read()
+            counters = dict((name, np.ascontiguousarray(data.schedstat_counters[:, :, i]))
+                            for i, name in enumerate(CAPTURE_SCHEDSTAT_COUNTERS))
+            table = SchedstatTable(data.schedstat_timestamps, counters, data.schedstat_present)
+            return table.selectWindow(data.origin, start, end) if data.origin is not None else table
+        builder = ProcStatTableBuilder(table_class=SchedstatTable)
+        with self.openLog() as f:
+            for sample in self._iterSections(f, start, end, schedstat=True):
+                if isinstance(sample, SchedstatData):
+                    builder.append(sample)
+        return builder.build()
+
+    def writeCapture(self, file_path, compress=False):
+        """Converts the log to a binary capture, one record per sample header."""
+        with open(file_path, 'wb') as f, self.openLog() as log_file:
+            writer = CaptureWriter(f, compress)
+            date = None
+            sections = {}
+            for sample in self._iterSections(log_file, 0, -1, schedstat=True):
+                section = type(sample)
+                if sections and (sample.date != date or section in sections):
+                    self._writeCaptureSample(writer, date, sections)
+                    sections = {}
+                date = sample.date
+                sections[section] = sample.data
+            if sections:
+                self._writeCaptureSample(writer, date, sections)
+            writer.close()
+
+    def _writeCaptureSample(self, writer, date, sections):
+        writer.writeSample(toTimestamp(date), sections.get(ProcStatData, {}), sections.get(ProcMeminfoData, {}),
+                           schedstat=sections.get(SchedstatData))
+
+    def parseCachedLogFile(self, start=0, end=-1, jobs=1):
+        """Same as parseLogFile, going through the SampleCache of the file.
+
+           Only the part of the log written since the cache was saved is parsed, then the cache is
+           updated; a cache of a log that was rewritten rather than appended to is discarded.
+        """
+        if start < 0: start = 0
+        file_stat = os.stat(self.file_path)
+        cache = SampleCache.load(self.file_path)
+        if cache is None or not cache.isCurrent(file_stat):
+            cache = self._updateCache(cache, file_stat, jobs)
+            try:
+                cache.save()
+            except (IOError, OSError):
+                pass
+        cpu_stats, mem_stats = cache.getTables()
+        return cpu_stats.selectWindow(cache.origin, start, end), mem_stats.selectWindow(cache.origin, start, end)
+
+    def parseByteRange(self, begin, stop, start=0, end=-1, origin=None, previous_date=None):
+        """Parses the samples whose headers lie in [begin, stop), begin being a header offset.
+
+           origin is the date of the first sample of the whole file, which the window is measured
+           from; it defaults to the first sample of the range. previous_date is the date of the
+           sample before begin, see UptimeClock.getDate.
+        """
+        return self._buildTables(self.iterByteRange(begin, stop, start, end, origin, previous_date))
 
-    def parseLogFile(self, start=0, end=-1):
+    def iterByteRange(self, begin, stop, start=0, end=-1, origin=None, previous_date=None):
+        """Generator version of parseByteRange; stop < 0 reads to the end of the file."""
         if start < 0: start = 0
-        date_regexp = re.compile('^--------\s+[a-zA-Z]{3,}\s+[a-zA-Z]{3,}\s+[0-9]{1,2}\s+[0-9]{2,}:[0-9]{2,}:[0-9]{2,}\s+GMT\s+[0-9]{4,}\s+--------')
-        proc_stat_start_regexp = re.compile('^---- /proc/stat')
-        proc_meminfo_start_regexp = re.compile('^---- /proc/meminfo')
-        start_date = None
-        current_date = None
-        cpu_stats = []
-        mem_stats = []
-        f = open(self.file_path, 'r')
+        with open(self.file_path, 'r') as f:
+            f.seek(begin)
+            for sample in self._iterSections(f, start, end, origin, stop, previous_date=previous_date):
+                yield sample
+
+    def iterSamples(self, start=0, end=-1, index=None):
+        """Yields ProcStatData and ProcMeminfoData in file order, one section at a time, skipping
+           the ones outside the [start, end) window measured in seconds from the first sample.
+
+           With a LogIndex of the file, only the sections inside the window are read, by seeking
+           straight to them; the index is ignored for compressed logs.
+        """
+        if start < 0: start = 0
+        if isCaptureFile(self.file_path):
+            for sample in self._iterCaptureSamples(start, end):
+                yield sample
+            return
+        compression = getLogCompression(self.file_path)
+        with openLogFile(self.file_path, compression) as f:
+            if index is not None and index.isSorted() and compression is None:
+                sections = self._iterIndexedSections(f, index, start, end)
+            else:
+                sections = self._iterSections(f, start, end)
+            for sample in sections:
+                yield sample
+
+    def getIndex(self):
+        """Returns the sidecar LogIndex of the file, building and saving it if missing or stale."""
+        index = LogIndex.load(self.file_path)
+        if index is None:
+            index = self.buildIndex()
+            try:
+                index.save()
+            except (IOError, OSError):
+                pass
+        return index
+
+    def openLog(self):
+        """The log opened for reading, decompressed on the fly if it is compressed."""
+        return openLogFile(self.file_path, getLogCompression(self.file_path))
+
+    def buildIndex(self):
+        if getLogCompression(self.file_path) is not None:
+            raise Exception('compressed logs cannot be indexed, they are read from start to end')
+        file_stat = os.stat(self.file_path)
+        index = LogIndex(self.file_path, file_stat.st_size, file_stat.st_mtime)
+        clock = self.getClock()
+        header_date = current_date = previous_date = None
+        uptime_data = None
+        offset = 0
+        with open(self.file_path, 'r') as f:
+            for line in f:
+                if uptime_data is not None:
+                    uptime_data.parseText(StringIO(line))
+                    if uptime_data.uptime is not None:
+                        current_date = clock.getDate(header_date, uptime_data.uptime, previous_date)
+                        index.timestamps[-1] = toTimestamp(current_date)
+                    uptime_data = None
+                if line.startswith('-'):
+                    if line.startswith('--------') and self.DATE_REGEXP.search(line):
+                        previous_date = current_date
+                        header_date = self.__parseDateText(line)
+                        current_date = clock.getDate(header_date, None, previous_date)
+                        index.addHeader(toTimestamp(current_date), offset)
+                    elif len(index) > 0 and self.UPTIME_START_REGEXP.search(line):
+                        uptime_data = UptimeData(header_date)
+                    elif len(index) > 0 and self.PROC_STAT_START_REGEXP.search(line):
+                        index.stat_offsets[-1] = offset
+                    elif len(index) > 0 and self.PROC_MEMINFO_START_REGEXP.search(line):
+                        index.meminfo_offsets[-1] = offset
+                offset += len(line)
+        return index
+
+    def _iterCaptureSamples(self, start, end):
+        cpu_stats, mem_stats = self.parseCaptureFile(start, end)
+        i = j = 0
+        while i < len(mem_stats) or j < len(cpu_stats):
+            if j == len(cpu_stats) or (i < len(mem_stats) and mem_stats.timestamps[i] <= cpu_stats.timestamps[j]):
+                yield mem_stats[i]
+                i += 1
+            else:
+                yield cpu_stats[j]
+                j += 1
+
+    def _buildTables(self, samples):
+        cpu_stats = ProcStatTableBuilder()
+        mem_stats = ProcMeminfoTableBuilder()
+        for sample in samples:
+            if isinstance(sample, ProcStatData):
+                cpu_stats.append(sample)
+            else:
+                mem_stats.append(sample)
+        return cpu_stats.build(), mem_stats.build()
+
+    def _updateCache(self, cache, file_stat, jobs):
+        size = file_stat.st_size
+        if getLogCompression(self.file_path) is not None:
+            origin = self.findFirstDate() or datetime.utcfromtimestamp(0)
+            head_digest = SampleCache.getHeadDigest(self.file_path, size)
+            return SampleCache(self.file_path, size, file_stat.st_mtime, head_digest, toTimestamp(origin), size,
+                               self._buildTables(self.iterSamples()), self._buildTables([]))
+        resume_offset = self.findLastHeaderOffset(size)
+        if cache is not None and cache.isPrefixOf(file_stat) and cache.resume_offset <= resume_offset:
+            origin = toDate(cache.origin)
+            cpu_stats, mem_stats = self._parseBytes(cache.resume_offset, resume_offset, origin, jobs,
+                                                    getLastDate(cache.body))
+            body = (ProcStatTable.concatenate([cache.body[0], cpu_stats]),
+                    ProcMeminfoTable.concatenate([cache.body[1], mem_stats]))
+        else:
+            origin = self.findFirstDate() or datetime.utcfromtimestamp(0)
+            body = self._parseBytes(0, resume_offset, origin, jobs)
+        tail = self.parseByteRange(resume_offset, size, origin=origin, previous_date=getLastDate(body))
+        return SampleCache(self.file_path, size, file_stat.st_mtime,
+                           SampleCache.getHeadDigest(self.file_path, resume_offset),
+                           toTimestamp(origin), resume_offset, body, tail)
+
+    def findLastHeaderOffset(self, size):
+        """Offset of the last complete sample header, found by reading the file backwards."""
+        block_size = 65536
+        with open(self.file_path, 'r') as f:
+            stop = size
+            while stop > 0:
+                begin = max(0, stop - block_size)
+                f.seek(begin)
+                block = f.read(stop - begin + 256)
+                position = block.rfind('\n--------', 0, stop - begin + 8)
+                while position >= 0:
+                    line_end = block.find('\n', position + 1)
+                    if line_end >= 0 and self.DATE_REGEXP.search(block[position + 1:line_end + 1]):
+                        return begin + position + 1
+                    position = block.rfind('\n--------', 0, position + 8)
+                stop = begin
+        return 0
+
+    def _parseBytes(self, begin, stop, origin, jobs, previous_date=None):
+        if jobs > 1:
+            return self._parseByteRangesInParallel(self._splitByteRange(begin, stop, jobs), 0, -1, origin, jobs,
+                                                   previous_date)
+        return self.parseByteRange(begin, stop, origin=origin, previous_date=previous_date)
+
+    def _parseLogFileInParallel(self, start, end, index, jobs):
+        if start < 0: start = 0
+        origin = self.findFirstDate()
+        if origin is None:
+            return self._buildTables([])
+        ranges = self._getByteRanges(jobs, index, start, end)
+        return self._parseByteRangesInParallel(ranges, start, end, origin, jobs)
+
+    def _parseByteRangesInParallel(self, ranges, start, end, origin, jobs, previous_date=None):
+        """The ranges are parsed apart, so the date of the sample before each of them is only known
+           once they are all parsed: the first dates of a range are then clamped to it as
+           UptimeClock.getDate would have.
+        """
+        pool = multiprocessing.Pool(min(jobs, len(ranges)))
+        try:
+            results = pool.map(_parseByteRange, [(self.file_path, begin, stop, start, end, origin,
+                                                  previous_date if i == 0 else None)
+                                                 for i, (begin, stop) in enumerate(ranges)])
+        finally:
+            pool.close()
+            pool.join()
+        previous = None
+        for tables in results:
+            if previous is not None:
+                for table in tables:
+                    table.timestamps[(table.timestamps < previous) & (table.timestamps > previous - 1)] = previous
+            last_date = getLastDate(tables)
+            if last_date is not None: previous = toTimestamp(last_date)
+        return (ProcStatTable.concatenate([cpu_stats for cpu_stats, _ in results]),
+                ProcMeminfoTable.concatenate([mem_stats for _, mem_stats in results]))
+
+    def findFirstDate(self):
+        with self.openLog() as f:
+            for line in f:
+                if self.DATE_REGEXP.search(line):
+                    return self.__parseDateText(line)
+        return None
+
+    def findClockAnchor(self):
+        """(header date, uptime) of the first sample of the log, None if it has no /proc/uptime."""
+        with self.openLog() as f:
+            date = None
+            line = f.readline()
+            while line:
+                if line.startswith('--------') and self.DATE_REGEXP.search(line):
+                    if date is not None: break
+                    date = self.__parseDateText(line)
+                elif date is not None and self.UPTIME_START_REGEXP.search(line):
+                    uptime_data = UptimeData(date)
+                    uptime_data.parseText(f)
+                    return None if uptime_data.uptime is None else (date, uptime_data.uptime)
+                line = f.readline()
+        return None
+
+    def getClock(self):
+        """The UptimeClock anchored at the first sample, which every parse of the file shares. A
+           missing anchor is looked for again next time, the first sample may still be written.
+        """
+        if self._clock is None:
+            anchor = self.findClockAnchor()
+            if anchor is None:
+                return UptimeClock()
+            self._clock = UptimeClock(anchor)
+        return self._clock
+
+    def _getByteRanges(self, jobs, index, start, end):
+        """Splits the file, or the indexed window, into at most jobs header-aligned byte ranges."""
+        size = os.path.getsize(self.file_path)
+        if index is not None and index.isSorted():
+            first, stop = index.findRange(start, end)
+            if first == stop: return [(size, size)]
+            step = max(1, -(-(stop - first) // jobs))
+            offsets = [index.header_offsets[i] for i in xrange(first, stop, step)]
+            offsets.append(index.header_offsets[stop] if stop < len(index) else size)
+            return zip(offsets[:-1], offsets[1:])
+        return self._splitByteRange(0, size, jobs)
+
+    def _splitByteRange(self, begin, stop, jobs):
+        """Cuts [begin, stop), begin being a header offset, into at most jobs header-aligned ranges."""
+        offsets = [begin]
+        with open(self.file_path, 'r') as f:
+            for k in xrange(1, jobs):
+                f.seek(max(begin + (stop - begin) * k // jobs, offsets[-1]))
+                f.readline()
+                offset = f.tell()
+                line = f.readline()
+                while line and offset < stop and not self.DATE_REGEXP.search(line):
+                    offset = f.tell()
+                    line = f.readline()
+                if line and offsets[-1] < offset < stop:
+                    offsets.append(offset)
+        offsets.append(stop)
+        return zip(offsets[:-1], offsets[1:])
+
+    def _iterIndexedSections(self, f, index, start, end):
+        first, stop = index.findRange(start, end)
+        for i in xrange(first, stop):
+            date = toDate(index.timestamps[i])
+            sections = [(index.meminfo_offsets[i], ProcMeminfoData), (index.stat_offsets[i], ProcStatData)]
+            for offset, data_class in sorted(sections, key=lambda section: section[0]):
+                if offset < 0: continue
+                f.seek(offset)
+                f.readline()
+                data = data_class(date)
+                self._parseSection(data, f)
+                yield data
+
+    def _iterSections(self, f, start, end, start_date=None, stop=-1, top=False, schedstat=False,
+                      previous_date=None):
+        """Sample dates are refined by the /proc/uptime section following their header, if any;
+           previous_date is the date of the sample before the first one read.
+        """
+        clock = self.getClock()
+        current_date = previous_date
+        header_date = None
+        is_origin = False
         line = f.readline()
         while line:
-            if date_regexp.search(line):
-                current_date = self.__parseDateText(line)
-                if not start_date: start_date = current_date
+            if not line.startswith('--'):
+                line = f.readline()
+            elif line.startswith('--------') and self.DATE_REGEXP.search(line):
+                if stop >= 0 and f.tell() - len(line) >= stop: break
+                previous_date = current_date
+                header_date = self.__parseDateText(line)
+                current_date = clock.getDate(header_date, None, previous_date)
+                is_origin = not start_date
+                if is_origin: start_date = current_date
                 line = f.readline()
-            elif proc_stat_start_regexp.search(line):
+            elif line.startswith('---- /proc/uptime'):
+                uptime_data = UptimeData(header_date)
+                line = self._parseSection(uptime_data, f)
+                if header_date is not None:
+                    current_date = clock.getDate(header_date, uptime_data.uptime, previous_date)
+                    if is_origin: start_date = current_date
+            elif line.startswith('---- /proc/stat'):
                 proc_stat_data = ProcStatData(current_date)
-                line = proc_stat_data.parseText(f)
-                delta = (current_date - start_date).seconds
-                if (delta >= start) and ((delta < end) or (end < 0)):
-                    cpu_stats.append(proc_stat_data)
-            elif proc_meminfo_start_regexp.search(line):
+                line = self._parseSection(proc_stat_data, f)
+                if self._isInWindow(current_date - start_date, start, end):
+                    yield proc_stat_data
+            elif line.startswith('---- /proc/meminfo'):
                 proc_meminfo_data = ProcMeminfoData(current_date)
-                line = proc_meminfo_data.parseText(f)
-                delta = (current_date - start_date).seconds
-                if end < 0 or (delta >= start and delta < end):
-                    mem_stats.append(proc_meminfo_data)
+                line = self._parseSection(proc_meminfo_data, f)
+                if self._isInWindow(current_date - start_date, start, end):
+                    yield proc_meminfo_data
+            elif schedstat and line.startswith('---- /proc/schedstat'):
+                schedstat_data = SchedstatData(current_date)
+                line = self._parseSection(schedstat_data, f)
+                if self._isInWindow(current_date - start_date, start, end):
+                    yield schedstat_data
+            elif top and line.startswith('---- top'):
+                top_data = TopData(current_date)
+                line = self._parseSection(top_data, f)
+                if self._isInWindow(current_date - start_date, start, end):
+                    yield top_data
             else:
                 line = f.readline()
-        return cpu_stats, mem_stats
+
+    def _parseSection(self, data, f):
+        if self.profiler is None:
+            return data.parseText(f)
+        begin = time.time()
+        line = data.parseText(f)
+        self.profiler.addPartTime('parse ' + type(data).__name__, time.time() - begin)
+        return line
+
+    def _isInWindow(self, elapsed, start, end):
+        return isInWindow(elapsed.total_seconds(), start, end)
 
     def __parseDateText(self, text):
+        """Headers are split on whitespace and strptime runs once per minute, the seconds being
+           added to the cached minute; anything unexpected goes through the regexp and strptime.
+        """
+        fields = text.split()
+        if len(fields) == 8 and fields[0] == fields[7] == '--------':
+            clock = fields[4]
+            if len(clock) == 8 and clock[5] == ':' and clock[6:].isdigit():
+                minute = ' '.join(fields[1:4] + [clock[:5]] + fields[5:7])
+                date = self._minute_dates.get(minute)
+                if date is None:
+                    try:
+                        date = datetime.strptime(minute, '%a %b %d %H:%M %Z %Y')
+                    except ValueError:
+                        date = None
+                    self._minute_dates[minute] = date
+                if date is not None:
+                    return date + timedelta(seconds=int(clock[6:]))
         date_text = re.match('(.*)-------- (.*) --------', text).group(2)
         date = datetime.strptime(re.sub('\s+', ' ', date_text), '%a %b %d %H:%M:%S %Z %Y')
         return date
 
 
+def _parseByteRange(args):
+    file_path, begin, stop, start, end, origin, previous_date = args
+    return LogParser(file_path).parseByteRange(begin, stop, start, end, origin, previous_date)
+
+
 if __name__ == '__main__':
     script_description = """
                            This script is for obtaining high-level android phone hardware 
@@ -552,13 +3225,186 @@ if __name__ == '__main__':
     args_parser.add_argument('--start', type=int, default=0, help='start timestamp, start from 0s')
     args_parser.add_argument('--end', type=int, default=-1, help='end timestamp')
     args_parser.add_argument('--export_csv', action='store_true', help='whether to export data as csv')
+    args_parser.add_argument('--export', type=str, nargs='+', default=[],
+                             help='export the series to these files, as .csv, .npz, .npy (a record per interval) '
+                                  'or .jsonl (a JSON object per interval)')
+    args_parser.add_argument('--streaming', action='store_true',
+                             help='reduce samples as they are parsed in constant memory, summary only')
+    args_parser.add_argument('--index', action='store_true',
+                             help='seek to the --start/--end window through the <input_file>.idx sidecar index, '
+                                  'building it first if it is missing or stale')
+    args_parser.add_argument('--jobs', type=int, default=1, help='number of processes parsing the log in parallel')
+    args_parser.add_argument('--follow', action='store_true',
+                             help='keep reading what the collector appends to the log and reprint the summary '
+                                  'with 1/5/15 minute rolling windows')
+    args_parser.add_argument('--refresh', type=float, default=10, help='seconds between two --follow reports')
+    args_parser.add_argument('--cache', action='store_true',
+                             help='keep the parsed samples in <input_file>.cache.npz and only parse what was '
+                                  'appended to the log since')
+    args_parser.add_argument('--resample', type=str,
+                             help='aggregate the series into buckets of this duration, e.g. 1m, for the summary '
+                                  'and the exports, which then hold the bucket mean, min and max')
+    args_parser.add_argument('--windows', type=str,
+                             help='summaries of several windows from one parse: [name=]start:end,... or a phase '
+                                  'marker file with "name start [end]" lines')
+    args_parser.add_argument('--spikes', type=str, nargs='*', metavar='SERIES:THRESHOLD:DURATION',
+                             help='list spike episodes, z-score anomalies and memory growth; rules default to ' +
+                                  ' '.join('{0}:{1:g}:{2}'.format(*rule) for rule in DEFAULT_SPIKE_RULES))
+    args_parser.add_argument('--zscore_window', type=int, default=20,
+                             help='values before each value its --spikes z-score is computed against')
+    args_parser.add_argument('--zscore_threshold', type=float, default=3.0, help='|z-score| of --spikes anomalies')
+    args_parser.add_argument('--percentiles', nargs='?', const='sketch', choices=('sketch', 'exact'),
+                             help='also report p50/p90/p95/p99 and histograms of the overall CPU, per-core CPU and '
+                                  'memory series, from quantile sketches (default) or exact')
+    args_parser.add_argument('--schedstat', action='store_true',
+                             help='also report per-core run queue wait and scheduling latency from /proc/schedstat')
+    args_parser.add_argument('--top_processes', type=int, default=0,
+                             help='also report the N processes of the top sections with the highest average and '
+                                  'peak CPU and RES')
+    args_parser.add_argument('--profile', action='store_true',
+                             help='report wall time, samples/s and peak memory of every phase: read, parse per '
+                                  'section type, reduce, summarize and export')
+    args_parser.add_argument('--profile_output', type=str, help='dump cProfile statistics of the run to this file')
     args = args_parser.parse_args()
-    log_parser = LogParser(args.input_file)
-    cpu_stats_list, mem_stats_list = log_parser.parseLogFile(args.start, args.end)
-    if len(cpu_stats_list) < 2 or len(mem_stats_list) < 1:
-        raise Exception('Not enough data for calculation')
-    resource_usage_stats = ResourceUsageStats(cpu_stats_list, mem_stats_list)
-    if args.export_csv:
-        resource_usage_stats.exportCSV()
-    res = resource_usage_stats.getSummary(args.start, args.end)
+    if args.streaming and (args.export_csv or args.export):
+        args_parser.error('--export_csv and --export need the full series and cannot be combined with --streaming')
+    for export_path in args.export:
+        if os.path.splitext(export_path)[1] not in ResourceUsageStats.EXPORT_FORMATS:
+            args_parser.error('--export {0}: expected a {1} file'.format(
+                export_path, ', '.join(sorted(ResourceUsageStats.EXPORT_FORMATS))))
+    if args.streaming and (args.jobs > 1 or args.cache):
+        args_parser.error('--jobs and --cache cannot be combined with --streaming')
+    if args.cache and args.index:
+        args_parser.error('--cache already selects the window without --index')
+    if args.follow and (args.streaming or args.cache or args.index or args.export_csv or args.export or args.jobs > 1):
+        args_parser.error('--follow cannot be combined with --streaming, --cache, --index, --export_csv, --export '
+                          'or --jobs')
+    if args.follow and args.top_processes:
+        args_parser.error('--top_processes cannot be combined with --follow')
+    if args.percentiles and args.follow:
+        args_parser.error('--percentiles cannot be combined with --follow')
+    if args.percentiles == 'exact' and args.streaming:
+        args_parser.error('exact --percentiles need the full series and cannot be combined with --streaming')
+    if args.windows and (args.follow or args.streaming or args.schedstat or args.resample or args.percentiles or
+                         args.export_csv or args.export):
+        args_parser.error('--windows cannot be combined with --follow, --streaming, --schedstat, --resample, '
+                          '--percentiles or exports')
+    if args.windows and (args.start != 0 or args.end != -1 or args.index):
+        args_parser.error('--windows sets the windows itself and cannot be combined with --start, --end or --index')
+    if args.windows:
+        try:
+            args.windows = parseWindows(args.windows)
+        except Exception as e:
+            args_parser.error('--windows: {0}'.format(e))
+    if args.spikes is not None and (args.follow or args.streaming or args.windows or args.resample):
+        args_parser.error('--spikes cannot be combined with --follow, --streaming, --windows or --resample')
+    if args.spikes is not None:
+        try:
+            args.spikes = [parseSpikeRule(rule) for rule in args.spikes] or DEFAULT_SPIKE_RULES
+        except Exception as e:
+            args_parser.error('--spikes: {0}'.format(e))
+    if args.zscore_window < 1:
+        args_parser.error('--zscore_window must be positive')
+    if args.resample and (args.follow or args.streaming or args.schedstat):
+        args_parser.error('--resample cannot be combined with --follow, --streaming or --schedstat')
+    if args.resample:
+        try:
+            args.resample = parseDuration(args.resample)
+        except Exception as e:
+            args_parser.error('--resample: {0}'.format(e))
+    if args.schedstat and (args.follow or args.streaming):
+        args_parser.error('--schedstat cannot be combined with --follow or --streaming')
+    if (args.index or args.cache or args.follow) and isCaptureFile(args.input_file):
+        args_parser.error('--index, --cache and --follow only apply to text logs')
+    if (args.index or args.follow or args.jobs > 1) and os.path.isfile(args.input_file) and \
+       getLogCompression(args.input_file) is not None:
+        args_parser.error('--index, --follow and --jobs only apply to uncompressed logs')
+    code_profile = None
+    if args.profile_output:
+        code_profile = cProfile.Profile()
+        code_profile.enable()
+    profiler = PhaseProfiler()
+    if args.follow and args.profile:
+        profiler.addHook(lambda timing: sys.stderr.write(timing.format() + '\n'))
+    log_parser = LogParser(args.input_file, profiler if args.profile else None)
+    index = log_parser.getIndex() if args.index else None
+    if args.follow:
+        follower = LogFollower(args.input_file, profiler=log_parser.profiler)
+        try:
+            while True:
+                if follower.poll() > 0:
+                    print (follower.getReport() + '\n')
+                time.sleep(args.refresh)
+        except KeyboardInterrupt:
+            follower.poll(final=True)
+        res = follower.getReport()
+    elif args.windows:
+        with profiler.phase('parse', remainder='read') as timing:
+            if args.cache:
+                cpu_stats_list, mem_stats_list = log_parser.parseCachedLogFile(jobs=args.jobs)
+            else:
+                cpu_stats_list, mem_stats_list = log_parser.parseLogFile(jobs=args.jobs)
+            timing.samples = len(cpu_stats_list) + len(mem_stats_list)
+        with profiler.phase('index', timing.samples):
+            window_index = WindowIndex(cpu_stats_list, mem_stats_list)
+        summaries = []
+        with profiler.phase('summarize'):
+            for name, start, end in args.windows:
+                try:
+                    summary = window_index.getSummary(start, end)
+                except Exception as e:
+                    summary = 'Stats Range: From {0}s to {1}s\n{2}'.format(start, end, e)
+                summaries.append(('Window ' + name + '\n' if name else '') + summary)
+        res = '\n\n'.join(summaries)
+    elif args.streaming:
+        reducer = StreamingStatsReducer()
+        with profiler.phase('parse and reduce', remainder='read') as timing:
+            for sample in log_parser.iterSamples(args.start, args.end, index):
+                with profiler.part('reduce'):
+                    reducer.addSample(sample)
+            reducer.flush()
+            timing.samples = reducer.getCpuStatsCount() + reducer.getMemStatsCount()
+        if reducer.getCpuStatsCount() < 1 or reducer.getMemStatsCount() < 1:
+            raise Exception('Not enough data for calculation')
+        with profiler.phase('summarize'):
+            res = reducer.getSummary(args.start, args.end, args.percentiles is not None)
+    else:
+        with profiler.phase('parse', remainder='read') as timing:
+            if args.cache:
+                cpu_stats_list, mem_stats_list = log_parser.parseCachedLogFile(args.start, args.end, args.jobs)
+            else:
+                cpu_stats_list, mem_stats_list = log_parser.parseLogFile(args.start, args.end, index, args.jobs)
+            timing.samples = len(cpu_stats_list) + len(mem_stats_list)
+        if len(cpu_stats_list) < 2 or len(mem_stats_list) < 1:
+            raise Exception('Not enough data for calculation')
+        schedstat_list = None
+        if args.schedstat:
+            with profiler.phase('parse schedstat', remainder='read') as timing:
+                schedstat_list = log_parser.parseSchedstatTable(args.start, args.end)
+                timing.samples = len(schedstat_list)
+        resource_usage_stats = ResourceUsageStats(cpu_stats_list, mem_stats_list, schedstat_list, args.resample)
+        with profiler.phase('reduce', len(cpu_stats_list) + len(mem_stats_list)):
+            resource_usage_stats._getReduction()
+        if args.export_csv or args.export:
+            with profiler.phase('export', len(cpu_stats_list)):
+                if args.export_csv:
+                    resource_usage_stats.exportCSV()
+                for export_path in args.export:
+                    resource_usage_stats.export(export_path)
+        with profiler.phase('summarize'):
+            res = resource_usage_stats.getSummary(args.start, args.end, args.percentiles)
+        if args.spikes is not None:
+            with profiler.phase('spikes', len(cpu_stats_list) + len(mem_stats_list)):
+                res += '\n' + resource_usage_stats.getSpikeAnalysis(args.spikes, args.zscore_window,
+                                                                     args.zscore_threshold).format()
+    if args.top_processes > 0:
+        with profiler.phase('parse top', remainder='read') as timing:
+            top_table = log_parser.parseTopTable(args.start, args.end)
+            timing.samples = len(set(top_table.timestamps.tolist()))
+        res += '\n' + formatTopProcesses(top_table, args.top_processes)
+    if code_profile is not None:
+        code_profile.disable()
+        code_profile.dump_stats(args.profile_output)
+    if args.profile and not args.follow:
+        res += '\n' + profiler.formatReport()
     print (res)
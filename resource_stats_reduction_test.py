@@ -1,19 +1,1110 @@
+import os
+import json
+import random
+import shutil
+import tempfile
 import unittest
+from datetime import datetime
+from datetime import timedelta
+from StringIO import StringIO
+import numpy as np
 from resource_stats_reduction import ResourceUsageStats
-from resource_stats_reduction import StatsFactory
+from resource_stats_reduction import StatsReduction
+from resource_stats_reduction import LogParser
 from resource_stats_reduction import CpuStats
+from resource_stats_reduction import CpuOverallUserSysStats
+from resource_stats_reduction import CpuPerCoreUserSysStats
 from resource_stats_reduction import MemStats
+from resource_stats_reduction import MemUsedStats
+from resource_stats_reduction import ProcStatTable
+from resource_stats_reduction import ProcMeminfoTable
+from resource_stats_reduction import StreamingStatsReducer
+from resource_stats_reduction import LogIndex
+from resource_stats_reduction import SampleCache
+from resource_stats_reduction import RollingWindowStats
+from resource_stats_reduction import LogFollower
 from resource_stats_reduction import ProcStatData
 from resource_stats_reduction import ProcMeminfoData
+from resource_stats_reduction import TopData
+from resource_stats_reduction import SchedstatData
+from resource_stats_reduction import SchedstatStats
+from resource_stats_reduction import UptimeClock
+from resource_stats_reduction import TopTableBuilder
+from resource_stats_reduction import QuantileSketch
+from resource_stats_reduction import createQuantileSketch
+from resource_stats_reduction import PhaseProfiler
+from resource_stats_reduction import ResampledReduction
+from resource_stats_reduction import parseDuration
+from resource_stats_reduction import SparseTable
+from resource_stats_reduction import WindowIndex
+from resource_stats_reduction import parseWindows
+from resource_stats_reduction import getLogCompression
+from resource_stats_reduction import openCompressedFile
+from resource_stats_reduction import findRuns
+from resource_stats_reduction import computeRollingZScores
+from resource_stats_reduction import computeGrowthSlope
+from resource_stats_reduction import parseSpikeRule
+from resource_stats_benchmark import scaleSample
+from resource_stats_reduction import toDate
+from resource_stats_reduction import toTimestamp
 
-class TestFactorial(unittest.TestCase):
-    
-    def test_fact(self):
-        expect = 'Hello'
-        actual = 'Hello'
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'SampleData', 'resource_stats_sample')
+
+SAMPLE_SUMMARY = """Stats Range: From 0s to -1s
+Overall CPU - user + sys + irq min: 69.2%
+Overall CPU - user + sys + irq avg: 70.3%
+Overall CPU - user + sys + irq max: 71.4%
+Overall CPU - user + sys + irq Max - Min: 2.2%
+Overall CPU - user + sys + irq Last - First: 2.2%
+Overall CPU - user min: 23.1%
+Overall CPU - user avg: 25.8%
+Overall CPU - user max: 28.6%
+Overall CPU - sys min: 42.9%
+Overall CPU - sys avg: 44.5%
+Overall CPU - sys max: 46.2%
+Per CPU - user + sys min: 69.2%
+Per CPU - user + sys max: 71.4%
+Per CPU - user min: 23.1%
+Per CPU - user max: 28.6%
+Per CPU - sys min: 42.9%
+Per CPU - sys max: 46.2%
+Memory in use (MiB) min: 2675.6
+Memory in use (MiB) avg: 2676.8
+Memory in use (MiB) max: 2677.6
+Memory in use (MiB) Max - Min : 2.1
+Memory in use (MiB) Last - First: 1.8"""
+
+
+class TestResourceUsageStats(unittest.TestCase):
+
+    def setUp(self):
+        self.cpu_stats_list, self.mem_stats_list = LogParser(SAMPLE_FILE).parseLogFile()
+
+    def test_summary(self):
+        stats = ResourceUsageStats(self.cpu_stats_list, self.mem_stats_list)
+        self.assertEqual(SAMPLE_SUMMARY, stats.getSummary(0, -1))
+
+    def test_reduction_matches_stats_iterators(self):
+        reduction = StatsReduction(self.cpu_stats_list, self.mem_stats_list)
+        expect = list(CpuOverallUserSysStats(CpuStats(self.cpu_stats_list)))
+        self.assertEqual(expect, reduction.overall_user_sys.tolist())
+        expect = list(CpuPerCoreUserSysStats(CpuStats(self.cpu_stats_list)))
+        self.assertEqual(expect, reduction.per_core_user_sys.tolist())
+        expect = list(MemUsedStats(MemStats(self.mem_stats_list)))
+        self.assertEqual(expect, reduction.mem_used.tolist())
+        self.assertEqual(8, reduction.core_count)
+        self.assertEqual([s.date for s in self.cpu_stats_list[1:]],
+                         [toDate(t) for t in reduction.timestamps])
+
+    def test_percentages_use_jiffies(self):
+        samples = []
+        for seconds, user, idle in ((0, 0, 0), (1, 100, 300), (9, 150, 350)):
+            stat = ProcStatData(datetime(2018, 4, 5, 22, 52, 0) + timedelta(seconds=seconds))
+            counters = {'user': user, 'nice': 0, 'system': 0, 'idle': idle, 'iowait': 0, 'irq': 0, 'softirq': 0,
+                        'steal': 0}
+            stat.data = {'cpu': counters, 'cpu0': counters}
+            if seconds < 9:
+                stat.data['cpu1'] = counters
+            samples.append(stat)
+        cpu_stats = CpuStats(samples)
+        self.assertEqual([25.0, 50.0], [cpu_stats.getUserPercentage(samples[i], samples[i + 1], 'cpu0')
+                                        for i in xrange(2)])
+        self.assertEqual(0.0, cpu_stats.getUserPercentage(samples[1], samples[2], 'cpu1'))
+        self.assertEqual([[25.0, 25.0, 25.0], [50.0, 50.0, 0.0]], cpu_stats.getUserPercentages().tolist())
+
+    def test_steal_is_accounted_and_guest_is_not(self):
+        samples = []
+        for i, line in enumerate(('cpu0 100 0 100 100 0 0 0 100 40 0\n', 'cpu0 200 0 150 300 0 0 0 250 90 0\n')):
+            stat = ProcStatData(datetime(2018, 4, 5, 22, 52, i))
+            stat.parseText(StringIO(line))
+            samples.append(stat)
+        self.assertEqual(250, samples[1].data['cpu0']['steal'])
+        cpu_stats = CpuStats(samples)
+        self.assertEqual(500, cpu_stats.getTotalDelta(samples[0], samples[1], 'cpu0'))
+        self.assertEqual(20.0, cpu_stats.getUserPercentage(samples[0], samples[1], 'cpu0'))
+        self.assertEqual(10.0, cpu_stats.getSysPercentage(samples[0], samples[1], 'cpu0'))
+        self.assertEqual([[0.0, 20.0]], cpu_stats.getUserPercentages().tolist())
+
+    def test_reduction_is_computed_once(self):
+        stats = ResourceUsageStats(self.cpu_stats_list, self.mem_stats_list)
+        stats.getSummary(0, -1)
+        self.assertIs(stats._getReduction(), stats._getReduction())
+
+
+class TestTruncatedMeminfo(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        with open(SAMPLE_FILE, 'r') as f:
+            text = f.read()
+        begin = text.index('MemFree:', text.index('---- /proc/meminfo', text.index('---- /proc/meminfo') + 1))
+        with open(self.file_path, 'w') as f:
+            f.write(text[:begin] + text[text.index('---- ', begin):])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_incomplete_sample_is_dropped(self):
+        cpu_stats_list, mem_stats_list = LogParser(SAMPLE_FILE).parseLogFile()
+        expect = ResourceUsageStats(cpu_stats_list, mem_stats_list[np.array([0, 2])]).getSummary(0, -1)
+        log_parser = LogParser(self.file_path)
+        capture_path = self.file_path + '.cap'
+        log_parser.writeCapture(capture_path)
+        for cpu_stats_list, mem_stats_list in (log_parser.parseLogFile(), log_parser.parseCachedLogFile(),
+                                               LogParser(capture_path).parseLogFile()):
+            self.assertEqual(2, len(mem_stats_list))
+            self.assertEqual(expect, ResourceUsageStats(cpu_stats_list, mem_stats_list).getSummary(0, -1))
+        reducer = StreamingStatsReducer()
+        for sample in log_parser.iterSamples():
+            reducer.addSample(sample)
+        self.assertEqual(expect, reducer.getSummary(0, -1))
+
+    def test_followed_log(self):
+        follower = LogFollower(self.file_path)
+        follower.poll(final=True)
+        cpu_stats_list, mem_stats_list = LogParser(self.file_path).parseLogFile()
+        expect = ResourceUsageStats(cpu_stats_list, mem_stats_list).getSummary(0, -1)
+        self.assertTrue(follower.getReport().startswith(expect))
+        self.assertEqual(2, len(follower.mem_windows[0]))
+
+
+class TestTruncatedProcStat(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        with open(SAMPLE_FILE, 'r') as f:
+            text = f.read()
+        begin = text.index('cpu ', text.index('---- /proc/stat', text.index('---- /proc/stat') + 1)) + 2
+        with open(self.file_path, 'w') as f:
+            f.write(text[:begin] + '\r\n' + text[text.index('---- ', begin):])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_sample_without_cpu_lines_is_dropped(self):
+        cpu_stats_list, mem_stats_list = LogParser(SAMPLE_FILE).parseLogFile()
+        expect = ResourceUsageStats(cpu_stats_list[np.array([0, 2])], mem_stats_list).getSummary(0, -1)
+        log_parser = LogParser(self.file_path)
+        capture_path = self.file_path + '.cap'
+        log_parser.writeCapture(capture_path)
+        for cpu_stats_list, mem_stats_list in (log_parser.parseLogFile(), log_parser.parseCachedLogFile(),
+                                               LogParser(capture_path).parseLogFile()):
+            self.assertEqual(2, len(cpu_stats_list))
+            self.assertEqual(expect, ResourceUsageStats(cpu_stats_list, mem_stats_list).getSummary(0, -1))
+        reducer = StreamingStatsReducer()
+        for sample in log_parser.iterSamples():
+            reducer.addSample(sample)
+        self.assertEqual(expect, reducer.getSummary(0, -1))
+        follower = LogFollower(self.file_path)
+        follower.poll(final=True)
+        self.assertTrue(follower.getReport().startswith(expect))
+        self.assertEqual(1, len(follower.cpu_windows[0]))
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        log_parser = LogParser(SAMPLE_FILE)
+        cpu_stats_list, mem_stats_list = log_parser.parseLogFile()
+        self.stats = ResourceUsageStats(cpu_stats_list, mem_stats_list, log_parser.parseSchedstatTable())
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_csv(self):
+        file_path = os.path.join(self.temp_dir, 'stats.csv')
+        for batch_rows in (1, 4096):
+            self.assertEqual(file_path, self.stats.exportCSV(file_path, batch_rows))
+            with open(file_path, 'r') as f:
+                lines = f.read().splitlines()
+            self.assertEqual(3, len(lines))
+            self.assertTrue(lines[0].startswith('time,overall cpu,cpu0,'))
+            self.assertTrue(lines[0].endswith(',mem,cpu0 run queue wait ms,cpu1 run queue wait ms,cpu2 run queue wait '
+                                              'ms,cpu3 run queue wait ms,cpu4 run queue wait ms,cpu5 run queue wait '
+                                              'ms,cpu6 run queue wait ms,cpu7 run queue wait ms,latency per '
+                                              'timeslice ms'))
+            self.assertTrue(lines[1].startswith('18/04/05-22:52:32,' + ','.join([repr(900 / 13.0)] * 9) +
+                                                ',2741884,100.210419,'))
+
+    def test_dropped_schedstat_section(self):
+        with open(SAMPLE_FILE, 'r') as f:
+            text = f.read()
+        begin = text.index('---- /proc/schedstat', text.index('---- /proc/schedstat') + 1)
+        file_path = os.path.join(self.temp_dir, 'resource_stats')
+        with open(file_path, 'w') as f:
+            f.write(text[:begin] + text[text.index('---- ', begin + 1):])
+        log_parser = LogParser(file_path)
+        stats = ResourceUsageStats(*log_parser.parseLogFile(), schedstat_list=log_parser.parseSchedstatTable())
+        columns = dict(stats.getColumns())
+        records = np.load(stats.export(os.path.join(self.temp_dir, 'stats.npy')))
+        self.assertEqual(2, len(records))
+        self.assertEqual([False, True], records['schedstat_found'].tolist())
+        self.assertEqual([[0.0] * 8, columns['per_core_wait'][0].tolist()], records['per_core_wait'].tolist())
+        with open(stats.export(os.path.join(self.temp_dir, 'stats.jsonl')), 'r') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(2, len(lines))
+        self.assertNotIn('latency', lines[0])
+        self.assertEqual(columns['latency'][0], lines[1]['latency'])
+        self.assertEqual(columns['per_core_latency'][0].tolist(), lines[1]['per_core_latency'])
+
+    def test_columnar_formats(self):
+        self.assertRaises(Exception, self.stats.export, os.path.join(self.temp_dir, 'stats.txt'))
+        columns = dict(self.stats.getColumns())
+        self.assertEqual((2, 8), columns['per_core_irq'].shape)
+        self.assertEqual((3, 30), columns['meminfo'].shape)
+        archive = np.load(self.stats.export(os.path.join(self.temp_dir, 'stats.npz')))
+        self.assertEqual(columns['per_core_user'].tolist(), archive['per_core_user'].tolist())
+        self.assertEqual(list(columns['meminfo_keys']), list(archive['meminfo_keys']))
+        records = np.load(self.stats.export(os.path.join(self.temp_dir, 'stats.npy')))
+        self.assertEqual(2, len(records))
+        self.assertEqual(columns['per_core_sys'].tolist(), records['per_core_sys'].tolist())
+        self.assertEqual(columns['mem_used'][1:].tolist(), records['mem_used'].tolist())
+        self.assertEqual(columns['meminfo'][1:, 0].tolist(), records['meminfo'][columns['meminfo_keys'][0]].tolist())
+        with open(self.stats.export(os.path.join(self.temp_dir, 'stats.jsonl')), 'r') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(2, len(lines))
+        self.assertEqual(records['overall_irq'].tolist(), [line['overall_irq'] for line in lines])
+        self.assertEqual(records['per_core_user_sys'][1].tolist(), lines[1]['per_core_user_sys'])
+        self.assertEqual(int(columns['meminfo'][2, 0]), lines[1]['meminfo'][columns['meminfo_keys'][0]])
+
+
+class TestProcStatTable(unittest.TestCase):
+
+    def setUp(self):
+        self.cpu_stats_list, self.mem_stats_list = LogParser(SAMPLE_FILE).parseLogFile()
+
+    def test_parser_fills_tables(self):
+        self.assertIsInstance(self.cpu_stats_list, ProcStatTable)
+        self.assertIsInstance(self.mem_stats_list, ProcMeminfoTable)
+        self.assertEqual((3, 9), self.cpu_stats_list.counters['user'].shape)
+        self.assertEqual([2, 3, 4], self.cpu_stats_list.counters['user'][:, 1].tolist())
+        self.assertEqual(5806740, self.mem_stats_list.getColumn('MemTotal')[0])
+
+    def test_rows_round_trip_as_data(self):
+        stat = self.cpu_stats_list[-1]
+        self.assertEqual(self.cpu_stats_list[2].data, stat.data)
+        self.assertEqual({'user': 4, 'nice': 4, 'system': 4, 'idle': 4, 'iowait': 4, 'irq': 4, 'softirq': 4,
+                          'steal': 0},
+                         stat.data['cpu7'])
+        table = ProcStatTable.fromDataList([self.cpu_stats_list[i] for i in xrange(3)])
+        self.assertEqual(self.cpu_stats_list.counters['softirq'].tolist(), table.counters['softirq'].tolist())
+        self.assertEqual(self.mem_stats_list[1].data,
+                         ProcMeminfoTable.fromDataList(list(self.mem_stats_list))[1].data)
+
+    def test_offline_core_reports_zero(self):
+        stats = [self.cpu_stats_list[i] for i in xrange(3)]
+        del stats[1].data['cpu3']
+        percentages = CpuStats(stats).getUserPercentages()
+        self.assertEqual([0.0, 0.0], percentages[:, 4].tolist())
+        self.assertEqual(CpuStats(stats).getUserPercentage(stats[1], stats[2], 'cpu3'), percentages[1, 4])
+        self.assertNotEqual(0.0, percentages[1, 5])
+
+
+
+class TestResample(unittest.TestCase):
+
+    def setUp(self):
+        self.cpu_stats_list = []
+        self.mem_stats_list = []
+        for seconds, user, used in ((0, 0, 100), (10, 500, 200), (50, 900, 600), (70, 1100, 50)):
+            date = datetime(2018, 4, 5, 22, 52, 0) + timedelta(seconds=seconds)
+            stat = ProcStatData(date)
+            counters = {'user': user, 'nice': 0, 'system': 0, 'idle': 100 * seconds - user, 'iowait': 0, 'irq': 0,
+                        'softirq': 0, 'steal': 0}
+            stat.data = {'cpu': counters, 'cpu0': counters}
+            self.cpu_stats_list.append(stat)
+            meminfo = ProcMeminfoData(date)
+            meminfo.data = {'MemTotal': 1000, 'MemFree': 1000 - used, 'Cached': 0}
+            self.mem_stats_list.append(meminfo)
+
+    def test_buckets_use_jiffies(self):
+        reduction = ResampledReduction(self.cpu_stats_list, self.mem_stats_list, 60)
+        self.assertEqual([toDate(t) for t in reduction.timestamps],
+                         [datetime(2018, 4, 5, 22, 52, 0), datetime(2018, 4, 5, 22, 53, 0)])
+        self.assertEqual([18.0, 10.0], reduction.overall_user.tolist())
+        self.assertEqual([[18.0], [10.0]], reduction.per_core_user.tolist())
+        self.assertEqual([10.0, 10.0], reduction.minimums['overall_user'].tolist())
+        self.assertEqual([50.0, 10.0], reduction.maximums['overall_user'].tolist())
+        self.assertEqual([300.0, 50.0], reduction.mem_used.tolist())
+        self.assertEqual([100, 50], reduction.minimums['mem_used'].tolist())
+        self.assertEqual([600, 50], reduction.maximums['mem_used'].tolist())
+
+    def test_summary_and_exports(self):
+        stats = ResourceUsageStats(self.cpu_stats_list, self.mem_stats_list, resample=60)
+        metrics = stats.getMetrics()
+        self.assertEqual(14.0, metrics['overall_user_avg'])
+        self.assertEqual(18.0, metrics['overall_user_max'])
+        columns = dict(stats.getColumns())
+        self.assertEqual([50.0, 10.0], columns['overall_user_max'].tolist())
+        self.assertEqual([700.0, 950.0], columns['meminfo'][:, list(columns['meminfo_keys']).index('MemFree')].tolist())
+        temp_dir = tempfile.mkdtemp()
+        try:
+            with open(stats.exportCSV(os.path.join(temp_dir, 'stats.csv')), 'r') as f:
+                lines = f.read().splitlines()
+        finally:
+            shutil.rmtree(temp_dir)
+        self.assertEqual(['time,overall cpu,cpu0,overall cpu min,overall cpu max,mem,mem min,mem max',
+                          '18/04/05-22:52:00,18.0,18.0,10.0,50.0,300.0,100,600',
+                          '18/04/05-22:53:00,10.0,10.0,10.0,10.0,50.0,50,50'], lines)
+        self.assertRaises(Exception, ResourceUsageStats, self.cpu_stats_list, self.mem_stats_list, [], 60)
+
+    def test_parse_duration(self):
+        self.assertEqual(60, parseDuration('1m'))
+        self.assertEqual(90, parseDuration('1.5m'))
+        self.assertEqual(7200, parseDuration('2h'))
+        self.assertEqual(30, parseDuration('30'))
+        self.assertRaises(Exception, parseDuration, '1w')
+        self.assertRaises(Exception, parseDuration, '0s')
+
+
+class TestWindowIndex(unittest.TestCase):
+
+    def test_sparse_table_matches_brute_force(self):
+        rng = random.Random(3)
+        values = np.array([rng.uniform(0, 100) for _ in xrange(700)])
+        minimums = SparseTable(values, np.minimum)
+        maximums = SparseTable(values, np.maximum)
+        for _ in xrange(300):
+            begin = rng.randint(0, len(values) - 1)
+            end = rng.randint(begin + 1, len(values))
+            self.assertEqual(values[begin:end].min(), minimums.query(begin, end))
+            self.assertEqual(values[begin:end].max(), maximums.query(begin, end))
+
+    def test_windows_match_separate_parses(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(temp_dir, 'resource_stats')
+            scaleSample(file_path, 100)
+            log_parser = LogParser(file_path)
+            window_index = WindowIndex(*log_parser.parseLogFile())
+            for start, end in ((0, -1), (3, -1), (10, 250), (299, 600), (500, 700), (-5, 40)):
+                expect = ResourceUsageStats(*log_parser.parseLogFile(start, end)).getMetrics()
+                actual = window_index.getMetrics(start, end)
+                self.assertEqual(sorted(expect), sorted(actual))
+                for key in expect:
+                    self.assertAlmostEqual(expect[key], actual[key], 9, key)
+            self.assertRaises(Exception, window_index.getMetrics, 5000, 6000)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_unsorted_log(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(temp_dir, 'resource_stats')
+            scaleSample(file_path, 20)
+            with open(file_path, 'r') as f:
+                text = f.read()
+            with open(file_path, 'w') as f:
+                f.write(text.replace(' 22:53:', ' 22:52:'))
+            log_parser = LogParser(file_path)
+            window_index = WindowIndex(*log_parser.parseLogFile())
+            self.assertIsNotNone(window_index.tables)
+            for start, end in ((0, -1), (10, 40)):
+                expect = ResourceUsageStats(*log_parser.parseLogFile(start, end)).getMetrics()
+                actual = window_index.getMetrics(start, end)
+                self.assertEqual(sorted(expect), sorted(actual))
+                for key in expect:
+                    self.assertAlmostEqual(expect[key], actual[key], 9, key)
+            self.assertRaises(Exception, window_index.getMetrics, 5000, 6000)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def test_sample_summary(self):
+        window_index = WindowIndex(*LogParser(SAMPLE_FILE).parseLogFile())
+        self.assertEqual(SAMPLE_SUMMARY, window_index.getSummary(0, -1))
+
+    def test_parse_windows(self):
+        self.assertEqual([(None, 0, 60), ('steady', 60, -1)], parseWindows('0:60, steady=60:-1'))
+        self.assertRaises(Exception, parseWindows, '0-60')
+        temp_dir = tempfile.mkdtemp()
+        try:
+            file_path = os.path.join(temp_dir, 'phases')
+            with open(file_path, 'w') as f:
+                f.write('# phase start [end]\nboot 0\n\nlaunch 30 45\nidle 60\n')
+            self.assertEqual([('boot', 0, 30), ('launch', 30, 45), ('idle', 60, -1)], parseWindows(file_path))
+        finally:
+            shutil.rmtree(temp_dir)
+
+
+class TestSpikeAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.cpu_stats_list = []
+        self.mem_stats_list = []
+        user = 0
+        for i, percent in enumerate([None, 10, 10, 90, 95, 90, 10, 10, 99, 10] + [10] * 30 + [70]):
+            date = datetime(2018, 4, 5, 22, 52, 0) + timedelta(seconds=3 * i)
+            user += 3 * (percent or 0)
+            stat = ProcStatData(date)
+            counters = {'user': user, 'nice': 0, 'system': 0, 'idle': 300 * i - user, 'iowait': 0, 'irq': 0,
+                        'softirq': 0, 'steal': 0}
+            stat.data = {'cpu': counters, 'cpu0': counters}
+            self.cpu_stats_list.append(stat)
+            meminfo = ProcMeminfoData(date)
+            meminfo.data = {'MemTotal': 100000, 'MemFree': 100000 - 1000 - 100 * i, 'Cached': 0}
+            self.mem_stats_list.append(meminfo)
+        self.start = toTimestamp(datetime(2018, 4, 5, 22, 52, 0))
+
+    def test_episodes(self):
+        stats = ResourceUsageStats(self.cpu_stats_list, self.mem_stats_list)
+        analysis = stats.getSpikeAnalysis([('overall_user_sys', 80, 6), ('per_core_user_sys', 95, 0)])
+        episodes = analysis.getEpisodes()
+        self.assertEqual([('overall_user_sys', None, 6.0, 15.0, 9.0, 95.0), ('per_core_user_sys', 0, 9.0, 12.0, 3.0, 95.0),
+                          ('per_core_user_sys', 0, 21.0, 24.0, 3.0, 99.0)],
+                         [(e['series'], e['core'], e['start'] - self.start, e['end'] - self.start, e['duration'],
+                           e['peak']) for e in episodes])
+        self.assertAlmostEqual(275.0 / 3, episodes[0]['mean'])
+        self.assertAlmostEqual(120000.0, analysis.getMemoryGrowth())
+        self.assertRaises(Exception, ResourceUsageStats(self.cpu_stats_list, self.mem_stats_list,
+                                                        resample=60).getSpikeAnalysis)
+
+    def test_anomalies(self):
+        analysis = ResourceUsageStats(self.cpu_stats_list, self.mem_stats_list).getSpikeAnalysis(zscore_window=5)
+        anomalies = [a for a in analysis.getAnomalies() if a['series'] == 'overall_user_sys']
+        self.assertEqual([120.0], [a['end'] - self.start for a in anomalies])
+        self.assertEqual(70.0, anomalies[0]['value'])
+        self.assertEqual(float('inf'), anomalies[0]['zscore'])
+        report = analysis.format()
+        self.assertIn('Spikes of overall_user_sys >= 80% for 9s or more: 1', report)
+        self.assertIn('  18/04/05-22:52:06 - 18/04/05-22:52:15 (9s): peak 95.0, mean 91.7', report)
+        self.assertIn('Memory in use growth: +120000.0 KiB/hour', report)
+
+    def test_rolling_zscores_match_brute_force(self):
+        rng = np.random.RandomState(5)
+        values = np.concatenate((rng.normal(2e6, 50, 300), np.full(30, 2e6)))
+        zscores = computeRollingZScores(values, 12)
+        self.assertTrue(np.isnan(zscores[:12]).all())
+        for i in xrange(12, 300):
+            previous = values[i - 12:i]
+            self.assertAlmostEqual((values[i] - previous.mean()) / previous.std(), zscores[i], 5)
+        self.assertEqual([0.0] * 18, zscores[312:].tolist())
+
+    def test_helpers(self):
+        begins, ends = findRuns(np.array([True, True, False, True, False, False, True]))
+        self.assertEqual([(0, 2), (3, 4), (6, 7)], zip(begins.tolist(), ends.tolist()))
+        timestamps = np.arange(0, 7200, 60.0)
+        values = 5 * timestamps / 3600 + np.sin(timestamps)
+        self.assertAlmostEqual(np.polyfit(timestamps / 3600, values, 1)[0], computeGrowthSlope(timestamps, values))
+        self.assertEqual(0.0, computeGrowthSlope(np.array([5.0]), np.array([1.0])))
+        self.assertEqual(('mem_used', 3000.0, 0), parseSpikeRule('mem_used:3000:0'))
+        self.assertEqual(('overall_user', 50.0, 60), parseSpikeRule('overall_user:50:1m'))
+        self.assertRaises(Exception, parseSpikeRule, 'cpu:50:1m')
+
+
+class TestStreamingStatsReducer(unittest.TestCase):
+
+    def _reduce(self, chunk_size, start=0, end=-1):
+        reducer = StreamingStatsReducer(chunk_size)
+        for sample in LogParser(SAMPLE_FILE).iterSamples(start, end):
+            reducer.addSample(sample)
+        return reducer
+
+    def test_summary_matches_in_memory_reduction(self):
+        for chunk_size in (2, 3, 4096):
+            reducer = self._reduce(chunk_size)
+            self.assertEqual(SAMPLE_SUMMARY, reducer.getSummary(0, -1))
+            self.assertEqual(2, reducer.getCpuStatsCount())
+            self.assertEqual(3, reducer.getMemStatsCount())
+
+    def test_window_matches_in_memory_reduction(self):
+        cpu_stats_list, mem_stats_list = LogParser(SAMPLE_FILE).parseLogFile(3)
+        expect = ResourceUsageStats(cpu_stats_list, mem_stats_list).getMetrics()
+        self.assertEqual(expect, self._reduce(2, 3).getMetrics())
+
+    def test_per_core_accumulators(self):
+        reducer = self._reduce(2)
+        stats = reducer.running_stats['per_core_user']
+        self.assertEqual(8, len(stats.min))
+        self.assertEqual(2, stats.count)
+
+
+
+class TestLogIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        shutil.copy(SAMPLE_FILE, self.file_path)
+        self.log_parser = LogParser(self.file_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_offsets_point_at_sections(self):
+        index = self.log_parser.buildIndex()
+        self.assertEqual(3, len(index))
+        self.assertEqual(0, index.header_offsets[0])
+        with open(self.file_path, 'r') as f:
+            for offsets, marker in ((index.header_offsets, '-------- '),
+                                    (index.stat_offsets, '---- /proc/stat'),
+                                    (index.meminfo_offsets, '---- /proc/meminfo')):
+                for offset in offsets:
+                    f.seek(offset)
+                    self.assertTrue(f.readline().startswith(marker))
+
+    def test_indexed_windows_match_full_scan(self):
+        index = self.log_parser.buildIndex()
+        for start, end in ((0, -1), (3, -1), (0, 4), (3, 4), (4, 7), (8, -1)):
+            expect_cpu, expect_mem = self.log_parser.parseLogFile(start, end)
+            cpu, mem = self.log_parser.parseLogFile(start, end, index)
+            self.assertEqual(expect_cpu.timestamps.tolist(), cpu.timestamps.tolist())
+            self.assertEqual(expect_cpu.counters['system'].tolist(), cpu.counters['system'].tolist())
+            self.assertEqual(expect_mem.timestamps.tolist(), mem.timestamps.tolist())
+            self.assertEqual([m.data for m in expect_mem], [m.data for m in mem])
+
+    def test_find_range(self):
+        index = self.log_parser.buildIndex()
+        self.assertEqual((0, 3), index.findRange(0, -1))
+        self.assertEqual((1, 2), index.findRange(1, 7))
+        self.assertEqual((2, 2), index.findRange(5, 6))
+
+    def test_saved_index_is_reused_until_log_changes(self):
+        index = self.log_parser.getIndex()
+        self.assertTrue(os.path.exists(LogIndex.getIndexPath(self.file_path)))
+        self.assertEqual(index.stat_offsets, LogIndex.load(self.file_path).stat_offsets)
+        with open(self.file_path, 'a') as f:
+            f.write('-------- Thu Apr 5 22:52:39 GMT 2018 --------\n')
+        self.assertIsNone(LogIndex.load(self.file_path))
+        self.assertEqual(4, len(self.log_parser.getIndex()))
+
+    def test_window_applies_to_meminfo(self):
+        cpu_stats_list, mem_stats_list = self.log_parser.parseLogFile(3)
+        self.assertEqual(2, len(cpu_stats_list))
+        self.assertEqual(2, len(mem_stats_list))
+
+
+
+class TestParallelParsing(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        scaleSample(self.file_path, 10)
+        self.log_parser = LogParser(self.file_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def assertTablesEqual(self, expect, actual):
+        expect_cpu, expect_mem = expect
+        cpu, mem = actual
+        self.assertEqual(expect_cpu.timestamps.tolist(), cpu.timestamps.tolist())
+        for name in expect_cpu.CPU_COUNTERS:
+            self.assertEqual(expect_cpu.counters[name].tolist(), cpu.counters[name].tolist())
+        self.assertEqual(expect_cpu.present.tolist(), cpu.present.tolist())
+        self.assertEqual([m.data for m in expect_mem], [m.data for m in mem])
+
+    def test_parallel_matches_single_process(self):
+        for start, end in ((0, -1), (10, 50), (80, -1)):
+            expect = self.log_parser.parseLogFile(start, end)
+            for jobs in (2, 7):
+                self.assertTablesEqual(expect, self.log_parser.parseLogFile(start, end, jobs=jobs))
+            index = self.log_parser.buildIndex()
+            self.assertTablesEqual(expect, self.log_parser.parseLogFile(start, end, index, 4))
+
+    def test_byte_ranges_start_at_headers(self):
+        ranges = self.log_parser._getByteRanges(4, None, 0, -1)
+        self.assertEqual(4, len(ranges))
+        self.assertEqual(0, ranges[0][0])
+        self.assertEqual(os.path.getsize(self.file_path), ranges[-1][1])
+        header_offsets = self.log_parser.buildIndex().header_offsets
+        for begin, stop in ranges:
+            self.assertIn(begin, header_offsets)
+
+    def test_summary_across_range_boundaries(self):
+        expect = ResourceUsageStats(*self.log_parser.parseLogFile()).getSummary(0, -1)
+        actual = ResourceUsageStats(*self.log_parser.parseLogFile(jobs=3)).getSummary(0, -1)
         self.assertEqual(expect, actual)
-        
-    
+
+
+
+class TestSampleCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        scaleSample(os.path.join(self.temp_dir, 'full'), 10)
+        with open(os.path.join(self.temp_dir, 'full'), 'r') as f:
+            self.text = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def writeLog(self, length):
+        with open(self.file_path, 'w') as f:
+            f.write(self.text[:length])
+        os.utime(self.file_path, (length, length))
+
+    def assertMatchesFullParse(self, log_parser, start=0, end=-1):
+        expect_cpu, expect_mem = LogParser(self.file_path).parseLogFile(start, end)
+        cpu, mem = log_parser.parseCachedLogFile(start, end)
+        self.assertEqual(expect_cpu.timestamps.tolist(), cpu.timestamps.tolist())
+        self.assertEqual(expect_cpu.counters['user'].tolist(), cpu.counters['user'].tolist())
+        self.assertEqual(expect_cpu.present.tolist(), cpu.present.tolist())
+        self.assertEqual([m.data for m in expect_mem], [m.data for m in mem])
+
+    def test_cache_is_saved_and_reused(self):
+        self.writeLog(len(self.text))
+        log_parser = LogParser(self.file_path)
+        self.assertMatchesFullParse(log_parser)
+        cache = SampleCache.load(self.file_path)
+        self.assertTrue(cache.isCurrent(os.stat(self.file_path)))
+        self.assertEqual(self.text.rindex('\n-------- Thu') + 1, cache.resume_offset)
+        for start, end in ((0, -1), (20, 40), (60, -1)):
+            self.assertMatchesFullParse(log_parser, start, end)
+
+    def test_appended_log_parses_only_new_bytes(self):
+        parsed_ranges = []
+        log_parser = LogParser(self.file_path)
+        parse = log_parser._parseBytes
+        log_parser._parseBytes = lambda begin, stop, origin, jobs, previous_date=None: \
+            parsed_ranges.append((begin, stop)) or parse(begin, stop, origin, jobs, previous_date)
+        self.writeLog(len(self.text) // 3 + 100)
+        self.assertMatchesFullParse(log_parser)
+        resume_offset = SampleCache.load(self.file_path).resume_offset
+        self.writeLog(len(self.text))
+        self.assertMatchesFullParse(log_parser, 10)
+        self.assertEqual(resume_offset, parsed_ranges[-1][0])
+        self.assertEqual((0, resume_offset), parsed_ranges[0])
+
+    def test_rewritten_log_is_parsed_again(self):
+        self.writeLog(len(self.text) // 2)
+        log_parser = LogParser(self.file_path)
+        log_parser.parseCachedLogFile()
+        self.text = self.text.replace('MemFree:  ', 'MemFree:  1')
+        self.writeLog(len(self.text))
+        self.assertMatchesFullParse(log_parser)
+
+
+class TestCompressedLogs(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        scaleSample(self.file_path, 30)
+        with open(self.file_path, 'rb') as f:
+            self.text = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def compress(self, compression, parts=1):
+        file_path = self.file_path + '.' + compression
+        middle = self.text.index('--------', len(self.text) // 2)
+        pieces = [self.text] if parts == 1 else [self.text[:middle], self.text[middle:]]
+        for i, piece in enumerate(pieces):
+            f = openCompressedFile(file_path, compression, 'ab' if i and compression == 'gzip' else 'wb')
+            f.write(piece)
+            f.close()
+        return file_path
+
+    def test_compressed_logs_match_plain_log(self):
+        expect = ResourceUsageStats(*LogParser(self.file_path).parseLogFile(10, 200)).getMetrics()
+        self.assertIsNone(getLogCompression(self.file_path))
+        for compression in ('gzip', 'bz2'):
+            file_path = self.compress(compression)
+            self.assertEqual(compression, getLogCompression(file_path))
+            log_parser = LogParser(file_path)
+            self.assertEqual(expect, ResourceUsageStats(*log_parser.parseLogFile(10, 200, jobs=4)).getMetrics())
+            self.assertEqual(expect, ResourceUsageStats(*log_parser.parseCachedLogFile(10, 200)).getMetrics())
+            self.assertEqual(expect, ResourceUsageStats(*log_parser.parseCachedLogFile(10, 200)).getMetrics())
+            self.assertEqual(len(LogParser(self.file_path).parseTopTable().processes),
+                             len(log_parser.parseTopTable().processes))
+            self.assertRaises(Exception, log_parser.buildIndex)
+
+    def test_concatenated_and_truncated_streams(self):
+        cpu_stats_list, _ = LogParser(self.file_path).parseLogFile()
+        file_path = self.compress('gzip', parts=2)
+        cpu, _ = LogParser(file_path).parseLogFile()
+        self.assertEqual(cpu_stats_list.timestamps.tolist(), cpu.timestamps.tolist())
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        with open(file_path, 'wb') as f:
+            f.write(data[:len(data) // 3])
+        cpu, _ = LogParser(file_path).parseLogFile()
+        self.assertGreater(len(cpu), 0)
+        self.assertEqual(cpu_stats_list.timestamps[:len(cpu)].tolist(), cpu.timestamps.tolist())
+
+
+class TestUptimeClock(unittest.TestCase):
+
+    ORIGIN = datetime(2018, 4, 5, 22, 52, 0)
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        self.writeLog([1000 + 3600.5 * i for i in xrange(30)])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def writeLog(self, uptimes, header_seconds=None):
+        if header_seconds is None:
+            header_seconds = [int(uptime - uptimes[0]) for uptime in uptimes]
+        with open(self.file_path, 'w') as f:
+            for i, uptime in enumerate(uptimes):
+                date = self.ORIGIN + timedelta(seconds=header_seconds[i])
+                f.write('-------- {0} --------\n'.format(date.strftime('%a %b %d %H:%M:%S GMT %Y')))
+                if uptime is not None:
+                    f.write('---- /proc/uptime\n{0:.2f} 1234.56\n'.format(uptime))
+                f.write('---- /proc/meminfo\nMemTotal: 1000 kB\nMemFree: {0} kB\nCached: 0 kB\n'.format(i))
+                f.write('---- /proc/stat\n')
+                for cpu_id in ('cpu', 'cpu0'):
+                    f.write('{0} {1} 0 0 {2} 0 0 0 0 0 0\n'.format(cpu_id, 10 * i, 90 * i))
+
+    def test_dates_are_refined(self):
+        clock = UptimeClock((self.ORIGIN, 1000.0))
+        self.assertEqual(self.ORIGIN + timedelta(seconds=2.25),
+                         clock.getDate(self.ORIGIN + timedelta(seconds=2), 1002.25))
+        rebooted = self.ORIGIN + timedelta(hours=1)
+        self.assertEqual(rebooted, clock.getDate(rebooted, 12.0))
+        self.assertEqual(rebooted, clock.getDate(rebooted, 1000.0 + 3600 + UptimeClock.MAX_SKEW + 1))
+        self.assertEqual(rebooted, UptimeClock().getDate(rebooted, 1002.25))
+        cpu_stats_list, mem_stats_list = LogParser(self.file_path).parseLogFile()
+        expect = [toTimestamp(self.ORIGIN) + 3600.5 * i for i in xrange(30)]
+        self.assertEqual(expect, cpu_stats_list.timestamps.tolist())
+        self.assertEqual(expect, mem_stats_list.timestamps.tolist())
+        self.assertEqual(expect, LogParser(self.file_path).buildIndex().timestamps)
+
+    def test_windows_past_a_day(self):
+        log_parser = LogParser(self.file_path)
+        expect_cpu, expect_mem = log_parser.parseLogFile(86400, 100000)
+        self.assertEqual([toTimestamp(self.ORIGIN) + 3600.5 * i for i in xrange(24, 28)],
+                         expect_cpu.timestamps.tolist())
+        index = log_parser.buildIndex()
+        for cpu, mem in (log_parser.parseLogFile(86400, 100000, index),
+                         log_parser.parseLogFile(86400, 100000, jobs=2),
+                         log_parser.parseCachedLogFile(86400, 100000)):
+            self.assertEqual(expect_cpu.timestamps.tolist(), cpu.timestamps.tolist())
+            self.assertEqual(expect_mem.getColumn('MemFree').tolist(), mem.getColumn('MemFree').tolist())
+        window_index = WindowIndex(*log_parser.parseLogFile())
+        self.assertEqual(ResourceUsageStats(expect_cpu, expect_mem).getSummary(86400, 100000),
+                         window_index.getSummary(86400, 100000))
+
+    def test_sub_second_dates_are_formatted(self):
+        self.writeLog([1000 + 0.5 * i for i in xrange(6)])
+        stats = ResourceUsageStats(*LogParser(self.file_path).parseLogFile())
+        file_path = stats.exportCSV(os.path.join(self.temp_dir, 'stats.csv'))
+        with open(file_path, 'r') as f:
+            times = [line.split(',')[0] for line in f.read().splitlines()[1:]]
+        self.assertEqual(['18/04/05-22:52:0{0}.{1}00'.format(i // 2, 5 * (i % 2)) for i in xrange(1, 6)], times)
+        spikes = stats.getSpikeAnalysis([parseSpikeRule('overall_user_sys:5:1')]).format()
+        self.assertIn('  18/04/05-22:52:00.000 - 18/04/05-22:52:02.500 (2.5s)', spikes)
+
+    def test_missing_uptime_does_not_go_back(self):
+        uptimes = [1000 + 0.2 * i for i in xrange(12)]
+        uptimes[7] = None
+        self.writeLog(uptimes, [int(0.1 + 0.2 * i) for i in xrange(12)])
+        expect = [round(0.2 * i, 3) for i in xrange(12)]
+        expect[7] = expect[6]
+        log_parser = LogParser(self.file_path)
+        origin = toTimestamp(self.ORIGIN)
+        index = log_parser.buildIndex()
+        self.assertEqual(expect, [round(timestamp - origin, 3) for timestamp in index.timestamps])
+        self.assertTrue(index.isSorted())
+        split = index.header_offsets[7]
+        for cpu_stats_list, mem_stats_list in (
+                log_parser.parseLogFile(), log_parser.parseCachedLogFile(),
+                log_parser._parseByteRangesInParallel([(0, split), (split, -1)], 0, -1, self.ORIGIN, 2)):
+            self.assertEqual(expect, [round(timestamp - origin, 3) for timestamp in cpu_stats_list.timestamps])
+            self.assertEqual(expect, [round(timestamp - origin, 3) for timestamp in mem_stats_list.timestamps])
+        cpu_stats_list, _ = log_parser.parseByteRange(split, -1, origin=self.ORIGIN,
+                                                      previous_date=toDate(origin + expect[6]))
+        self.assertEqual(expect[6], round(cpu_stats_list.timestamps[0] - origin, 3))
+
+    def test_header_dates_after_reboot(self):
+        self.writeLog([1000.0, 1003.5, 2.25, 5.75], [0, 3, 40, 43])
+        cpu_stats_list, _ = LogParser(self.file_path).parseLogFile()
+        origin = toTimestamp(self.ORIGIN)
+        self.assertEqual([origin, origin + 3.5, origin + 40, origin + 43], cpu_stats_list.timestamps.tolist())
+
+
+class TestRollingWindowStats(unittest.TestCase):
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        window = RollingWindowStats(60)
+        values = []
+        timestamp = 0
+        for _ in xrange(500):
+            timestamp += rng.choice((1, 3, 3, 10))
+            value = rng.uniform(0, 100)
+            window.add(timestamp, value)
+            values.append((timestamp, value))
+            expect = [v for t, v in values if t > timestamp - 60]
+            self.assertEqual(len(expect), len(window))
+            self.assertEqual(min(expect), window.getMin())
+            self.assertEqual(max(expect), window.getMax())
+            self.assertAlmostEqual(sum(expect) / len(expect), window.getAvg())
+
+
+class TestLogFollower(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.file_path = os.path.join(self.temp_dir, 'resource_stats')
+        scaleSample(os.path.join(self.temp_dir, 'full'), 40)
+        with open(os.path.join(self.temp_dir, 'full'), 'r') as f:
+            self.text = f.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_follows_appended_samples(self):
+        open(self.file_path, 'w').close()
+        follower = LogFollower(self.file_path)
+        self.assertEqual(0, follower.poll())
+        written = 0
+        for length in (len(self.text) // 7, len(self.text) // 2 + 11, len(self.text)):
+            with open(self.file_path, 'a') as f:
+                f.write(self.text[written:length])
+            written = length
+            follower.poll()
+            self.assertEqual(follower.log_parser.findLastHeaderOffset(length), follower.offset)
+        follower.poll(final=True)
+        cpu_stats_list, mem_stats_list = LogParser(self.file_path).parseLogFile()
+        expect = ResourceUsageStats(cpu_stats_list, mem_stats_list).getSummary(0, -1)
+        report = follower.getReport()
+        self.assertTrue(report.startswith(expect))
+        self.assertIn('Last 1 min - Overall CPU', report)
+        self.assertIn('Last 15 min - Memory in use', report)
+        self.assertEqual(20, len(follower.cpu_windows[0]))
+        self.assertEqual(len(cpu_stats_list) - 1, len(follower.cpu_windows[2]))
+
+
+class TestTokenizer(unittest.TestCase):
+
+    def test_proc_stat_falls_back_to_regexp(self):
+        stat = ProcStatData(None)
+        end = stat.parseText(StringIO('cpu  16 8 8 8 8 8 8 0 0 0\n'
+                                      'cpu0 2 1 1 1 1 1 1 0 0 0 trailing\n'
+                                      'cpu1 2 1 1 1 1 1 1 0 0\n'
+                                      'cpu2 2 1 x 1 1 1 1 0 0 0\n'
+                                      'cpufreq 2 1 1 1 1 1 1 0 0 0\n'
+                                      'intr 52849655 0 0\n'
+                                      '---- top\n'
+                                      'cpu3 2 1 1 1 1 1 1 0 0 0\n'))
+        self.assertEqual('---- top\n', end)
+        self.assertEqual(['cpu', 'cpu0'], sorted(stat.data))
+        self.assertEqual(16, stat.data['cpu']['user'])
+
+    def test_proc_meminfo_falls_back_to_regexp(self):
+        meminfo = ProcMeminfoData(None)
+        meminfo.parseText(StringIO('MemTotal:        5806740 kB\r\n'
+                                   'Active(anon):     667720 kB\n'
+                                   'HugePages_Total:       0\n'
+                                   'Cached:2995144 kB\n'
+                                   'MemFree:\t71816 kB\n'
+                                   '---- /proc/stat\n'))
+        self.assertEqual({'MemTotal': 5806740, 'MemFree': 71816}, meminfo.data)
+
+    def test_date_headers(self):
+        log_parser = LogParser(SAMPLE_FILE)
+        parse = log_parser._LogParser__parseDateText
+        self.assertEqual(datetime(2018, 4, 5, 22, 52, 29), parse('-------- Thu Apr 5 22:52:29 GMT 2018 --------\r\n'))
+        self.assertEqual(datetime(2018, 4, 5, 22, 52, 59), parse('-------- Thu Apr 5 22:52:59 GMT 2018 --------\n'))
+        self.assertEqual(datetime(2018, 4, 15, 3, 0, 1), parse('-------- Sun Apr  15 03:00:01 GMT 2018 --------\n'))
+        self.assertEqual(datetime(2018, 4, 5, 22, 52, 29), parse('x-------- Thu Apr 5 22:52:29 GMT 2018 --------\n'))
+
+
+class TestTopProcesses(unittest.TestCase):
+
+    def test_toybox_top(self):
+        top = TopData(None)
+        end = top.parseText(StringIO('Tasks: 532 total,   2 running, 491 sleeping,   0 stopped,   0 zombie\r\r\n'
+                                     '800%cpu  10%user   0%nice  23%sys 768%idle   0%iow   0%irq   0%sirq   0%host\r\n'
+                                     '  PID USER         PR  NI VIRT  RES  SHR S[%CPU] %MEM     TIME+ ARGS       \r\n'
+                                     ' 3672 shell        20   0  10M 2.2M 1.4M R 22.5   0.0   0:00.06 top -n 1 -b\r\n'
+                                     '  589 root         20   0    0    0    0 S  3.2   0.0   0:02.90 [kworker/u16:17]\r\n'
+                                     ' 3666 shell        20   0 8.6M 1.7M 1.2M S  0.0   0.0   0:00.03 sh -c echo ---- top\r\n'
+                                     '-------- Thu Apr 5 22:52:32 GMT 2018 --------\r\n'))
+        self.assertEqual('-------- Thu Apr 5 22:52:32 GMT 2018 --------\r\n', end)
+        self.assertEqual([(3672, 'shell', 'R', 22.5, 0.0, 2.2 * 1024, 'top -n 1 -b'),
+                          (589, 'root', 'S', 3.2, 0.0, 0.0, '[kworker/u16:17]'),
+                          (3666, 'shell', 'S', 0.0, 0.0, 1.7 * 1024, 'sh -c echo ---- top')], top.data)
+
+    def test_toolbox_top(self):
+        top = TopData(None)
+        top.parseText(StringIO('User 5%, System 3%, IOW 0%, IRQ 0%\n'
+                               '  PID PR CPU% S  #THR     VSS     RSS PCY UID      Name\n'
+                               ' 1205  2   6% S   150 2112544K 223744K  fg system   system_server\n'))
+        self.assertEqual(1, len(top.data))
+        pid, user, state, cpu, _, res, command = top.data[0]
+        self.assertEqual((1205, 'system', 'S', 6.0, 223744.0, 'system_server'), (pid, user, state, cpu, res, command))
+
+    def test_top_processes(self):
+        builder = TopTableBuilder()
+        for i in xrange(1000):
+            top = TopData(datetime(2018, 4, 5, 22, 0, 0) + timedelta(seconds=3 * i))
+            top.data = [(100, 'system', 'S', 5.0 + i % 2, 1.0, 2048.0, 'system_server'),
+                        (1000 + i, 'shell', 'R', float(i % 50), 0.0, 1024.0, 'top -n 1 -b')]
+            builder.append(top)
+        table = builder.build()
+        self.assertEqual(1001, len(table.processes))
+        stats = table.getProcessStats()
+        system_server = table.processes.index((100, 'system_server'))
+        self.assertEqual(1000, stats['count'][system_server])
+        self.assertEqual(5.5, stats['cpu_avg'][system_server])
+        self.assertEqual(6.0, stats['cpu_max'][system_server])
+        self.assertEqual([system_server], table.getTopProcesses(1, 'res_avg'))
+        self.assertEqual([(1049, 'top -n 1 -b'), (1099, 'top -n 1 -b')],
+                         sorted(table.processes[p] for p in table.getTopProcesses(2, 'cpu_max', stats))[:2])
+        timestamps, cpu, res = table.getSeries(system_server)
+        self.assertEqual(1000, len(timestamps))
+
+    def test_parse_top_table(self):
+        log_parser = LogParser(SAMPLE_FILE)
+        table = log_parser.parseTopTable()
+        self.assertEqual(3, len(set(table.timestamps.tolist())))
+        self.assertIn((1205, 'system_server'), table.processes)
+        self.assertEqual(1, len(set(log_parser.parseTopTable(3, 6).timestamps.tolist())))
+
+
+class TestSchedstat(unittest.TestCase):
+
+    def test_parse_schedstat(self):
+        schedstat = SchedstatData(None)
+        end = schedstat.parseText(StringIO('version 15\r\n'
+                                           'timestamp 4300965556\r\n'
+                                           'cpu0 3308979 0 22026491 5538180 15685565 5041083 1886626644290 1262756719810 '
+                                           '13775887\r\n'
+                                           'domain0 0f 1209 1058 78 107262 90 0 1 1057 15 12 0 2026 35 0 0 12 11912\r\n'
+                                           'cpu1 3864098 0 21588384 5252741 8820182 3205001 1817097598407 1118229752288 '
+                                           '12891326\r\n'
+                                           '---- /proc/meminfo\r\n'))
+        self.assertEqual('---- /proc/meminfo\r\n', end)
+        self.assertEqual({'cpu0': {'run_time': 1886626644290, 'wait_time': 1262756719810, 'timeslices': 13775887},
+                          'cpu1': {'run_time': 1817097598407, 'wait_time': 1118229752288, 'timeslices': 12891326}},
+                         schedstat.data)
+
+    def test_schedstat_deltas(self):
+        samples = []
+        for i, (wait, timeslices) in enumerate(((0, 0), (4000000, 2), (4000000, 2))):
+            schedstat = SchedstatData(datetime(2018, 4, 5, 22, 52, 29) + timedelta(seconds=3 * i))
+            schedstat.data = {'cpu0': {'run_time': 0, 'wait_time': wait, 'timeslices': timeslices}}
+            if i != 1:
+                schedstat.data['cpu1'] = {'run_time': 0, 'wait_time': 2 * wait, 'timeslices': timeslices}
+            samples.append(schedstat)
+        stats = SchedstatStats(samples)
+        self.assertEqual([[4.0, 0.0], [0.0, 0.0]], stats.getWaitTimes().tolist())
+        self.assertEqual([[2.0, 0.0], [0.0, 0.0]], stats.getLatencies().tolist())
+
+    def test_schedstat_summary(self):
+        log_parser = LogParser(SAMPLE_FILE)
+        cpu_stats_list, mem_stats_list = log_parser.parseLogFile()
+        schedstat_list = log_parser.parseSchedstatTable()
+        self.assertEqual(3, len(schedstat_list))
+        self.assertEqual(8, schedstat_list.getCoreCount())
+        summary = ResourceUsageStats(cpu_stats_list, mem_stats_list, schedstat_list).getSummary(0, -1)
+        self.assertTrue(summary.startswith(SAMPLE_SUMMARY))
+        self.assertIn('Per CPU - run queue wait per interval (ms) max: 100.2', summary)
+        metrics = ResourceUsageStats(cpu_stats_list, mem_stats_list, schedstat_list).getMetrics()
+        self.assertAlmostEqual(100.210419, metrics['per_core_wait_max'])
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def setUp(self):
+        random.seed(7)
+        self.values = [random.expovariate(0.1) for _ in xrange(20000)] + [0.0] * 500
+
+    def assertQuantilesClose(self, sketch, values):
+        values = sorted(values)
+        for quantile in (0.0, 0.5, 0.9, 0.95, 0.99, 1.0):
+            expect = values[int(quantile * (len(values) - 1))]
+            self.assertLessEqual(abs(sketch.getQuantile(quantile) - expect), 0.01 * expect + 1e-9)
+
+    def test_narrow_memory_range(self):
+        values = [2926.8 * 1024 + random.triangular(0, 2.9 * 1024, 2.5 * 1024) for _ in xrange(5000)]
+        sketch = createQuantileSketch('mem_used')
+        sketch.update(values[:2500])
+        other = createQuantileSketch('mem_used')
+        other.update(values[2500:])
+        sketch.merge(other)
+        values = sorted(values)
+        for quantile in (0.0, 0.5, 0.9, 0.95, 0.99, 1.0):
+            expect = values[int(quantile * (len(values) - 1))]
+            self.assertLessEqual(abs(sketch.getQuantile(quantile) - expect), 16)
+        self.assertEqual(10, np.count_nonzero(sketch.getHistogram(np.linspace(values[0], values[-1], 11))))
+        self.assertRaises(Exception, sketch.merge, QuantileSketch())
+
+    def test_relative_accuracy(self):
+        sketch = QuantileSketch()
+        sketch.update(self.values)
+        self.assertEqual(len(self.values), sketch.count)
+        self.assertQuantilesClose(sketch, self.values)
+
+    def test_merge_matches_single_sketch(self):
+        sketches = [QuantileSketch() for _ in xrange(3)]
+        for i, sketch in enumerate(sketches):
+            sketch.update(self.values[i::3])
+        sketches[0].merge(sketches[1])
+        sketches[0].merge(sketches[2])
+        single = QuantileSketch()
+        single.update(self.values)
+        self.assertEqual(single.buckets, sketches[0].buckets)
+        self.assertEqual(single.getQuantile(0.99), sketches[0].getQuantile(0.99))
+        self.assertRaises(Exception, single.merge, QuantileSketch(relative_accuracy=0.05))
+
+    def test_bounded_buckets(self):
+        sketch = QuantileSketch(max_buckets=64)
+        sketch.update(self.values)
+        self.assertLessEqual(len(sketch.buckets), 64)
+        self.assertLessEqual(abs(sketch.getQuantile(1.0) - max(self.values)), 0.01 * max(self.values))
+        self.assertEqual(len(self.values), sum(sketch.getHistogram([0, 10, 20, 1000])))
+
+    def test_percentile_summary(self):
+        cpu_stats_list, mem_stats_list = LogParser(SAMPLE_FILE).parseLogFile()
+        stats = ResourceUsageStats(cpu_stats_list, mem_stats_list)
+        summary = stats.getSummary(0, -1, 'sketch')
+        self.assertTrue(summary.startswith(SAMPLE_SUMMARY))
+        self.assertIn('Per CPU - user + sys p99: 71.4%', summary)
+        self.assertIn('Overall CPU - user + sys + irq histogram: 0.0-10.0: 0.0%', summary)
+        self.assertIn('60.0-70.0: 50.0%, 70.0-80.0: 50.0%', summary)
+        exact = stats.getMetrics(stats.getDistributions(exact=True))
+        sketch = stats.getMetrics(stats.getDistributions())
+        for key in ('overall_user_sys_p50', 'per_core_user_sys_p90', 'mem_used_p99'):
+            self.assertLessEqual(abs(sketch[key] - exact[key]), 0.01 * exact[key])
+        reducer = StreamingStatsReducer(2)
+        for sample in LogParser(SAMPLE_FILE).iterSamples():
+            reducer.addSample(sample)
+        self.assertEqual(summary, reducer.getSummary(0, -1, distribution=True))
+
+
+class TestPhaseProfiler(unittest.TestCase):
+
+    def test_phases_and_section_parts(self):
+        profiler = PhaseProfiler()
+        logged = []
+        profiler.addHook(logged.append)
+        log_parser = LogParser(SAMPLE_FILE, profiler)
+        with profiler.phase('parse', remainder='read') as timing:
+            cpu_stats_list, mem_stats_list = log_parser.parseLogFile()
+            timing.samples = len(cpu_stats_list) + len(mem_stats_list)
+        with profiler.phase('summarize'):
+            summary = ResourceUsageStats(cpu_stats_list, mem_stats_list).getSummary(0, -1)
+        self.assertEqual(SAMPLE_SUMMARY, summary)
+        self.assertEqual(['parse', 'summarize'], [timing.name for timing in logged])
+        parse = logged[0]
+        self.assertEqual(6, parse.samples)
+        self.assertEqual(['read', 'parse ProcMeminfoData', 'parse ProcStatData'], [name for name, _ in parse.parts])
+        self.assertAlmostEqual(parse.seconds, sum(seconds for _, seconds in parse.parts))
+        self.assertGreater(parse.peak_rss_kib, 0)
+        self.assertEqual([], logged[1].parts)
+        report = profiler.formatReport()
+        self.assertIn('samples/s, peak RSS', report)
+        self.assertIn('\n  parse ProcStatData: ', report)
+
+    def test_part_outside_phase_is_ignored(self):
+        profiler = PhaseProfiler()
+        with profiler.part('reduce'):
+            pass
+        self.assertEqual([], profiler.timings)
+
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()